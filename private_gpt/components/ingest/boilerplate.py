@@ -0,0 +1,145 @@
+"""Removal of the running headers, footers and page numbers of paged documents.
+
+Manuals repeat the same chapter title, chapter tab and page number at the top or
+bottom of (almost) every page. Embedded as is, these lines end up in every node of
+every page. This transformation removes them from the page text before the node
+parser splits it. The printed page label is kept in the `page_label` metadata.
+"""
+
+import logging
+import re
+from collections import defaultdict
+from typing import Any, cast
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.schema import (
+    BaseNode,
+    Document,
+    MetadataMode,
+    TransformComponent,
+)
+
+logger = logging.getLogger(__name__)
+
+_DIGITS = re.compile(r"\d+")
+
+# Metadata flag of the pages whose boilerplate was already removed (see `remove`)
+BOILERPLATE_REMOVED = "boilerplate_removed"
+
+
+def _line_key(line: str) -> str:
+    # Page numbers change from one page to the next, "4-11" and "4-12" are the
+    # same footer
+    return _DIGITS.sub("#", " ".join(line.split()))
+
+
+class BoilerplateRemover(TransformComponent):
+    """Remove the lines repeated on the edges of the pages of a document.
+
+    The pages (Documents) of a file are expected in the same call, as done by the
+    ingest components. A line found within the first or last `edge_lines` lines
+    of a page is boilerplate when it is found on the edges of at least
+    `min_consecutive_pages` consecutive pages (running header of a chapter), or
+    on the edges of at least `min_page_ratio` of the pages of the file.
+    """
+
+    edge_lines: int = Field(
+        default=3, description="Number of lines at the top and bottom of a page."
+    )
+    min_consecutive_pages: int = Field(
+        default=3, description="Repetitions on consecutive pages to be boilerplate."
+    )
+    min_page_ratio: float = Field(
+        default=0.5, description="Ratio of pages to repeat on to be boilerplate."
+    )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BoilerplateRemover"
+
+    def __call__(self, nodes: list[BaseNode], **kwargs: Any) -> list[BaseNode]:
+        result = list(nodes)
+        pages_by_file: dict[str, list[int]] = defaultdict(list)
+        for position, node in enumerate(nodes):
+            if BOILERPLATE_REMOVED in node.metadata:
+                page = node.copy()
+                page.metadata = {
+                    key: value
+                    for key, value in node.metadata.items()
+                    if key != BOILERPLATE_REMOVED
+                }
+                result[position] = page
+            elif isinstance(node, Document) and "file_name" in node.metadata:
+                pages_by_file[node.metadata["file_name"]].append(position)
+
+        for file_name, positions in pages_by_file.items():
+            if len(positions) < self.min_consecutive_pages:
+                continue
+            positions.sort(key=lambda p: nodes[p].metadata.get("page_index", p))
+            boilerplate = self._find_boilerplate([nodes[p] for p in positions])
+            if not boilerplate:
+                continue
+            logger.debug(
+                "Removing count=%s repeated lines from file_name=%s",
+                len(boilerplate),
+                file_name,
+            )
+            for position in positions:
+                # Copy, to keep the text of the ingested document untouched
+                page = nodes[position].copy()
+                page.set_content(
+                    self._strip(page.get_content(MetadataMode.NONE), boilerplate)
+                )
+                result[position] = page
+        return result
+
+    def remove(self, pages: list[Document]) -> list[Document]:
+        """Remove the boilerplate of the given pages now.
+
+        The pages are flagged not to be looked at again when transformed, so that
+        a subset of them (e.g. the changed pages of a file) can be ingested alone.
+        """
+        nodes: list[BaseNode] = list(pages)
+        result = []
+        for page in self(nodes):
+            flagged = cast(Document, page.copy())
+            flagged.metadata = {**page.metadata, BOILERPLATE_REMOVED: True}
+            result.append(flagged)
+        return result
+
+    def _edge_keys(self, text: str) -> set[str]:
+        lines = [line for line in text.splitlines() if line.strip()]
+        edges = lines[: self.edge_lines] + lines[-self.edge_lines :]
+        return {_line_key(line) for line in edges}
+
+    def _find_boilerplate(self, pages: list[BaseNode]) -> set[str]:
+        edge_keys = [
+            self._edge_keys(page.get_content(MetadataMode.NONE)) for page in pages
+        ]
+        page_count: dict[str, int] = defaultdict(int)
+        longest_run: dict[str, int] = defaultdict(int)
+        current_run: dict[str, int] = defaultdict(int)
+        for keys in edge_keys:
+            for key in list(current_run):
+                if key not in keys:
+                    del current_run[key]
+            for key in keys:
+                page_count[key] += 1
+                current_run[key] += 1
+                longest_run[key] = max(longest_run[key], current_run[key])
+        min_pages = self.min_page_ratio * len(pages)
+        return {
+            key
+            for key, count in page_count.items()
+            if count >= min_pages or longest_run[key] >= self.min_consecutive_pages
+        }
+
+    def _strip(self, text: str, boilerplate: set[str]) -> str:
+        lines = text.splitlines()
+        non_empty = [i for i, line in enumerate(lines) if line.strip()]
+        edges = set(non_empty[: self.edge_lines] + non_empty[-self.edge_lines :])
+        return "\n".join(
+            line
+            for i, line in enumerate(lines)
+            if i not in edges or _line_key(line) not in boilerplate
+        )
@@ -0,0 +1,464 @@
+"""Merge the identical and near-identical chunks of the ingested documents.
+
+Editions and model variants of the same manual share most of their text. Stored
+as is, every copy of a chunk takes a vector, and the copies crowd the top-k of
+the retrieval. The `ChunkDeduplicator` transformation, run after the node
+parser, drops the chunks that are (near-)identical to an already stored one, and
+records them as duplicates of the stored chunk: the stored vector then stands for
+all the documents containing the chunk (see `ChunkDuplicateIndex.duplicates`).
+
+The nodes of the files ingested at the same time (by other threads) are not
+stored yet when a file is deduplicated. They are merged once the nodes of the file
+are about to be stored (see `ChunkDuplicateIndex.merge_stored`).
+
+The similarity of two chunks is the Jaccard similarity of their sets of
+character shingles (working with text without spaces, e.g. Japanese), estimated
+with MinHash signatures. The candidate chunks are found with locality-sensitive
+hashing: the signature is cut into bands, and the chunks sharing a band are
+compared.
+
+The signatures, the duplicates, and the stored nodes holding the duplicates of
+each document are stored in dedicated collections of the docstore key-value
+store, so that they are persisted (and wiped) together with the docstore, like the
+page labels.
+"""
+
+import base64
+import logging
+import threading
+import zlib
+from collections import defaultdict
+from collections.abc import Collection
+from typing import Any
+
+import numpy as np
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.schema import BaseNode, MetadataMode, TransformComponent
+from llama_index.core.storage.docstore import BaseDocumentStore
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.docstore.types import RefDocInfo
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from llama_index.core.storage.kvstore import SimpleKVStore
+from llama_index.core.storage.kvstore.types import BaseKVStore
+
+logger = logging.getLogger(__name__)
+
+SIGNATURES_COLLECTION_SUFFIX = "/chunk_signatures"
+DUPLICATES_COLLECTION_SUFFIX = "/chunk_duplicates"
+DUPLICATE_REFS_COLLECTION_SUFFIX = "/chunk_duplicate_refs"
+
+NUM_PERM = 128  # Size of the MinHash signatures
+# 16 bands of 8 rows: chunks with a similarity above ~0.7 are likely candidates
+NUM_BANDS = 16
+SHINGLE_SIZE = 5  # Characters
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+# Permutations (a * hash + b) % prime, with a fixed seed: the signatures are
+# persisted. The products wrap around 64 bits, which only adds to the mixing.
+_rng = np.random.default_rng(20240501)
+_PERM_A = _rng.integers(1, _MERSENNE_PRIME, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _MERSENNE_PRIME, NUM_PERM, dtype=np.uint64)
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature (of `NUM_PERM` uint32) of the shingles of the text."""
+    text = " ".join(text.lower().split())
+    shingles = {
+        text[i : i + SHINGLE_SIZE] for i in range(max(len(text) - SHINGLE_SIZE + 1, 1))
+    }
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode()) for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return (permuted & np.uint64(0xFFFFFFFF)).min(axis=1).astype(np.uint32)
+
+
+def similarity(signature: np.ndarray, other: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the shingles of two signatures."""
+    return float(np.mean(signature == other))
+
+
+def _bands(signature: np.ndarray) -> list[tuple[int, bytes]]:
+    return [
+        (band, rows.tobytes())
+        for band, rows in enumerate(np.split(signature, NUM_BANDS))
+    ]
+
+
+class ChunkDuplicateIndex:
+    """Signatures of the stored chunks, and the duplicates merged into them.
+
+    These methods are thread-safe.
+    """
+
+    def __init__(
+        self, docstore: BaseDocumentStore, threshold: float = 0.9, min_chars: int = 40
+    ) -> None:
+        self.docstore = docstore
+        self.threshold = threshold
+        self.min_chars = min_chars
+        self._kvstore: BaseKVStore
+        if isinstance(docstore, KVDocumentStore):
+            self._kvstore = docstore._kvstore
+            namespace = docstore._namespace
+        else:
+            logger.warning(
+                "Docstore type=%s has no key-value store, chunk duplicates will not "
+                "be persisted",
+                type(docstore).__name__,
+            )
+            self._kvstore = SimpleKVStore()
+            namespace = ""
+        self._signatures_collection = f"{namespace}{SIGNATURES_COLLECTION_SUFFIX}"
+        self._duplicates_collection = f"{namespace}{DUPLICATES_COLLECTION_SUFFIX}"
+        # Document id -> ids of the stored nodes holding duplicates of the document
+        self._refs_collection = f"{namespace}{DUPLICATE_REFS_COLLECTION_SUFFIX}"
+        self._lock = threading.Lock()
+        # LSH buckets, (band, rows of the band) -> node ids. Loaded on first use.
+        self._buckets: dict[tuple[int, bytes], set[str]] | None = None
+        self._signatures: dict[str, np.ndarray] = {}
+
+    def deduplicate(self, nodes: list[BaseNode]) -> list[BaseNode]:
+        """Drop the nodes duplicating a stored node, or a previous node of the list.
+
+        The dropped nodes are recorded as duplicates of the node they duplicate.
+        The first node of a document is kept if all its nodes are duplicates, for
+        the document to remain listed (and deletable).
+        """
+        with self._lock:
+            self._load()
+            kept: dict[str, np.ndarray] = {}  # Node id -> signature
+            matches: dict[int, str] = {}  # Position -> id of the duplicated node
+            for position, node in enumerate(nodes):
+                text = node.get_content(metadata_mode=MetadataMode.NONE)
+                if len(text.strip()) < self.min_chars:
+                    continue
+                signature = minhash(text)
+                match = self._find(signature, kept)
+                if match is None:
+                    kept[node.node_id] = signature
+                    self._add_to_buckets(node.node_id, signature)
+                else:
+                    matches[position] = match
+
+            for position in _first_of_duplicated_docs(nodes, matches):
+                first = nodes[position]
+                del matches[position]
+                signature = minhash(first.get_content(MetadataMode.NONE))
+                kept[first.node_id] = signature
+                self._add_to_buckets(first.node_id, signature)
+
+            for node_id, signature in kept.items():
+                self._put_signature(node_id, signature)
+            duplicates_by_node: dict[str, list[BaseNode]] = defaultdict(list)
+            for position, match in matches.items():
+                duplicates_by_node[match].append(nodes[position])
+            for node_id, duplicates in duplicates_by_node.items():
+                self._add_duplicates(node_id, duplicates)
+        if matches:
+            logger.info(
+                "Merged count=%s duplicate chunks out of count=%s",
+                len(matches),
+                len(nodes),
+            )
+        return [node for position, node in enumerate(nodes) if position not in matches]
+
+    def merge_stored(self, nodes: list[BaseNode]) -> list[BaseNode]:
+        """Drop the nodes duplicating a node stored since they were deduplicated.
+
+        To be called with the nodes of one or more files right before storing
+        them, under the lock of the insertions: the nodes of the files stored
+        meanwhile (e.g. an identical file of the same bulk ingestion) were not
+        stored yet when the file was deduplicated. The nodes of a file are merged
+        into the nodes of the previous files of the list too, the nodes of a file
+        must be contiguous.
+        """
+        with self._lock:
+            self._load()
+            kept: dict[str, np.ndarray] = {}  # Nodes of the previous files
+            file_kept: dict[str, np.ndarray] = {}
+            file_name = None
+            matches: dict[int, str] = {}
+            for position, node in enumerate(nodes):
+                if node.metadata.get("file_name") != file_name:
+                    file_name = node.metadata.get("file_name")
+                    kept.update(file_kept)
+                    file_kept = {}
+                signature = self._signatures.get(node.node_id)
+                if signature is None:
+                    # Forgotten by the cleanup of a failed insertion of the file
+                    text = node.get_content(metadata_mode=MetadataMode.NONE)
+                    if len(text.strip()) < self.min_chars:
+                        continue
+                    signature = minhash(text)
+                    self._add_to_buckets(node.node_id, signature)
+                    self._put_signature(node.node_id, signature)
+                # The other nodes of the file were merged when deduplicated
+                match = self._find(signature, kept)
+                if match is None:
+                    file_kept[node.node_id] = signature
+                else:
+                    matches[position] = match
+            for position in _first_of_duplicated_docs(nodes, matches):
+                del matches[position]
+            for position, match in matches.items():
+                node_id = nodes[position].node_id
+                self._remove_signature(node_id)
+                # Merged into this node by the deduplication of its file
+                self._move_duplicates(node_id, match)
+                self._add_duplicates(match, [nodes[position]])
+        if matches:
+            logger.info(
+                "Merged count=%s chunks duplicating chunks stored meanwhile",
+                len(matches),
+            )
+        return [node for position, node in enumerate(nodes) if position not in matches]
+
+    def duplicates(self, node_id: str) -> list[BaseNode]:
+        """Duplicates merged into a stored node, of the documents still ingested."""
+        stored = self._kvstore.get(node_id, collection=self._duplicates_collection)
+        if not stored:
+            return []
+        return [
+            json_to_doc(duplicate["node"])
+            for duplicate in stored["duplicates"]
+            if self.docstore.get_ref_doc_info(duplicate["ref_doc_id"]) is not None
+        ]
+
+    def delete_ref_docs(self, ref_doc_infos: dict[str, RefDocInfo]) -> list[BaseNode]:
+        """Forget the nodes of the deleted documents, and their duplicates.
+
+        Returns the duplicates (of the other documents) merged into the deleted
+        nodes: they must be stored again, in place of the deleted nodes.
+        """
+        node_ids = {
+            node_id
+            for ref_doc_info in ref_doc_infos.values()
+            for node_id in ref_doc_info.node_ids
+        }
+        restored: list[BaseNode] = []
+        with self._lock:
+            self._load()
+            for node_id in node_ids:
+                self._remove_signature(node_id)
+                stored = self._kvstore.get(
+                    node_id, collection=self._duplicates_collection
+                )
+                if not stored:
+                    continue
+                self._kvstore.delete(node_id, collection=self._duplicates_collection)
+                for duplicate in stored["duplicates"]:
+                    if duplicate["ref_doc_id"] in ref_doc_infos:
+                        continue
+                    self._remove_ref(duplicate["ref_doc_id"], node_id)
+                    if self.docstore.get_ref_doc_info(duplicate["ref_doc_id"]):
+                        restored.append(json_to_doc(duplicate["node"]))
+            # Duplicates of the deleted documents, merged into other nodes
+            for ref_doc_id in ref_doc_infos:
+                refs = self._kvstore.get(ref_doc_id, collection=self._refs_collection)
+                if not refs:
+                    continue
+                self._kvstore.delete(ref_doc_id, collection=self._refs_collection)
+                for node_id in refs["node_ids"]:
+                    self._remove_duplicates(node_id, ref_doc_infos.keys())
+            # Stored again: the next duplicates are merged into them
+            for node in restored:
+                signature = minhash(node.get_content(MetadataMode.NONE))
+                self._add_to_buckets(node.node_id, signature)
+                self._put_signature(node.node_id, signature)
+        if restored:
+            logger.info("Restoring count=%s duplicate chunks", len(restored))
+        return restored
+
+    def _load(self) -> None:
+        if self._buckets is not None:
+            return
+        self._buckets = defaultdict(set)
+        self._load_refs()
+        stored = self._kvstore.get_all(collection=self._signatures_collection)
+        for node_id, value in stored.items():
+            if not self.docstore.document_exists(node_id):
+                # Transformed, but not stored (the ingestion of its file failed)
+                self._kvstore.delete(node_id, collection=self._signatures_collection)
+                continue
+            signature = np.frombuffer(
+                base64.b64decode(value["signature"]), dtype=np.uint32
+            )
+            self._add_to_buckets(node_id, signature)
+        logger.debug("Loaded the signatures of count=%s chunks", len(self._signatures))
+
+    def _load_refs(self) -> None:
+        """Index the stored duplicates by document, if they were not yet."""
+        if self._kvstore.get_all(collection=self._refs_collection):
+            return
+        refs: dict[str, set[str]] = defaultdict(set)
+        stored = self._kvstore.get_all(collection=self._duplicates_collection)
+        for node_id, value in stored.items():
+            for duplicate in value["duplicates"]:
+                refs[duplicate["ref_doc_id"]].add(node_id)
+        for ref_doc_id, node_ids in refs.items():
+            self._kvstore.put(
+                ref_doc_id,
+                {"node_ids": sorted(node_ids)},
+                collection=self._refs_collection,
+            )
+
+    def _find(self, signature: np.ndarray, kept: dict[str, np.ndarray]) -> str | None:
+        """Id of a node duplicated by the signature, stored or in `kept`."""
+        assert self._buckets is not None
+        candidates: set[str] = set()
+        for band in _bands(signature):
+            candidates.update(self._buckets.get(band, ()))
+        best, best_similarity = None, self.threshold
+        for node_id in candidates:
+            node_similarity = similarity(signature, self._signatures[node_id])
+            if node_similarity < best_similarity:
+                continue
+            # Nodes of a file being ingested by another thread, or of a file that
+            # failed, cannot be duplicated: they may never be stored. They are
+            # merged once stored, see `merge_stored`.
+            if node_id in kept or self.docstore.document_exists(node_id):
+                best, best_similarity = node_id, node_similarity
+        return best
+
+    def _add_to_buckets(self, node_id: str, signature: np.ndarray) -> None:
+        assert self._buckets is not None
+        self._signatures[node_id] = signature
+        for band in _bands(signature):
+            self._buckets[band].add(node_id)
+
+    def _remove_signature(self, node_id: str) -> None:
+        assert self._buckets is not None
+        signature = self._signatures.pop(node_id, None)
+        if signature is None:
+            return
+        for band in _bands(signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(node_id)
+                if not bucket:
+                    del self._buckets[band]
+        self._kvstore.delete(node_id, collection=self._signatures_collection)
+
+    def _put_signature(self, node_id: str, signature: np.ndarray) -> None:
+        self._kvstore.put(
+            node_id,
+            {"signature": base64.b64encode(signature.tobytes()).decode()},
+            collection=self._signatures_collection,
+        )
+
+    def _add_duplicates(self, node_id: str, nodes: list[BaseNode]) -> None:
+        stored = self._kvstore.get(node_id, collection=self._duplicates_collection)
+        duplicates = stored["duplicates"] if stored else []
+        duplicates += [
+            {"ref_doc_id": node.ref_doc_id, "node": doc_to_json(node)} for node in nodes
+        ]
+        self._kvstore.put(
+            node_id, {"duplicates": duplicates}, collection=self._duplicates_collection
+        )
+        for ref_doc_id in {node.ref_doc_id for node in nodes}:
+            if ref_doc_id is not None:
+                self._add_ref(ref_doc_id, node_id)
+
+    def _move_duplicates(self, node_id: str, to_node_id: str) -> None:
+        """Merge the duplicates of a node into another node."""
+        stored = self._kvstore.get(node_id, collection=self._duplicates_collection)
+        if not stored:
+            return
+        self._kvstore.delete(node_id, collection=self._duplicates_collection)
+        for duplicate in stored["duplicates"]:
+            self._remove_ref(duplicate["ref_doc_id"], node_id)
+        self._add_duplicates(
+            to_node_id,
+            [json_to_doc(duplicate["node"]) for duplicate in stored["duplicates"]],
+        )
+
+    def _remove_duplicates(self, node_id: str, ref_doc_ids: Collection[str]) -> None:
+        """Remove the duplicates of some documents merged into a node."""
+        stored = self._kvstore.get(node_id, collection=self._duplicates_collection)
+        if not stored:
+            return
+        duplicates = [
+            duplicate
+            for duplicate in stored["duplicates"]
+            if duplicate["ref_doc_id"] not in ref_doc_ids
+        ]
+        if not duplicates:
+            self._kvstore.delete(node_id, collection=self._duplicates_collection)
+        elif len(duplicates) < len(stored["duplicates"]):
+            self._kvstore.put(
+                node_id,
+                {"duplicates": duplicates},
+                collection=self._duplicates_collection,
+            )
+
+    def _add_ref(self, ref_doc_id: str, node_id: str) -> None:
+        refs = self._kvstore.get(ref_doc_id, collection=self._refs_collection)
+        node_ids = refs["node_ids"] if refs else []
+        if node_id not in node_ids:
+            self._kvstore.put(
+                ref_doc_id,
+                {"node_ids": [*node_ids, node_id]},
+                collection=self._refs_collection,
+            )
+
+    def _remove_ref(self, ref_doc_id: str, node_id: str) -> None:
+        refs = self._kvstore.get(ref_doc_id, collection=self._refs_collection)
+        if not refs or node_id not in refs["node_ids"]:
+            return
+        node_ids = [ref for ref in refs["node_ids"] if ref != node_id]
+        if node_ids:
+            self._kvstore.put(
+                ref_doc_id, {"node_ids": node_ids}, collection=self._refs_collection
+            )
+        else:
+            self._kvstore.delete(ref_doc_id, collection=self._refs_collection)
+
+
+def _first_of_duplicated_docs(
+    nodes: list[BaseNode], matches: dict[int, str]
+) -> list[int]:
+    """Positions of the first node of the documents whose nodes all matched.
+
+    These nodes are kept, for the documents to remain listed (and deletable).
+    """
+    positions_by_doc: dict[str | None, list[int]] = defaultdict(list)
+    for position, node in enumerate(nodes):
+        positions_by_doc[node.ref_doc_id].append(position)
+    return [
+        positions[0]
+        for positions in positions_by_doc.values()
+        if all(position in matches for position in positions)
+    ]
+
+
+class ChunkDeduplicator(TransformComponent):
+    """Drop the chunks duplicating a stored chunk, see `ChunkDuplicateIndex`.
+
+    To be run after the node parser, and before the embedding model.
+    """
+
+    threshold: float = Field(
+        default=0.9, description="Similarity of the shingles to be a duplicate."
+    )
+    min_chars: int = Field(default=40, description="Shorter chunks are never merged.")
+    _duplicate_index: ChunkDuplicateIndex = PrivateAttr()
+
+    def __init__(
+        self, docstore: BaseDocumentStore, threshold: float = 0.9, min_chars: int = 40
+    ) -> None:
+        super().__init__(threshold=threshold, min_chars=min_chars)
+        self._duplicate_index = ChunkDuplicateIndex(docstore, threshold, min_chars)
+
+    @property
+    def duplicate_index(self) -> ChunkDuplicateIndex:
+        return self._duplicate_index
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ChunkDeduplicator"
+
+    def __call__(self, nodes: list[BaseNode], **kwargs: Any) -> list[BaseNode]:
+        return self._duplicate_index.deduplicate(nodes)
@@ -0,0 +1,144 @@
+"""Compute the embeddings of the ingestion in worker processes.
+
+Embedding with a local model (HuggingFace) is CPU bound. Run on threads, the
+embedding workers contend for the GIL, and the torch intra-op threads of each
+worker fight the ones of the others for the cores. The `EmbeddingWorkerPool`
+runs the embeddings in worker processes instead:
+
+* each worker creates its own embedding model once, when it starts;
+* each worker pins its number of torch threads, so that the workers share the
+  cores instead of oversubscribing them;
+* the embeddings are sent back through shared memory, as a float32 array, instead
+  of pickled lists of Python floats.
+"""
+
+import logging
+import multiprocessing
+import os
+from collections.abc import Callable
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from llama_index.core.embeddings import BaseEmbedding
+
+from private_gpt.components.embedding.embedding_component import EmbeddingComponent
+from private_gpt.components.ingest.worker_count import count_cores
+from private_gpt.settings.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# Embedding model of the worker process, created by `_init_worker`
+_worker_embed_model: BaseEmbedding | None = None
+
+
+def create_embedding_model(settings: Settings) -> BaseEmbedding:
+    """Embedding model of the settings, the factory used by the server."""
+    return EmbeddingComponent(settings).embedding_model
+
+
+def _init_worker(
+    embed_model_factory: Callable[[], BaseEmbedding], torch_threads: int
+) -> None:
+    global _worker_embed_model
+    # Read by torch (and the BLAS libraries) when they are first imported
+    os.environ["OMP_NUM_THREADS"] = str(torch_threads)
+    os.environ["MKL_NUM_THREADS"] = str(torch_threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+    except ImportError:
+        pass
+    else:
+        torch.set_num_threads(torch_threads)
+    _worker_embed_model = embed_model_factory()
+    logger.debug(
+        "Embedding worker pid=%s ready with torch_threads=%s",
+        os.getpid(),
+        torch_threads,
+    )
+
+
+def _embed_texts(texts: list[str]) -> tuple[str, tuple[int, int]]:
+    """Embed the texts in a worker, returns the shared memory holding the vectors.
+
+    The shared memory is owned by the caller, which must unlink it.
+    """
+    assert _worker_embed_model is not None, "Embedding worker not initialized"
+    embeddings = np.asarray(
+        _worker_embed_model.get_text_embedding_batch(texts), dtype=np.float32
+    )
+    shm = SharedMemory(create=True, size=max(embeddings.nbytes, 1))
+    try:
+        np.ndarray(embeddings.shape, dtype=np.float32, buffer=shm.buf)[:] = embeddings
+    finally:
+        shm.close()
+    # Handed over to the caller: the worker must not unlink it when it exits
+    resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+    return shm.name, embeddings.shape
+
+
+def _read_embeddings(name: str, shape: tuple[int, int]) -> list[list[float]]:
+    shm = SharedMemory(name=name)
+    try:
+        return np.ndarray(shape, dtype=np.float32, buffer=shm.buf).tolist()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+class EmbeddingWorkerPool:
+    """Pool of worker processes computing embeddings, one model per worker.
+
+    The workers are spawned (not forked), so that they do not inherit the torch
+    state (threads, CUDA context) of the current process.
+    """
+
+    TEXTS_PER_TASK = 128  # Texts embedded by a worker in one go
+
+    def __init__(
+        self,
+        embed_model_factory: Callable[[], BaseEmbedding],
+        count_workers: int,
+        torch_threads: int = 0,
+    ) -> None:
+        assert count_workers > 0, "count_workers must be > 0"
+        self.count_workers = count_workers
+        # By default, the cores are shared between the workers
+        self.torch_threads = torch_threads or max(count_cores() // count_workers, 1)
+        logger.info(
+            "Starting count=%s embedding workers with torch_threads=%s",
+            count_workers,
+            self.torch_threads,
+        )
+        self._pool = multiprocessing.get_context("spawn").Pool(
+            processes=count_workers,
+            initializer=_init_worker,
+            initargs=(embed_model_factory, self.torch_threads),
+        )
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """Embed the texts, split across the workers by `TEXTS_PER_TASK`."""
+        if not texts:
+            return []
+        tasks = [
+            texts[i : i + self.TEXTS_PER_TASK]
+            for i in range(0, len(texts), self.TEXTS_PER_TASK)
+        ]
+        embeddings: list[list[float]] = []
+        # Read (and unlink) every shared memory, even if one of the tasks failed
+        results = [self._pool.apply_async(_embed_texts, (task,)) for task in tasks]
+        error: Exception | None = None
+        for result in results:
+            try:
+                embeddings.extend(_read_embeddings(*result.get()))
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return embeddings
+
+    def close(self) -> None:
+        self._pool.close()
+        self._pool.join()
+        self._pool.terminate()
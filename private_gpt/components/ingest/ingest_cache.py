@@ -0,0 +1,208 @@
+"""Content-addressed cache of the nodes of the ingested files.
+
+Parsing, splitting and embedding a file only depends on its bytes, on the reader
+used for its extension and on the transformations (node parser, embedding model).
+The cache is keyed by the SHA-256 of all of them, and stores the documents and
+nodes (with their embeddings) produced for the file. Ingesting identical bytes
+again, under the same or under another file name, reuses the stored nodes instead
+of running the transformations.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from llama_index.core.schema import (
+    BaseNode,
+    Document,
+    NodeRelationship,
+    TransformComponent,
+)
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+from private_gpt.components.ingest.ingest_helper import FILE_READERS
+
+logger = logging.getLogger(__name__)
+
+_READ_CHUNK_SIZE = 1024 * 1024
+
+
+def _component_identity(component: TransformComponent) -> str:
+    try:
+        # Class name and parameters (e.g. window size, embedding model name)
+        return component.to_json()
+    except Exception:
+        return f"{type(component).__module__}.{type(component).__qualname__}"
+
+
+def attach_to_file(
+    documents: list[Document],
+    nodes: list[BaseNode],
+    file_name: str,
+    doc_ids: dict[str, str] | None = None,
+) -> tuple[list[Document], list[BaseNode]]:
+    """Copy cached documents and nodes, to be ingested under the given file name.
+
+    The copies get new ids (or the ones given in `doc_ids`, by cached doc id), and
+    their relationships and metadata are updated accordingly. Embeddings are kept.
+    """
+    doc_ids = doc_ids or {}
+    new_doc_ids = {
+        document.doc_id: doc_ids.get(document.doc_id) or str(uuid.uuid4())
+        for document in documents
+    }
+    new_node_ids = {node.node_id: str(uuid.uuid4()) for node in nodes}
+
+    new_documents = []
+    for document in documents:
+        new_document = document.copy()
+        new_document.id_ = new_doc_ids[document.doc_id]
+        new_document.metadata = {
+            **document.metadata,
+            "file_name": file_name,
+            "doc_id": new_document.id_,
+        }
+        new_documents.append(new_document)
+
+    new_nodes = []
+    for node in nodes:
+        new_node = node.copy()
+        new_node.id_ = new_node_ids[node.node_id]
+        new_node.metadata = {**node.metadata, "file_name": file_name}
+        if node.ref_doc_id in new_doc_ids:
+            new_node.metadata["doc_id"] = new_doc_ids[node.ref_doc_id]
+        relationships = {}
+        for relationship, info in node.relationships.items():
+            ids = (
+                new_doc_ids if relationship == NodeRelationship.SOURCE else new_node_ids
+            )
+            if isinstance(info, list):
+                info = [
+                    item.copy(update={"node_id": ids.get(item.node_id, item.node_id)})
+                    for item in info
+                ]
+            else:
+                info = info.copy(
+                    update={"node_id": ids.get(info.node_id, info.node_id)}
+                )
+            relationships[relationship] = info
+        new_node.relationships = relationships
+        new_nodes.append(new_node)
+    return new_documents, new_nodes
+
+
+class IngestionCache:
+    """Documents and nodes of the ingested files, by content.
+
+    Entries are stored as JSON files in `cache_dir`. When the cache grows over
+    `max_size_bytes`, the least recently used entries are evicted.
+    These methods are thread-safe.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_size_bytes: int,
+        transformations: list[TransformComponent],
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._identity = "\n".join(_component_identity(t) for t in transformations)
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._sizes: dict[str, int] = {
+            path.stem: path.stat().st_size for path in self.cache_dir.glob("*.json")
+        }
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._sizes),
+            "size_bytes": self.size_bytes,
+        }
+
+    def key(self, file_name: str, file_data: Path) -> str:
+        """Cache key of a file, from its bytes, its reader and the transformations."""
+        digest = hashlib.sha256()
+        with file_data.open("rb") as f:
+            while chunk := f.read(_READ_CHUNK_SIZE):
+                digest.update(chunk)
+        reader_cls = FILE_READERS.get_reader_cls(Path(file_name).suffix)
+        reader = (
+            f"{reader_cls.__module__}.{reader_cls.__qualname__}"
+            if reader_cls is not None
+            else "StringIterableReader"
+        )
+        digest.update(f"\n{reader}\n{self._identity}".encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> tuple[list[Document], list[BaseNode]] | None:
+        """Get the documents and nodes of an entry, None on a cache miss."""
+        with self._lock:
+            path = self._path(key)
+            if key not in self._sizes:
+                self.misses += 1
+                return None
+            try:
+                entry = json.loads(path.read_text())
+                # Most recently used entries are evicted last
+                os.utime(path)
+            except (OSError, ValueError):
+                logger.warning("Dropping unreadable cache entry=%s", key, exc_info=True)
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+        documents = [json_to_doc(document) for document in entry["documents"]]
+        nodes = [json_to_doc(node) for node in entry["nodes"]]
+        return documents, nodes  # type: ignore[return-value]
+
+    def put(self, key: str, documents: list[Document], nodes: list[BaseNode]) -> None:
+        """Store the documents and nodes (with their embeddings) of a file."""
+        data = json.dumps(
+            {
+                "documents": [doc_to_json(document) for document in documents],
+                "nodes": [doc_to_json(node) for node in nodes],
+            }
+        )
+        size = len(data.encode())
+        if size > self.max_size_bytes:
+            logger.debug("Not caching entry=%s of size=%s, too large", key, size)
+            return
+        with self._lock:
+            path = self._path(key)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(data)
+            tmp_path.replace(path)
+            self._sizes[key] = size
+            self._evict()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _remove(self, key: str) -> None:
+        self._sizes.pop(key, None)
+        self._path(key).unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        size_bytes = self.size_bytes
+        if size_bytes <= self.max_size_bytes:
+            return
+        by_last_use = sorted(self._sizes, key=lambda k: self._path(k).stat().st_mtime)
+        for key in by_last_use:
+            if size_bytes <= self.max_size_bytes:
+                break
+            size_bytes -= self._sizes[key]
+            logger.debug("Evicting cache entry=%s", key)
+            self._remove(key)
@@ -1,23 +1,49 @@
 import abc
+import functools
 import itertools
 import logging
 import multiprocessing
 import multiprocessing.pool
 import os
 import threading
+import time
+from collections import Counter, defaultdict, deque
+from collections.abc import Callable
 from pathlib import Path
 from queue import Queue
 from typing import Any
 
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core.data_structs import IndexDict
 from llama_index.core.embeddings.utils import EmbedType
 from llama_index.core.indices import VectorStoreIndex, load_index_from_storage
 from llama_index.core.indices.base import BaseIndex
 from llama_index.core.ingestion import run_transformations
-from llama_index.core.schema import BaseNode, Document, TransformComponent
+from llama_index.core.schema import (
+    BaseNode,
+    Document,
+    MetadataMode,
+    TransformComponent,
+)
 from llama_index.core.storage import StorageContext
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.docstore.types import RefDocInfo
 
+from private_gpt.components.ingest.boilerplate import BoilerplateRemover
+from private_gpt.components.ingest.chunk_dedup import ChunkDeduplicator
+from private_gpt.components.ingest.embedding_pool import (
+    EmbeddingWorkerPool,
+    create_embedding_model,
+)
+from private_gpt.components.ingest.ingest_cache import IngestionCache, attach_to_file
 from private_gpt.components.ingest.ingest_helper import IngestionHelper
+from private_gpt.components.ingest.page_labels import PageLabelIndex
+from private_gpt.components.ingest.worker_count import (
+    WorkerThrottle,
+    count_embedding_workers,
+    create_worker_throttle,
+)
+from private_gpt.components.vector_store.batch_delete import BatchDeleteVectorStore
 from private_gpt.paths import local_data_path
 from private_gpt.settings.settings import Settings
 from private_gpt.utils.eta import eta
@@ -32,7 +58,15 @@ logger = logging.getLogger(__name__)
 #                     )
 
 
+# Called as each file of a bulk ingestion is done, with its name, its documents,
+# and the error if it failed
+FileDone = Callable[[str, list[Document], str | None], None]
+
+
 class BaseIngestComponent(abc.ABC):
+    # Page label <-> page index mapping of the ingested files
+    page_labels: PageLabelIndex
+
     def __init__(
         self,
         storage_context: StorageContext,
@@ -51,21 +85,91 @@ class BaseIngestComponent(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def bulk_ingest(self, files: list[tuple[str, Path]]) -> list[Document]:
+    def bulk_ingest(
+        self, files: list[tuple[str, Path]], on_file_done: FileDone | None = None
+    ) -> list[Document]:
+        pass
+
+    @abc.abstractmethod
+    def update(self, file_name: str, file_data: Path) -> list[Document]:
         pass
 
     @abc.abstractmethod
     def delete(self, doc_id: str) -> None:
         pass
 
+    @abc.abstractmethod
+    def delete_many(self, doc_ids: list[str]) -> None:
+        pass
+
+    @abc.abstractmethod
+    def delete_by_file_name(self, file_name: str) -> list[str]:
+        pass
+
+    @abc.abstractmethod
+    def failed_files(self) -> list["FailedFile"]:
+        pass
+
+    @abc.abstractmethod
+    def clear_failed_files(self) -> None:
+        pass
+
+
+class FailedFile:
+    """A file that could not be ingested, even after being retried."""
+
+    def __init__(self, file_name: str, stage: str, error: str) -> None:
+        self.file_name = file_name
+        self.stage = stage  # "parse", "embed" or "save"
+        self.error = error
+        self.failed_at = time.time()
+
+
+def _split_at_embedding(
+    transformations: list[TransformComponent],
+) -> tuple[list[TransformComponent], list[TransformComponent]]:
+    """Split the transformations before the embedding, and from the embedding."""
+    position = next(
+        (
+            i
+            for i, transformation in enumerate(transformations)
+            if isinstance(transformation, BaseEmbedding)
+        ),
+        None,
+    )
+    assert position is not None, "Embeddings must be in the transformations"
+    return transformations[:position], transformations[position:]
+
+
+# Metadata of a page that changes when it moves, but not its content
+PAGE_POSITION_KEYS = ("page_index", "page_label")
+
+
+def _page_key(metadata: dict[str, Any]) -> tuple[Any, Any]:
+    return metadata.get("page_index"), metadata.get("page_hash")
+
+
+def _page_hash(metadata: dict[str, Any]) -> Any:
+    return metadata.get("page_hash")
+
+
+def _page_order(metadata: dict[str, Any]) -> int:
+    page_index = metadata.get("page_index")
+    return page_index if isinstance(page_index, int) else -1
+
 
 class BaseIngestComponentWithIndex(BaseIngestComponent, abc.ABC):
+    DELETE_BATCH_SIZE = 256  # Documents deleted per vector store call
+    MAX_FAILED_FILES = 1000  # Failed files kept, the oldest are dropped
+
     def __init__(
         self,
         storage_context: StorageContext,
         embed_model: EmbedType,
         transformations: list[TransformComponent],
         *args: Any,
+        ingest_cache: IngestionCache | None = None,
+        worker_throttle: WorkerThrottle | None = None,
         **kwargs: Any,
     ) -> None:
         super().__init__(storage_context, embed_model, transformations, *args, **kwargs)
@@ -75,6 +179,23 @@ class BaseIngestComponentWithIndex(BaseIngestComponent, abc.ABC):
             threading.Lock()
         )  # Thread lock! Not Multiprocessing lock
         self._index = self._initialize_index()
+        self.page_labels = PageLabelIndex(self.storage_context.docstore)
+        self.ingest_cache = ingest_cache
+        # Cache keys of the files being ingested after a cache miss, by file name
+        self._pending_cache_keys: dict[str, str] = {}
+        # Dead-letter list of the files that failed in a background ingestion
+        self._failed_files: deque[FailedFile] = deque(maxlen=self.MAX_FAILED_FILES)
+        # Bounds the busy workers with `count_workers: auto`
+        self.worker_throttle = worker_throttle
+        # Duplicate chunks merged by the deduplication transformation, if any
+        self.chunk_duplicates = next(
+            (
+                transformation.duplicate_index
+                for transformation in self.transformations
+                if isinstance(transformation, ChunkDeduplicator)
+            ),
+            None,
+        )
 
     def _initialize_index(self) -> BaseIndex[IndexDict]:
         """Initialize the index from the storage context."""
@@ -104,14 +225,362 @@ class BaseIngestComponentWithIndex(BaseIngestComponent, abc.ABC):
     def _save_index(self) -> None:
         self._index.storage_context.persist(persist_dir=local_data_path)
 
-    def delete(self, doc_id: str) -> None:
+    def _merge_stored_duplicates(self, nodes: list[BaseNode]) -> list[BaseNode]:
+        """Merge the duplicates of the nodes stored since they were deduplicated.
+
+        To be called under the index lock, right before inserting the nodes: the
+        files deduplicated at the same time (by other threads, or in the same
+        batch) are not stored yet when deduplicated.
+        """
+        if self.chunk_duplicates is None:
+            return nodes
+        return self.chunk_duplicates.merge_stored(nodes)
+
+    def _calibrate_workers(self, files: list[tuple[str, Path]]) -> None:
+        if self.worker_throttle is not None:
+            split_transformations, _ = _split_at_embedding(self.transformations)
+            # Not to register the nodes of the sample files as seen chunks
+            self.worker_throttle.calibrate(
+                files,
+                [
+                    transformation
+                    for transformation in split_transformations
+                    if not isinstance(transformation, ChunkDeduplicator)
+                ],
+            )
+
+    def failed_files(self) -> list[FailedFile]:
+        """Files that could not be ingested, the oldest first."""
+        return list(self._failed_files)
+
+    def clear_failed_files(self) -> None:
+        self._failed_files.clear()
+
+    def _fail_file(self, file_name: str, stage: str, error: str) -> None:
+        logger.error(
+            "Could not ingest file_name=%s at stage=%s: %s", file_name, stage, error
+        )
+        self._pending_cache_keys.pop(file_name, None)
+        self._failed_files.append(FailedFile(file_name, stage, error))
+
+    def _ingest_from_cache(
+        self, file_name: str, file_data: Path
+    ) -> list[Document] | None:
+        """Ingest a file from the ingestion cache, returns None on a cache miss.
+
+        If the same content is already ingested under this file name, its existing
+        documents are returned. Otherwise, the cached nodes (and their embeddings)
+        are inserted under this file name, without running the transformations.
+        """
+        if self.ingest_cache is None:
+            return None
+        key = self.ingest_cache.key(file_name, file_data)
+        entry = self.ingest_cache.get(key)
+        logger.info(
+            "Ingestion cache %s for file_name=%s stats=%s",
+            "miss" if entry is None else "hit",
+            file_name,
+            self.ingest_cache.stats(),
+        )
+        if entry is None:
+            self._pending_cache_keys[file_name] = key
+            return None
+        cached_documents, cached_nodes = entry
+
+        ref_docs = self._index.docstore.get_all_ref_doc_info() or {}
+        ingested_pages = {
+            _page_key(ref_doc_info.metadata): doc_id
+            for doc_id, ref_doc_info in ref_docs.items()
+            if ref_doc_info.metadata.get("file_name") == file_name
+        }
+        cached_pages = {
+            _page_key(document.metadata): document.doc_id
+            for document in cached_documents
+        }
+        if ingested_pages and ingested_pages.keys() == cached_pages.keys():
+            logger.info("File file_name=%s is already ingested", file_name)
+            documents, _ = attach_to_file(
+                cached_documents,
+                [],
+                file_name,
+                doc_ids={
+                    cached_pages[page_key]: doc_id
+                    for page_key, doc_id in ingested_pages.items()
+                },
+            )
+            return documents
+
+        documents, nodes = attach_to_file(cached_documents, cached_nodes, file_name)
+        with self._index_thread_lock:
+            logger.info("Inserting count=%s cached nodes in the index", len(nodes))
+            # The nodes have their embeddings, they are not computed again
+            self._index.insert_nodes(nodes)
+            for document in documents:
+                self._index.docstore.set_document_hash(
+                    document.get_doc_id(), document.hash
+                )
+            self.page_labels.add_documents(documents)
+            self._save_index()
+        return documents
+
+    def _ingest_files_from_cache(
+        self, files: list[tuple[str, Path]], on_file_done: FileDone | None = None
+    ) -> tuple[list[Document], list[tuple[str, Path]]]:
+        """Ingest the files found in the ingestion cache.
+
+        Returns the documents of the cached files, and the files left to ingest.
+        """
+        documents: list[Document] = []
+        missed_files = []
+        for file_name, file_data in files:
+            cached_documents = self._ingest_from_cache(file_name, file_data)
+            if cached_documents is None:
+                missed_files.append((file_name, file_data))
+                continue
+            documents.extend(cached_documents)
+            if on_file_done is not None:
+                on_file_done(file_name, cached_documents, None)
+        return documents, missed_files
+
+    @staticmethod
+    def _files_done(documents: list[Document], on_file_done: FileDone | None) -> None:
+        """Report the files of the saved documents as done."""
+        if on_file_done is None:
+            return
+        documents_by_file: dict[str, list[Document]] = defaultdict(list)
+        for document in documents:
+            documents_by_file[document.metadata["file_name"]].append(document)
+        for file_name, file_documents in documents_by_file.items():
+            on_file_done(file_name, file_documents, None)
+
+    def _cache_nodes(self, documents: list[Document], nodes: list[BaseNode]) -> None:
+        """Store the nodes of the files that missed the ingestion cache."""
+        if self.ingest_cache is None or not self._pending_cache_keys:
+            return
+        documents_by_file: dict[str, list[Document]] = defaultdict(list)
+        for document in documents:
+            documents_by_file[document.metadata["file_name"]].append(document)
+        for file_name, file_documents in documents_by_file.items():
+            key = self._pending_cache_keys.pop(file_name, None)
+            if key is None:
+                continue
+            doc_ids = {document.doc_id for document in file_documents}
+            file_nodes = [node for node in nodes if node.ref_doc_id in doc_ids]
+            self.ingest_cache.put(key, file_documents, file_nodes)
+
+    @abc.abstractmethod
+    def _ingest_documents(
+        self, file_name: str, documents: list[Document]
+    ) -> list[Document]:
+        """Transform the documents of a file into nodes, and save them."""
+
+    def update(self, file_name: str, file_data: Path) -> list[Document]:
+        """Re-ingest an already ingested file, page by page.
+
+        The pages are compared with the ingested ones using their content hash.
+        Only the new or changed pages are embedded, and only the vanished or
+        changed pages are deleted. An unchanged page that moved (after a page was
+        inserted or removed before it) keeps its nodes, only its page index and
+        label are rewritten. Returns the documents of the new or changed pages,
+        the unchanged ones keep their existing documents.
+        """
+        # Only the changed pages are transformed, they are not a cache entry
+        self._pending_cache_keys.pop(file_name, None)
+        documents = IngestionHelper.transform_file_into_documents(file_name, file_data)
+        ref_docs = self._index.docstore.get_all_ref_doc_info() or {}
+        ingested = {
+            doc_id: ref_doc_info.metadata
+            for doc_id, ref_doc_info in ref_docs.items()
+            if ref_doc_info.metadata.get("file_name") == file_name
+        }
+        unchanged: dict[str, Document] = {}  # Ingested document id -> its page
+        changed = documents
+        # The pages in place first, then the pages that moved, in page order (a
+        # file may hold several identical pages, e.g. blank ones)
+        match_keys = [_page_key, _page_hash] if self._can_move_pages() else [_page_key]
+        for page_key in match_keys:
+            available: dict[Any, deque[str]] = defaultdict(deque)
+            for doc_id, metadata in sorted(
+                ingested.items(), key=lambda item: _page_order(item[1])
+            ):
+                if doc_id not in unchanged:
+                    available[page_key(metadata)].append(doc_id)
+            not_found = []
+            for document in changed:
+                doc_ids = available.get(page_key(document.metadata))
+                if doc_ids:
+                    unchanged[doc_ids.popleft()] = document
+                else:
+                    not_found.append(document)
+            changed = not_found
+        vanished = [doc_id for doc_id in ingested if doc_id not in unchanged]
+        moved = {
+            doc_id: document
+            for doc_id, document in unchanged.items()
+            if any(
+                ingested[doc_id].get(key) != document.metadata.get(key)
+                for key in PAGE_POSITION_KEYS
+            )
+        }
+        logger.info(
+            "Updating file_name=%s: count=%s unchanged pages (count=%s moved), "
+            "count=%s new or changed pages, count=%s removed pages",
+            file_name,
+            len(unchanged),
+            len(moved),
+            len(changed),
+            len(vanished),
+        )
+        if vanished:
+            self.delete_many(vanished)
+        if moved:
+            self._move_pages(file_name, unchanged, moved)
+        if not changed:
+            return []
+        self._ingest_documents(file_name, self._remove_boilerplate(documents, changed))
+        return changed
+
+    def _can_move_pages(self) -> bool:
+        return isinstance(self._index.docstore, KVDocumentStore)
+
+    def _move_pages(
+        self,
+        file_name: str,
+        unchanged: dict[str, Document],
+        moved: dict[str, Document],
+    ) -> None:
+        """Rewrite the page index and label of ingested pages that moved.
+
+        `unchanged` maps the ingested document of every unchanged page to the
+        page in the new revision of the file, `moved` the ones that moved.
+        The retrievers read the nodes from the docstore, the vector store keeps
+        the previous page metadata of the nodes.
+        """
+        docstore = self._index.docstore
+        assert isinstance(docstore, KVDocumentStore)
         with self._index_thread_lock:
-            # Delete the document from the index
-            self._index.delete_ref_doc(doc_id, delete_from_docstore=True)
+            for doc_id, document in moved.items():
+                ref_doc_info = docstore.get_ref_doc_info(doc_id)
+                if ref_doc_info is None:
+                    continue
+                position = {
+                    key: document.metadata[key]
+                    for key in PAGE_POSITION_KEYS
+                    if key in document.metadata
+                }
+                nodes = docstore.get_nodes(ref_doc_info.node_ids, raise_error=False)
+                for node in nodes:
+                    node.metadata.update(position)
+                docstore.add_documents(nodes, allow_update=True)
+                ref_doc_info.metadata.update(position)
+                docstore._kvstore.put(
+                    doc_id,
+                    ref_doc_info.to_dict(),
+                    collection=docstore._ref_doc_collection,
+                )
+            # The unchanged pages keep their documents
+            for doc_id, document in unchanged.items():
+                document.id_ = doc_id
+                document.metadata["doc_id"] = doc_id
+            self.page_labels.delete_file(file_name)
+            self.page_labels.add_documents(list(unchanged.values()))
+            self._save_index()
 
+    def _remove_boilerplate(
+        self, documents: list[Document], changed: list[Document]
+    ) -> list[Document]:
+        """Remove the boilerplate of the changed pages, found over all the pages.
+
+        A few changed pages would not show the lines repeated on the pages of the
+        file, the remover is not run on them again.
+        """
+        remover = next(
+            (t for t in self.transformations if isinstance(t, BoilerplateRemover)),
+            None,
+        )
+        if remover is None:
+            return changed
+        changed_ids = {document.doc_id for document in changed}
+        return [
+            page for page in remover.remove(documents) if page.doc_id in changed_ids
+        ]
+
+    def delete(self, doc_id: str) -> None:
+        self.delete_many([doc_id])
+
+    def delete_many(self, doc_ids: list[str]) -> None:
+        """Delete several documents, saving the index once."""
+        with self._index_thread_lock:
+            self._delete_ref_docs(doc_ids)
             # Save the index
             self._save_index()
 
+    def delete_by_file_name(self, file_name: str) -> list[str]:
+        """Delete all the documents (pages) of a file, returns their ids."""
+        with self._index_thread_lock:
+            ref_docs = self._index.docstore.get_all_ref_doc_info() or {}
+            doc_ids = [
+                doc_id
+                for doc_id, ref_doc_info in ref_docs.items()
+                if ref_doc_info.metadata.get("file_name") == file_name
+            ]
+            logger.info(
+                "Deleting count=%s documents of file_name=%s", len(doc_ids), file_name
+            )
+            if doc_ids:
+                self._delete_ref_docs(doc_ids)
+                # Including the pages without any text (hence without any node)
+                self.page_labels.delete_file(file_name)
+                self._save_index()
+        return doc_ids
+
+    def _delete_ref_docs(self, doc_ids: list[str]) -> None:
+        # Same as `VectorStoreIndex.delete_ref_doc`, for several documents at once.
+        # The vectors are deleted by document (one call per batch of documents when
+        # the vector store supports it), not node by node, and the index struct is
+        # stored once.
+        docstore = self._index.docstore
+        ref_doc_infos = {
+            doc_id: ref_doc_info
+            for doc_id in doc_ids
+            if (ref_doc_info := docstore.get_ref_doc_info(doc_id)) is not None
+        }
+        # Duplicates of other documents merged into the deleted nodes. Including
+        # the documents without any stored node (e.g. a failed insertion), whose
+        # nodes may have been merged into stored nodes.
+        restored_nodes = (
+            self.chunk_duplicates.delete_ref_docs(
+                {
+                    doc_id: ref_doc_infos.get(doc_id) or RefDocInfo()
+                    for doc_id in doc_ids
+                }
+            )
+            if self.chunk_duplicates is not None
+            else []
+        )
+        vector_store = self._index.vector_store
+        if isinstance(vector_store, BatchDeleteVectorStore):
+            for i in range(0, len(doc_ids), self.DELETE_BATCH_SIZE):
+                vector_store.delete_many(doc_ids[i : i + self.DELETE_BATCH_SIZE])
+        else:
+            for doc_id in doc_ids:
+                vector_store.delete(doc_id)
+
+        index_struct = self._index.index_struct
+        doc_ids_by_file: dict[str, set[str]] = defaultdict(set)
+        for doc_id, ref_doc_info in ref_doc_infos.items():
+            for node_id in ref_doc_info.node_ids:
+                index_struct.delete(node_id)
+            docstore.delete_ref_doc(doc_id, raise_error=False)
+            if "file_name" in ref_doc_info.metadata:
+                doc_ids_by_file[ref_doc_info.metadata["file_name"]].add(doc_id)
+        self._index.storage_context.index_store.add_index_struct(index_struct)
+        for file_name, file_doc_ids in doc_ids_by_file.items():
+            self.page_labels.delete_documents(file_name, file_doc_ids)
+        if restored_nodes:
+            # Embedded again, they were never stored
+            self._index.insert_nodes(restored_nodes)
+
 
 class SimpleIngestComponent(BaseIngestComponentWithIndex):
     def __init__(
@@ -133,6 +602,9 @@ class SimpleIngestComponent(BaseIngestComponentWithIndex):
 
     def ingest(self, file_name: str, file_data: Path) -> list[Document]:
         logger.info("Ingesting file_name=%s", file_name)
+        cached_documents = self._ingest_from_cache(file_name, file_data)
+        if cached_documents is not None:
+            return cached_documents
         documents = IngestionHelper.transform_file_into_documents(file_name, file_data)
         logger.info(
             "Transformed file=%s into count=%s documents", file_name, len(documents)
@@ -140,13 +612,18 @@ class SimpleIngestComponent(BaseIngestComponentWithIndex):
         logger.debug("Saving the documents in the index and doc store")
         return self._save_docs(documents)
 
-    def bulk_ingest(self, files: list[tuple[str, Path]]) -> list[Document]:
-        saved_documents = []
+    def bulk_ingest(
+        self, files: list[tuple[str, Path]], on_file_done: FileDone | None = None
+    ) -> list[Document]:
+        saved_documents, files = self._ingest_files_from_cache(files, on_file_done)
         for file_name, file_data in files:
             documents = IngestionHelper.transform_file_into_documents(
                 file_name, file_data
             )
-            saved_documents.extend(self._save_docs(documents))
+            documents = self._save_docs(documents)
+            saved_documents.extend(documents)
+            if on_file_done is not None:
+                on_file_done(file_name, documents, None)
         return saved_documents
     # def _separate_text_and_image_documents(self, documents: list[DocumentWithBlobs]) -> tuple[list[DocumentWithBlobs], list[DocumentWithBlobs]]:
     #     text_documents = []
@@ -211,11 +688,28 @@ class SimpleIngestComponent(BaseIngestComponentWithIndex):
     #         saved_documents.extend(saved_text_documents + saved_image_documents)
     #     return saved_documents
 
+    def _ingest_documents(
+        self, file_name: str, documents: list[Document]
+    ) -> list[Document]:
+        return self._save_docs(documents)
+
     def _save_docs(self, documents: list[Document]) -> list[Document]:
         logger.debug("Transforming count=%s documents into nodes", len(documents))
         with self._index_thread_lock:
+            # The documents (pages) of a file are transformed together, as some
+            # transformations look across pages
+            nodes = run_transformations(
+                documents,  # type: ignore[arg-type]
+                self.transformations,
+                show_progress=self.show_progress,
+            )
+            self._cache_nodes(documents, nodes)
+            self._index.insert_nodes(nodes, show_progress=True)
             for document in documents:
-                self._index.insert(document, show_progress=True)
+                self._index.docstore.set_document_hash(
+                    document.get_doc_id(), document.hash
+                )
+            self.page_labels.add_documents(documents)
             logger.debug("Persisting the index and nodes")
             # persist the index and nodes
             self._save_index()
@@ -223,10 +717,69 @@ class SimpleIngestComponent(BaseIngestComponentWithIndex):
         return documents
 
 
+def _transform_shard_into_documents(
+    shard: tuple[int, int, str, Path, tuple[int, int] | None]
+) -> tuple[int, int, list[Document]]:
+    file_index, shard_index, file_name, file_data, pages = shard
+    documents = IngestionHelper.transform_file_into_documents(
+        file_name, file_data, pages
+    )
+    return file_index, shard_index, documents
+
+
+class _ThrottledShards:
+    """Shards given to a worker pool, each taking a slot until it is consumed.
+
+    Bounds the shards parsed ahead: `imap` and `imap_unordered` would otherwise
+    parse all of them, whatever the pace of their consumer.
+    """
+
+    def __init__(self, shards: list[Any], slots: Any) -> None:
+        self._shards = shards
+        self._slots = slots  # Semaphore or WorkerThrottle
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._taken = 0
+
+    def __iter__(self) -> Any:
+        for shard in self._shards:
+            self._slots.acquire()
+            with self._lock:
+                if self._stopped:
+                    self._slots.release()
+                    return
+                self._taken += 1
+            yield shard
+
+    def consumed(self) -> None:
+        with self._lock:
+            self._taken -= 1
+        self._slots.release()
+
+    def stop(self) -> None:
+        """Stop giving shards, giving back the slots of the shards not consumed."""
+        with self._lock:
+            self._stopped = True
+            for _ in range(self._taken):
+                self._slots.release()
+            self._taken = 0
+
+
+def _node_size(node: BaseNode) -> int:
+    """Approximate size of a node in memory: its text and metadata."""
+    text = node.get_content(metadata_mode=MetadataMode.NONE)
+    return len(text.encode("utf-8")) + len(str(node.metadata))
+
+
 class BatchIngestComponent(BaseIngestComponentWithIndex):
     """Parallelize the file reading and parsing on multiple CPU core.
 
     This also makes the embeddings to be computed in batches (on GPU or CPU).
+    Large PDF files can be split in page ranges, parsed on multiple CPU cores too.
+
+    With a `flush_node_count` or `flush_byte_count`, a bulk ingestion is streamed:
+    the files are embedded and saved by batches as they are parsed, instead of all
+    at once, so that the memory used does not grow with the number of files.
     """
 
     def __init__(
@@ -235,6 +788,9 @@ class BatchIngestComponent(BaseIngestComponentWithIndex):
         embed_model: EmbedType,
         transformations: list[TransformComponent],
         count_workers: int,
+        pages_per_shard: int = 0,
+        flush_node_count: int = 0,
+        flush_byte_count: int = 0,
         *args: Any,
         **kwargs: Any,
     ) -> None:
@@ -246,6 +802,13 @@ class BatchIngestComponent(BaseIngestComponentWithIndex):
         ), "Embeddings must be in the transformations"
         assert count_workers > 0, "count_workers must be > 0"
         self.count_workers = count_workers
+        self.pages_per_shard = pages_per_shard
+        # The split stage runs as the files are parsed, the embedding by batches
+        self._split_transformations, self._embed_transformations = _split_at_embedding(
+            self.transformations
+        )
+        self.flush_node_count = flush_node_count
+        self.flush_byte_count = flush_byte_count
 
         self._file_to_documents_work_pool = multiprocessing.Pool(
             processes=self.count_workers
@@ -253,26 +816,186 @@ class BatchIngestComponent(BaseIngestComponentWithIndex):
 
     def ingest(self, file_name: str, file_data: Path) -> list[Document]:
         logger.info("Ingesting file_name=%s", file_name)
-        documents = IngestionHelper.transform_file_into_documents(file_name, file_data)
+        cached_documents = self._ingest_from_cache(file_name, file_data)
+        if cached_documents is not None:
+            return cached_documents
+        if self.pages_per_shard > 0:
+            documents = self._transform_files_into_documents([(file_name, file_data)])
+        else:
+            documents = IngestionHelper.transform_file_into_documents(
+                file_name, file_data
+            )
         logger.info(
             "Transformed file=%s into count=%s documents", file_name, len(documents)
         )
         logger.debug("Saving the documents in the index and doc store")
         return self._save_docs(documents)
 
-    def bulk_ingest(self, files: list[tuple[str, Path]]) -> list[Document]:
-        documents = list(
-            itertools.chain.from_iterable(
-                self._file_to_documents_work_pool.starmap(
-                    IngestionHelper.transform_file_into_documents, files
+    def bulk_ingest(
+        self, files: list[tuple[str, Path]], on_file_done: FileDone | None = None
+    ) -> list[Document]:
+        cached_documents, files = self._ingest_files_from_cache(files, on_file_done)
+        if not files:
+            return cached_documents
+        self._calibrate_workers(files)
+        if self.flush_node_count > 0 or self.flush_byte_count > 0:
+            return cached_documents + self._stream_files(files, on_file_done)
+        documents = self._transform_files_into_documents(files)
+        logger.info(
+            "Transformed count=%s files into count=%s documents",
+            len(files),
+            len(documents),
+        )
+        # All the files are saved at once
+        documents = self._save_docs(documents)
+        self._files_done(documents, on_file_done)
+        return cached_documents + documents
+
+    def _transform_files_into_documents(
+        self, files: list[tuple[str, Path]]
+    ) -> list[Document]:
+        # Each file is split in page ranges (a single one if it cannot be split).
+        # starmap keeps the order of the ranges, hence the order of the pages.
+        shards = [
+            (file_name, file_data, pages)
+            for file_name, file_data in files
+            for pages in IngestionHelper.split_into_page_ranges(
+                file_name, file_data, self.pages_per_shard
+            )
+        ]
+        if self.worker_throttle is None:
+            return list(
+                itertools.chain.from_iterable(
+                    self._file_to_documents_work_pool.starmap(
+                        IngestionHelper.transform_file_into_documents, shards
+                    )
+                )
+            )
+        # Same as starmap (imap keeps the order too), parsing at most as many
+        # shards at a time as the throttle allows
+        throttled_shards = _ThrottledShards(
+            [(0, 0, *shard) for shard in shards], self.worker_throttle
+        )
+        documents: list[Document] = []
+        try:
+            for _, _, shard_documents in self._file_to_documents_work_pool.imap(
+                _transform_shard_into_documents, throttled_shards
+            ):
+                throttled_shards.consumed()
+                documents.extend(shard_documents)
+        finally:
+            throttled_shards.stop()
+        return documents
+
+    def _stream_files(
+        self, files: list[tuple[str, Path]], on_file_done: FileDone | None = None
+    ) -> list[Document]:
+        """Ingest the files as they are parsed, saving them by batches of nodes.
+
+        The parsed files are split into nodes, and accumulated until they reach
+        `flush_node_count` nodes or `flush_byte_count` bytes. The batch is then
+        embedded and saved. The nodes of a file are always saved in the same batch.
+        Returns the saved documents, without their text not to hold the whole
+        corpus in memory.
+        """
+        shards = [
+            (file_index, shard_index, file_name, file_data, pages)
+            for file_index, (file_name, file_data) in enumerate(files)
+            for shard_index, pages in enumerate(
+                IngestionHelper.split_into_page_ranges(
+                    file_name, file_data, self.pages_per_shard
                 )
             )
+        ]
+        count_file_shards = Counter(shard[0] for shard in shards)
+        # imap_unordered would parse all the files ahead of the embeddings,
+        # at most two shards per worker are parsed and not consumed yet
+        throttled_shards = _ThrottledShards(
+            shards, self.worker_throttle or threading.Semaphore(2 * self.count_workers)
         )
+        parsed_shards: dict[int, dict[int, list[Document]]] = defaultdict(dict)
+        batch_documents: list[Document] = []
+        batch_nodes: list[BaseNode] = []
+        batch_bytes = 0
+        saved_documents: list[Document] = []
+        parsed = self._file_to_documents_work_pool.imap_unordered(
+            _transform_shard_into_documents, throttled_shards
+        )
+        try:
+            for file_index, shard_index, documents in parsed:
+                throttled_shards.consumed()
+                file_shards = parsed_shards[file_index]
+                file_shards[shard_index] = documents
+                if len(file_shards) < count_file_shards[file_index]:
+                    continue
+                del parsed_shards[file_index]
+                # The pages of a file are transformed together, in order
+                file_documents = list(
+                    itertools.chain.from_iterable(
+                        file_shards[i] for i in range(len(file_shards))
+                    )
+                )
+                nodes = run_transformations(
+                    file_documents,  # type: ignore[arg-type]
+                    self._split_transformations,
+                )
+                batch_documents.extend(file_documents)
+                batch_nodes.extend(nodes)
+                batch_bytes += sum(_node_size(node) for node in nodes)
+                if (
+                    0 < self.flush_node_count <= len(batch_nodes)
+                    or 0 < self.flush_byte_count <= batch_bytes
+                ):
+                    saved_documents.extend(
+                        self._save_nodes(batch_documents, batch_nodes, on_file_done)
+                    )
+                    batch_documents, batch_nodes, batch_bytes = [], [], 0
+            if batch_documents:
+                saved_documents.extend(
+                    self._save_nodes(batch_documents, batch_nodes, on_file_done)
+                )
+        finally:
+            # Unblock the pool if a file failed
+            throttled_shards.stop()
+        return saved_documents
+
+    def _save_nodes(
+        self,
+        documents: list[Document],
+        nodes: list[BaseNode],
+        on_file_done: FileDone | None = None,
+    ) -> list[Document]:
+        """Embed and save a batch of nodes, split from the given documents."""
         logger.info(
-            "Transformed count=%s files into count=%s documents",
-            len(files),
+            "Embedding and saving count=%s nodes of count=%s documents",
+            len(nodes),
             len(documents),
         )
+        nodes = run_transformations(
+            nodes,
+            self._embed_transformations,
+            show_progress=self.show_progress,
+        )
+        self._cache_nodes(documents, nodes)
+        with self._index_thread_lock:
+            nodes = self._merge_stored_duplicates(nodes)
+            self._index.insert_nodes(nodes)
+            for document in documents:
+                self._index.docstore.set_document_hash(
+                    document.get_doc_id(), document.hash
+                )
+            self.page_labels.add_documents(documents)
+            self._save_index()
+        saved_documents = [
+            Document(doc_id=document.doc_id, metadata=document.metadata)
+            for document in documents
+        ]
+        self._files_done(saved_documents, on_file_done)
+        return saved_documents
+
+    def _ingest_documents(
+        self, file_name: str, documents: list[Document]
+    ) -> list[Document]:
         return self._save_docs(documents)
 
     def _save_docs(self, documents: list[Document]) -> list[Document]:
@@ -282,14 +1005,17 @@ class BatchIngestComponent(BaseIngestComponentWithIndex):
             self.transformations,
             show_progress=self.show_progress,
         )
+        self._cache_nodes(documents, nodes)
         # Locking the index to avoid concurrent writes
         with self._index_thread_lock:
+            nodes = self._merge_stored_duplicates(nodes)
             logger.info("Inserting count=%s nodes in the index", len(nodes))
             self._index.insert_nodes(nodes, show_progress=True)
             for document in documents:
                 self._index.docstore.set_document_hash(
                     document.get_doc_id(), document.hash
                 )
+            self.page_labels.add_documents(documents)
             logger.debug("Persisting the index and nodes")
             # persist the index and nodes
             self._save_index()
@@ -302,6 +1028,7 @@ class ParallelizedIngestComponent(BaseIngestComponentWithIndex):
 
     This use the CPU and GPU in parallel (both running at the same time), and
     reduce the memory pressure by not loading all the files in memory at the same time.
+    Large PDF files can be split in page ranges, parsed on multiple CPU cores.
     """
 
     def __init__(
@@ -310,6 +1037,7 @@ class ParallelizedIngestComponent(BaseIngestComponentWithIndex):
         embed_model: EmbedType,
         transformations: list[TransformComponent],
         count_workers: int,
+        pages_per_shard: int = 0,
         *args: Any,
         **kwargs: Any,
     ) -> None:
@@ -321,6 +1049,7 @@ class ParallelizedIngestComponent(BaseIngestComponentWithIndex):
         ), "Embeddings must be in the transformations"
         assert count_workers > 0, "count_workers must be > 0"
         self.count_workers = count_workers
+        self.pages_per_shard = pages_per_shard
         # We are doing our own multiprocessing
         # To do not collide with the multiprocessing of huggingface, we disable it
         os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -335,10 +1064,21 @@ class ParallelizedIngestComponent(BaseIngestComponentWithIndex):
 
     def ingest(self, file_name: str, file_data: Path) -> list[Document]:
         logger.info("Ingesting file_name=%s", file_name)
-        # Running in a single (1) process to release the current
-        # thread, and take a dedicated CPU core for computation
-        documents = self._file_to_documents_work_pool.apply(
-            IngestionHelper.transform_file_into_documents, (file_name, file_data)
+        cached_documents = self._ingest_from_cache(file_name, file_data)
+        if cached_documents is not None:
+            return cached_documents
+        # Running in a single (1) process per page range to release the current
+        # thread, and take dedicated CPU cores for computation
+        shards = IngestionHelper.split_into_page_ranges(
+            file_name, file_data, self.pages_per_shard
+        )
+        documents = list(
+            itertools.chain.from_iterable(
+                self._file_to_documents_work_pool.starmap(
+                    IngestionHelper.transform_file_into_documents,
+                    [(file_name, file_data, pages) for pages in shards],
+                )
+            )
         )
         logger.info(
             "Transformed file=%s into count=%s documents", file_name, len(documents)
@@ -346,17 +1086,43 @@ class ParallelizedIngestComponent(BaseIngestComponentWithIndex):
         logger.debug("Saving the documents in the index and doc store")
         return self._save_docs(documents)
 
-    def bulk_ingest(self, files: list[tuple[str, Path]]) -> list[Document]:
+    def bulk_ingest(
+        self, files: list[tuple[str, Path]], on_file_done: FileDone | None = None
+    ) -> list[Document]:
         # Lightweight threads, used for parallelize the
         # underlying IO calls made in the ingestion
-
+        self._calibrate_workers(files)
         documents = list(
             itertools.chain.from_iterable(
-                self._ingest_work_pool.starmap(self.ingest, files)
+                self._ingest_work_pool.starmap(
+                    functools.partial(
+                        self._throttled_ingest, on_file_done=on_file_done
+                    ),
+                    files,
+                )
             )
         )
         return documents
 
+    def _throttled_ingest(
+        self, file_name: str, file_data: Path, on_file_done: FileDone | None = None
+    ) -> list[Document]:
+        if self.worker_throttle is not None:
+            self.worker_throttle.acquire()
+        try:
+            documents = self.ingest(file_name, file_data)
+        finally:
+            if self.worker_throttle is not None:
+                self.worker_throttle.release()
+        if on_file_done is not None:
+            on_file_done(file_name, documents, None)
+        return documents
+
+    def _ingest_documents(
+        self, file_name: str, documents: list[Document]
+    ) -> list[Document]:
+        return self._save_docs(documents)
+
     def _save_docs(self, documents: list[Document]) -> list[Document]:
         logger.debug("Transforming count=%s documents into nodes", len(documents))
         nodes = run_transformations(
@@ -364,14 +1130,17 @@ class ParallelizedIngestComponent(BaseIngestComponentWithIndex):
             self.transformations,
             show_progress=self.show_progress,
         )
+        self._cache_nodes(documents, nodes)
         # Locking the index to avoid concurrent writes
         with self._index_thread_lock:
+            nodes = self._merge_stored_duplicates(nodes)
             logger.info("Inserting count=%s nodes in the index", len(nodes))
             self._index.insert_nodes(nodes, show_progress=True)
             for document in documents:
                 self._index.docstore.set_document_hash(
                     document.get_doc_id(), document.hash
                 )
+            self.page_labels.add_documents(documents)
             logger.debug("Persisting the index and nodes")
             # persist the index and nodes
             self._save_index()
@@ -392,24 +1161,68 @@ class ParallelizedIngestComponent(BaseIngestComponentWithIndex):
         self._file_to_documents_work_pool.terminate()
 
 
+def _transform_file_into_documents_timed(
+    file_name: str, file_data: Path
+) -> tuple[str, list[Document] | str, float]:
+    """Parse a file in a worker process, returning the time it took.
+
+    Errors are logged and returned instead of the documents, so that a file that
+    cannot be parsed does not fail the other files.
+    """
+    start = time.perf_counter()
+    try:
+        documents = IngestionHelper.transform_file_into_documents(file_name, file_data)
+    except Exception as e:
+        logger.exception(f"Skipping {file_data.name}")
+        return file_name, repr(e), time.perf_counter() - start
+    return file_name, documents, time.perf_counter() - start
+
+
+class _StageTimes:
+    """Time spent working by each stage of the pipeline, to find its bottleneck."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._busy: dict[str, float] = defaultdict(float)
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._busy[stage] += seconds
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self._busy)
+
+
 class PipelineIngestComponent(BaseIngestComponentWithIndex):
     """Pipeline ingestion - keeping the embedding worker pool as busy as possible.
 
-    This class implements a threaded ingestion pipeline, which comprises two threads
-    and two queues. The primary thread is responsible for reading and parsing files
-    into documents. These documents are then placed into a queue, which is
+    This class implements a threaded ingestion pipeline, which comprises three
+    stages and two queues. The files are first parsed into documents by a pool of
+    worker processes (in bulk ingestion). These documents are then placed into a
+    queue as soon as a file is parsed, which is
     distributed to a pool of worker processes for embedding computation. After
     embedding, the documents are transferred to another queue where they are
     accumulated until a threshold is reached. Upon reaching this threshold, the
     accumulated documents are flushed to the document store, index, and vector
     store.
 
-    Exception handling ensures robustness against erroneous files. However, in the
-    pipelined design, one error can lead to the discarding of multiple files. Any
-    discarded files will be reported.
+    Exception handling ensures robustness against erroneous files: each file is
+    embedded, and inserted in the index, on its own. A file that fails is retried
+    `MAX_FILE_RETRIES` times, then added to the failed files (the dead-letter list,
+    see `failed_files`) without discarding the other files.
+
+    The utilisation of each stage (its busy time over the time of the bulk
+    ingestion, per worker) is logged after each bulk ingestion, and kept in
+    `stage_utilisation`: the bottleneck is the stage close to 100%.
+
+    With an `embedding_pool`, the embeddings are computed by its worker processes
+    instead of the embedding threads, which only split the documents into nodes.
     """
 
     NODE_FLUSH_COUNT = 5000  # Save the index every # nodes.
+    MAX_FILE_RETRIES = 2  # Retries of a file failing to be embedded or inserted
+    RETRY_DELAY = 1.0  # Seconds before the first retry, doubled on each retry
 
     def __init__(
         self,
@@ -418,19 +1231,34 @@ class PipelineIngestComponent(BaseIngestComponentWithIndex):
         transformations: list[TransformComponent],
         count_workers: int,
         *args: Any,
+        embedding_pool: EmbeddingWorkerPool | None = None,
         **kwargs: Any,
     ) -> None:
         super().__init__(storage_context, embed_model, transformations, *args, **kwargs)
         self.count_workers = count_workers
+        self.embedding_pool = embedding_pool
         assert (
             len(self.transformations) >= 2
         ), "Embeddings must be in the transformations"
         assert count_workers > 0, "count_workers must be > 0"
         self.count_workers = count_workers
+        # With an embedding pool, only the split stage runs in the threads
+        self._split_transformations, _ = _split_at_embedding(self.transformations)
         # We are doing our own multiprocessing
         # To do not collide with the multiprocessing of huggingface, we disable it
         os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+        # Created before the pipeline threads are started, not to fork them
+        self._file_to_documents_work_pool = multiprocessing.Pool(
+            processes=self.count_workers
+        )
+        self._stage_times = _StageTimes()
+        self.stage_utilisation: dict[str, float] = {}
+        self._count_failed = 0  # Files failed since the start, to find the new ones
+        self._failed_lock = threading.Lock()
+        # Callbacks of the files of the bulk ingestions running, by file name
+        self._file_done_callbacks: dict[str, FileDone] = {}
+
         # doc_q stores parsed files as Document chunks.
         # Using a shallow queue causes the filesystem parser to block
         # when it reaches capacity. This ensures it doesn't outpace the
@@ -462,6 +1290,8 @@ class PipelineIngestComponent(BaseIngestComponentWithIndex):
                         # Push CPU/GPU embedding work to the worker pool
                         # Acquire semaphore to control access to worker pool
                         self.doc_semaphore.acquire()
+                        if self.worker_throttle is not None:
+                            self.worker_throttle.acquire()
                         pool.apply_async(
                             self._doc_to_node_worker, (file_name, documents)
                         )
@@ -474,58 +1304,148 @@ class PipelineIngestComponent(BaseIngestComponentWithIndex):
     def _doc_to_node_worker(self, file_name: str, documents: list[Document]) -> None:
         # CPU/GPU intensive work in its own process
         try:
-            nodes = run_transformations(
-                documents,  # type: ignore[arg-type]
-                self.transformations,
-                show_progress=self.show_progress,
-            )
+            for attempt in range(self.MAX_FILE_RETRIES + 1):
+                start = time.perf_counter()
+                try:
+                    nodes = self._transform_documents(documents)
+                    break
+                except Exception as e:
+                    error = repr(e)
+                    logger.warning(
+                        "Embedding of file_name=%s failed (attempt %s): %s",
+                        file_name,
+                        attempt + 1,
+                        error,
+                    )
+                    if attempt < self.MAX_FILE_RETRIES:
+                        time.sleep(self.RETRY_DELAY * 2**attempt)
+                finally:
+                    self._stage_times.add("embed", time.perf_counter() - start)
+            else:
+                self._fail_file(file_name, "embed", error)
+                return
+            self._cache_nodes(documents, nodes)
             self.node_q.put(("process", file_name, documents, nodes))
         finally:
+            if self.worker_throttle is not None:
+                self.worker_throttle.release()
             self.doc_semaphore.release()
             self.doc_q.task_done()  # unblock Q joins
 
+    def _transform_documents(self, documents: list[Document]) -> list[BaseNode]:
+        if self.embedding_pool is None:
+            return run_transformations(
+                documents,  # type: ignore[arg-type]
+                self.transformations,
+                show_progress=self.show_progress,
+            )
+        # Split in this thread, embedded by the pool
+        nodes = run_transformations(
+            documents,  # type: ignore[arg-type]
+            self._split_transformations,
+            show_progress=self.show_progress,
+        )
+        embeddings = self.embedding_pool.embed(
+            [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        )
+        for node, embedding in zip(nodes, embeddings, strict=True):
+            node.embedding = embedding
+        return nodes
+
     def _save_docs(
-        self, files: list[str], documents: list[Document], nodes: list[BaseNode]
+        self, files: list[tuple[str, list[Document], list[BaseNode]]]
     ) -> None:
+        start = time.perf_counter()
         try:
             logger.info(
-                f"Saving {len(files)} files ({len(documents)} documents / {len(nodes)} nodes)"
+                f"Saving {len(files)} files ({sum(len(f[1]) for f in files)} documents"
+                f" / {sum(len(f[2]) for f in files)} nodes)"
             )
-            self._index.insert_nodes(nodes)
-            for document in documents:
-                self._index.docstore.set_document_hash(
-                    document.get_doc_id(), document.hash
-                )
-            self._save_index()
+            pending = list(files)
+            for attempt in range(self.MAX_FILE_RETRIES + 1):
+                if attempt > 0:
+                    # Not holding the index lock while waiting
+                    time.sleep(self.RETRY_DELAY * 2 ** (attempt - 1))
+                failed = []
+                inserted = []
+                with self._index_thread_lock:
+                    # Each file is inserted on its own, a file that fails does not
+                    # discard the others
+                    for file_name, documents, nodes in pending:
+                        error = self._insert_file(file_name, documents, nodes, attempt)
+                        if error is not None:
+                            failed.append(((file_name, documents, nodes), error))
+                        else:
+                            inserted.append((file_name, documents))
+                    self._save_index()
+                for file_name, documents in inserted:
+                    self._file_done(file_name, documents, None)
+                if not failed:
+                    break
+                pending = [file for file, _ in failed]
+            else:
+                for (file_name, _, _), error in failed:
+                    self._fail_file(file_name, "save", error)
         except Exception:
             # Tell the user so they can investigate these files
-            logger.exception(f"Processing files {files}")
+            logger.exception(f"Processing files {[f[0] for f in files]}")
         finally:
+            self._stage_times.add("write", time.perf_counter() - start)
             # Clearing work, even on exception, maintains a clean state.
-            nodes.clear()
-            documents.clear()
             files.clear()
 
+    def _insert_file(
+        self,
+        file_name: str,
+        documents: list[Document],
+        nodes: list[BaseNode],
+        attempt: int,
+    ) -> str | None:
+        """Insert the nodes of a file, returns the error if it failed."""
+        try:
+            nodes = self._merge_stored_duplicates(nodes)
+            self._index.insert_nodes(nodes)
+            for document in documents:
+                self._index.docstore.set_document_hash(
+                    document.get_doc_id(), document.hash
+                )
+            self.page_labels.add_documents(documents)
+            return None
+        except Exception as e:
+            error = repr(e)
+            logger.warning(
+                "Insertion of file_name=%s failed (attempt %s): %s",
+                file_name,
+                attempt + 1,
+                error,
+            )
+            try:
+                # Remove what was inserted before the failure
+                self._delete_ref_docs([document.doc_id for document in documents])
+            except Exception:
+                logger.exception("Cleaning up file_name=%s", file_name)
+            return error
+
     def _write_nodes(self) -> None:
         # Save nodes to index.  I/O intensive.
-        node_stack: list[BaseNode] = []
-        doc_stack: list[Document] = []
-        file_stack: list[str] = []
+        file_stack: list[tuple[str, list[Document], list[BaseNode]]] = []
+        count_nodes = 0
         while True:
             try:
                 cmd, file_name, documents, nodes = self.node_q.get(block=True)
                 if cmd in ("flush", "quit"):
                     if file_stack:
-                        self._save_docs(file_stack, doc_stack, node_stack)
+                        self._save_docs(file_stack)
+                        count_nodes = 0
                     if cmd == "quit":
                         break
                 elif cmd == "process":
-                    node_stack.extend(nodes)  # type: ignore[arg-type]
-                    doc_stack.extend(documents)  # type: ignore[arg-type]
-                    file_stack.append(file_name)  # type: ignore[arg-type]
+                    file_stack.append((file_name, documents, nodes))  # type: ignore[arg-type]
+                    count_nodes += len(nodes)  # type: ignore[arg-type]
                     # Constant saving is heavy on I/O - accumulate to a threshold
-                    if len(node_stack) >= self.NODE_FLUSH_COUNT:
-                        self._save_docs(file_stack, doc_stack, node_stack)
+                    if count_nodes >= self.NODE_FLUSH_COUNT:
+                        self._save_docs(file_stack)
+                        count_nodes = 0
             finally:
                 self.node_q.task_done()
 
@@ -536,24 +1456,140 @@ class PipelineIngestComponent(BaseIngestComponentWithIndex):
         self.node_q.join()
 
     def ingest(self, file_name: str, file_data: Path) -> list[Document]:
+        cached_documents = self._ingest_from_cache(file_name, file_data)
+        if cached_documents is not None:
+            return cached_documents
         documents = IngestionHelper.transform_file_into_documents(file_name, file_data)
+        return self._ingest_documents(file_name, documents)
+
+    def _ingest_documents(
+        self, file_name: str, documents: list[Document]
+    ) -> list[Document]:
+        count_failed_before = self._count_failed
         self.doc_q.put(("process", file_name, documents))
         self._flush()
+        for failed_file in self._failed_since(count_failed_before):
+            if failed_file.file_name == file_name:
+                raise ValueError(
+                    f"Could not ingest {file_name} at stage {failed_file.stage}: "
+                    f"{failed_file.error}"
+                )
         return documents
 
-    def bulk_ingest(self, files: list[tuple[str, Path]]) -> list[Document]:
-        docs = []
+    def _fail_file(self, file_name: str, stage: str, error: str) -> None:
+        # Files fail in the embedding threads and in the writer thread
+        with self._failed_lock:
+            super()._fail_file(file_name, stage, error)
+            self._count_failed += 1
+        self._file_done(file_name, [], error)
+
+    def _file_done(
+        self, file_name: str, documents: list[Document], error: str | None
+    ) -> None:
+        on_file_done = self._file_done_callbacks.pop(file_name, None)
+        if on_file_done is not None:
+            on_file_done(file_name, documents, error)
+
+    def _failed_since(self, count_failed_before: int) -> list[FailedFile]:
+        with self._failed_lock:
+            count = min(
+                self._count_failed - count_failed_before, len(self._failed_files)
+            )
+            return list(self._failed_files)[len(self._failed_files) - count :]
+
+    def bulk_ingest(
+        self, files: list[tuple[str, Path]], on_file_done: FileDone | None = None
+    ) -> list[Document]:
+        start = time.perf_counter()
+        busy_before = self._stage_times.snapshot()
+        count_failed_before = self._count_failed
+        docs, files = self._ingest_files_from_cache(files, on_file_done)
+        self._calibrate_workers(files)
+        if on_file_done is not None:
+            # Called by the writer thread, or by the stage the file failed at
+            for file_name, _ in files:
+                self._file_done_callbacks[file_name] = on_file_done
+        # The files are parsed by the worker processes, and queued for embedding as
+        # soon as they are parsed (not in order). At most two files per worker are
+        # parsed ahead: a full doc_q blocks this thread, hence the parsing.
+        parsed: Queue[tuple[str, list[Document] | str, float]] = Queue()
+        count_parsing = 0
         for file_name, file_data in eta(files):
-            try:
-                documents = IngestionHelper.transform_file_into_documents(
-                    file_name, file_data
-                )
-                self.doc_q.put(("process", file_name, documents))
-                docs.extend(documents)
-            except Exception:
-                logger.exception(f"Skipping {file_data.name}")
+            count_workers = (
+                self.worker_throttle.limit
+                if self.worker_throttle is not None
+                else self.count_workers
+            )
+            while count_parsing >= 2 * count_workers:
+                self._queue_parsed_file(parsed.get(), docs)
+                count_parsing -= 1
+            self._file_to_documents_work_pool.apply_async(
+                _transform_file_into_documents_timed,
+                (file_name, file_data),
+                callback=parsed.put,
+                error_callback=lambda e, f=file_name: parsed.put((f, repr(e), 0.0)),
+            )
+            count_parsing += 1
+        for _ in range(count_parsing):
+            self._queue_parsed_file(parsed.get(), docs)
         self._flush()
-        return docs
+        for file_name, _ in files:
+            self._file_done_callbacks.pop(file_name, None)
+        if files:
+            self._report_stage_utilisation(busy_before, time.perf_counter() - start)
+        failed_file_names = {
+            failed_file.file_name
+            for failed_file in self._failed_since(count_failed_before)
+        }
+        return [
+            doc for doc in docs if doc.metadata["file_name"] not in failed_file_names
+        ]
+
+    def _queue_parsed_file(
+        self,
+        parsed_file: tuple[str, list[Document] | str, float],
+        docs: list[Document],
+    ) -> None:
+        file_name, documents, parse_time = parsed_file
+        self._stage_times.add("parse", parse_time)
+        if isinstance(documents, str):
+            self._fail_file(file_name, "parse", documents)
+            return
+        self.doc_q.put(("process", file_name, documents))
+        docs.extend(documents)
+
+    def _report_stage_utilisation(
+        self, busy_before: dict[str, float], elapsed: float
+    ) -> None:
+        busy = self._stage_times.snapshot()
+        count_stage_workers = {
+            "parse": self.count_workers,
+            "embed": self.count_workers,
+            "write": 1,
+        }
+        self.stage_utilisation = {
+            stage: (busy.get(stage, 0.0) - busy_before.get(stage, 0.0))
+            / (elapsed * count_workers)
+            for stage, count_workers in count_stage_workers.items()
+        }
+        logger.info(
+            "Pipeline stage utilisation over %.1fs: %s",
+            elapsed,
+            ", ".join(
+                f"{stage}={utilisation:.0%}"
+                for stage, utilisation in self.stage_utilisation.items()
+            ),
+        )
+
+    def __del__(self) -> None:
+        # Using root logger to avoid the logger to be deleted before the pool
+        logging.debug("Closing the file to documents work pool")
+        self._file_to_documents_work_pool.close()
+        self._file_to_documents_work_pool.join()
+        self._file_to_documents_work_pool.terminate()
+        if self.embedding_pool is not None:
+            logging.debug("Closing the embedding work pool")
+            self.embedding_pool.close()
 
 
 def get_ingestion_component(
@@ -564,30 +1600,82 @@ def get_ingestion_component(
 ) -> BaseIngestComponent:
     """Get the ingestion component for the given configuration."""
     ingest_mode = settings.embedding.ingest_mode
+    ingest_cache = None
+    if settings.embedding.ingest_cache_size_mb > 0 and any(
+        isinstance(transformation, ChunkDeduplicator)
+        for transformation in transformations
+    ):
+        # The nodes of a file depend on the chunks already stored
+        logger.warning("The ingestion cache is disabled by the chunk deduplication")
+    elif settings.embedding.ingest_cache_size_mb > 0:
+        ingest_cache = IngestionCache(
+            cache_dir=local_data_path / "ingest_cache",
+            max_size_bytes=settings.embedding.ingest_cache_size_mb * 1024 * 1024,
+            transformations=transformations,
+        )
+    worker_throttle = None
+    if settings.embedding.count_workers == "auto":
+        worker_throttle = create_worker_throttle(settings.embedding.max_rss_mb)
+        count_workers = worker_throttle.max_workers
+    else:
+        count_workers = settings.embedding.count_workers
     if ingest_mode == "batch":
         return BatchIngestComponent(
             storage_context=storage_context,
             embed_model=embed_model,
             transformations=transformations,
-            count_workers=settings.embedding.count_workers,
+            count_workers=count_workers,
+            pages_per_shard=settings.embedding.pages_per_shard,
+            flush_node_count=settings.embedding.batch_flush_nodes,
+            flush_byte_count=settings.embedding.batch_flush_mb * 1024 * 1024,
+            ingest_cache=ingest_cache,
+            worker_throttle=worker_throttle,
         )
     elif ingest_mode == "parallel":
         return ParallelizedIngestComponent(
             storage_context=storage_context,
             embed_model=embed_model,
             transformations=transformations,
-            count_workers=settings.embedding.count_workers,
+            count_workers=count_workers,
+            pages_per_shard=settings.embedding.pages_per_shard,
+            ingest_cache=ingest_cache,
+            worker_throttle=worker_throttle,
         )
     elif ingest_mode == "pipeline":
         return PipelineIngestComponent(
             storage_context=storage_context,
             embed_model=embed_model,
             transformations=transformations,
-            count_workers=settings.embedding.count_workers,
+            count_workers=count_workers,
+            ingest_cache=ingest_cache,
+            worker_throttle=worker_throttle,
+        )
+    elif ingest_mode == "process":
+        return PipelineIngestComponent(
+            storage_context=storage_context,
+            embed_model=embed_model,
+            transformations=transformations,
+            count_workers=count_workers,
+            ingest_cache=ingest_cache,
+            worker_throttle=worker_throttle,
+            embedding_pool=EmbeddingWorkerPool(
+                functools.partial(create_embedding_model, settings),
+                # Each worker loads its own model, one per core would not fit
+                count_workers=(
+                    count_workers
+                    if worker_throttle is None
+                    else count_embedding_workers(
+                        settings.embedding.torch_threads,
+                        settings.embedding.embedding_worker_mb,
+                    )
+                ),
+                torch_threads=settings.embedding.torch_threads,
+            ),
         )
     else:
         return SimpleIngestComponent(
             storage_context=storage_context,
             embed_model=embed_model,
             transformations=transformations,
+            ingest_cache=ingest_cache,
         )
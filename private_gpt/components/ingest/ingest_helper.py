@@ -1,20 +1,18 @@
+import hashlib
+import importlib
 import logging
+import threading
 from pathlib import Path
 
 from llama_index.core.readers import StringIterableReader
 from llama_index.core.readers.base import BaseReader
-from llama_index.core.readers.json import JSONReader
 from llama_index.core.schema import Document
 
-from llama_index.readers.file.docs import (  # type: ignore
-            PDFReader,
-        )
-from typing import List
+from typing import Any, List
 
 logger = logging.getLogger(__name__)
 
 import io
-import fitz  # PyMuPDF library
 
 class DocumentWithBlobs(Document):
     doc_blobs: list[bytes] = []
@@ -23,48 +21,75 @@ class DocumentWithBlobs(Document):
         super().__init__(**data)
         self.doc_blobs = data.get('doc_blobs', [])
 
-from typing import List, Optional, Dict
-from llama_index.readers.file.docs import PDFReader
-
-
-import pdfplumber
-def list_pages(file_path: str) -> list:
-
-    pages_num=[]
-    with pdfplumber.open(file_path) as pdf:
-        for i in range(len(pdf.pages)):
-            page_num=pdf.pages[i].extract_text().split('\n')[-1]
-            if(sum([not v.isnumeric() for v in page_num.split('-')])):
-                page_num=str(i+1)
-
-            # print(page_num)
-            pages_num.append(page_num)
-    print(pages_num)
-    return pages_num
-
-
-# def list_pages(docs: list[Document]) -> list:
-#     pages_num=[]
-#     # with open(file_path, "rb") as fp:
-#     #     pdf_reader = PDFReader()
-#     #     docs=pdf_reader.load_data(file_path)
-#     for doc in docs:
-#         page_num=doc.text.split('\n')[-1]
-#         if('-' in page_num):
-#             section_len=len(page_num.split('-')[0])
-#             page_num=page_num[:-section_len]
-#             if(sum([not v.isnumeric() for v in page_num.split('-')])):
-#                 page_num=doc.metadata['page_label']
-#         else:
-#             page_num=doc.metadata['page_label']
-
-#         pages_num.append(page_num)
-#     return pages_num
-def update_page_numbers(docs: list[Document], file_path: str):
-    pages_num = list_pages(file_path)
-    # Iterate over the documents and update the page_label metadata
-    for i, doc in enumerate(docs):
-        doc.metadata['page_label'] = pages_num[i]
+
+def printed_page_label(page_text: str, page_index: int) -> str:
+    """Return the page label printed at the bottom of a manual page.
+
+    Manual pages end with a label such as "4-11" (section-page). When the last
+    line of the page is not such a label, the 1-based page number is used.
+    """
+    lines = [line.strip() for line in page_text.splitlines() if line.strip()]
+    page_label = lines[-1] if lines else ""
+    if not page_label or sum(not v.isnumeric() for v in page_label.split("-")):
+        page_label = str(page_index + 1)
+    return page_label
+
+
+def page_content_hash(page_text: str, page_label: str | None) -> str:
+    """SHA-256 of the text of a page, without its printed page label.
+
+    Inserting or removing a page renumbers the next ones: they keep their hash.
+    """
+    lines = page_text.splitlines()
+    if page_label:
+        lines = [line for line in lines if line.strip() != page_label]
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def pdf_page_label(page: Any, page_index: int) -> str:
+    """Return the page label printed at the bottom of a PyMuPDF page."""
+    # The blocks sorted top to bottom put the page footer last
+    text_blocks = [
+        block[4] for block in page.get_text("blocks", sort=True) if block[6] == 0
+    ]
+    return printed_page_label(text_blocks[-1] if text_blocks else "", page_index)
+
+
+class PDFPageLabelReader(BaseReader):
+    """PDF parser reading the page text and the printed page label in one pass.
+
+    Each page becomes its own Document, with its `page_label` (e.g. "4-11") and
+    its 0-based `page_index` in the metadata. A `pages` range (first page
+    included, last page excluded) can be given to only read a part of the file.
+    """
+
+    def load_data(
+        self,
+        file: Path,
+        extra_info: dict[str, Any] | None = None,
+        pages: tuple[int, int] | None = None,
+    ) -> list[Document]:
+        """Parse file."""
+        import fitz  # type: ignore
+
+        file = Path(file)
+        docs = []
+        with fitz.open(file) as pdf_doc:
+            first_page, last_page = pages or (0, pdf_doc.page_count)
+            for page_index in range(first_page, min(last_page, pdf_doc.page_count)):
+                page = pdf_doc[page_index]
+                # The text keeps the reading order of the (multi column) page
+                page_text = page.get_text()
+                metadata = {
+                    "page_label": pdf_page_label(page, page_index),
+                    "page_index": page_index,
+                    "file_name": file.name,
+                }
+                if extra_info is not None:
+                    metadata.update(extra_info)
+                docs.append(Document(text=page_text, metadata=metadata))
+        return docs
+
 
 # class CustomPDFReader(PDFReader):
 #     """Custom PDF parser."""
@@ -103,6 +128,8 @@ class PyMuPDFReader:
 
     def load_data(self, file_path: str) -> list:
         """Parse file."""
+        import fitz  # type: ignore
+
         docs = []
 
         # Load the file using PyMuPDF
@@ -150,55 +177,83 @@ class PyMuPDFReader:
         return docs
 
 
-# Inspired by the `llama_index.core.readers.file.base` module
-def _try_loading_included_file_formats() -> dict[str, type[BaseReader]]:
-    try:
-        from llama_index.readers.file.docs import (  # type: ignore
-            DocxReader,
-            HWPReader,
-            PDFReader,
-        )
-        from llama_index.readers.file.epub import EpubReader  # type: ignore
-        from llama_index.readers.file.image import ImageReader  # type: ignore
-        from llama_index.readers.file.ipynb import IPYNBReader  # type: ignore
-        from llama_index.readers.file.markdown import MarkdownReader  # type: ignore
-        from llama_index.readers.file.mbox import MboxReader  # type: ignore
-        from llama_index.readers.file.slides import PptxReader  # type: ignore
-        from llama_index.readers.file.tabular import PandasCSVReader  # type: ignore
-        from llama_index.readers.file.video_audio import (  # type: ignore
-            VideoAudioReader,
-        )
-    except ImportError as e:
-        raise ImportError("`llama-index-readers-file` package not found") from e
+class FileReaderRegistry:
+    """File readers to use for each file extension.
 
-    default_file_reader_cls: dict[str, type[BaseReader]] = {
-        ".hwp": HWPReader,
-        ".pdf": PDFReader,
-        # ".pdf": PyMuPDFReader,
-        # ".pdf": CustomPDFReader,
-        ".docx": DocxReader,
-        ".pptx": PptxReader,
-        ".ppt": PptxReader,
-        ".pptm": PptxReader,
-        ".jpg": ImageReader,
-        ".png": ImageReader,
-        ".jpeg": ImageReader,
-        ".mp3": VideoAudioReader,
-        ".mp4": VideoAudioReader,
-        ".csv": PandasCSVReader,
-        ".epub": EpubReader,
-        ".md": MarkdownReader,
-        ".mbox": MboxReader,
-        ".ipynb": IPYNBReader,
-    }
-    return default_file_reader_cls
+    Importing a reader can be slow (and can pull heavy dependencies), so readers
+    are given as "module:class" paths, imported the first time a file with their
+    extension is seen. A single instance of each reader is kept per process.
+    """
+
+    def __init__(self, readers: dict[str, "type[BaseReader] | str"]) -> None:
+        self._readers = dict(readers)
+        self._reader_instances: dict[str, BaseReader] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, extension: str) -> bool:
+        return extension in self._readers
+
+    def extensions(self) -> list[str]:
+        return list(self._readers)
+
+    def register(self, extension: str, reader: "type[BaseReader] | str") -> None:
+        with self._lock:
+            self._readers[extension] = reader
+            self._reader_instances.pop(extension, None)
+
+    def get_reader_cls(self, extension: str) -> type[BaseReader] | None:
+        """Get the reader class of an extension, importing it if needed."""
+        reader = self._readers.get(extension)
+        if not isinstance(reader, str):
+            return reader
+        module_name, _, class_name = reader.partition(":")
+        try:
+            reader_cls: type[BaseReader] = getattr(
+                importlib.import_module(module_name), class_name
+            )
+        except ImportError as e:
+            raise ImportError(
+                f"Reader for extension={extension} not found, "
+                "`llama-index-readers-file` package might be missing"
+            ) from e
+        self._readers[extension] = reader_cls
+        return reader_cls
+
+    def get_reader(self, extension: str) -> BaseReader | None:
+        """Get the (per process) reader instance of an extension."""
+        with self._lock:
+            if extension not in self._reader_instances:
+                reader_cls = self.get_reader_cls(extension)
+                if reader_cls is None:
+                    return None
+                logger.debug("Creating reader=%s", reader_cls.__name__)
+                self._reader_instances[extension] = reader_cls()
+            return self._reader_instances[extension]
 
 
-# Patching the default file reader to support other file types
-FILE_READER_CLS = _try_loading_included_file_formats()
-FILE_READER_CLS.update(
+# Inspired by the `llama_index.core.readers.file.base` module
+FILE_READERS = FileReaderRegistry(
     {
-        ".json": JSONReader,
+        ".hwp": "llama_index.readers.file.docs:HWPReader",
+        ".pdf": PDFPageLabelReader,
+        # ".pdf": PyMuPDFReader,
+        # ".pdf": CustomPDFReader,
+        ".docx": "llama_index.readers.file.docs:DocxReader",
+        ".pptx": "llama_index.readers.file.slides:PptxReader",
+        ".ppt": "llama_index.readers.file.slides:PptxReader",
+        ".pptm": "llama_index.readers.file.slides:PptxReader",
+        ".jpg": "llama_index.readers.file.image:ImageReader",
+        ".png": "llama_index.readers.file.image:ImageReader",
+        ".jpeg": "llama_index.readers.file.image:ImageReader",
+        ".mp3": "llama_index.readers.file.video_audio:VideoAudioReader",
+        ".mp4": "llama_index.readers.file.video_audio:VideoAudioReader",
+        ".csv": "llama_index.readers.file.tabular:PandasCSVReader",
+        ".epub": "llama_index.readers.file.epub:EpubReader",
+        ".md": "llama_index.readers.file.markdown:MarkdownReader",
+        ".mbox": "llama_index.readers.file.mbox:MboxReader",
+        ".ipynb": "llama_index.readers.file.ipynb:IPYNBReader",
+        # Patching the default file readers to support other file types
+        ".json": "llama_index.core.readers.json:JSONReader",
     }
 )
 
@@ -212,20 +267,62 @@ class IngestionHelper:
 
     @staticmethod
     def transform_file_into_documents(
-        file_name: str, file_data: Path
+        file_name: str, file_data: Path, pages: tuple[int, int] | None = None
     ) -> list[Document]:
-        documents = IngestionHelper._load_file_to_documents(file_name, file_data)
+        documents = IngestionHelper._load_file_to_documents(
+            file_name, file_data, pages
+        )
         for document in documents:
             document.metadata["file_name"] = file_name
+            # Content hash, to only re-ingest the pages that changed
+            document.metadata["page_hash"] = page_content_hash(
+                document.text, document.metadata.get("page_label")
+            )
         IngestionHelper._exclude_metadata(documents)
         return documents
 
     @staticmethod
-    def _load_file_to_documents(file_name: str, file_data: Path) -> list[Document]:
+    def split_into_page_ranges(
+        file_name: str, file_data: Path, pages_per_shard: int
+    ) -> list[tuple[int, int] | None]:
+        """Split a file into page ranges that can be parsed independently.
+
+        Only PDF files are split. Any other file, or a PDF file that is not longer
+        than `pages_per_shard`, is returned as a single `None` range (whole file).
+        Passing each range to `transform_file_into_documents` and concatenating the
+        results in order gives the same documents as parsing the whole file.
+        """
+        extension = Path(file_name).suffix
+        if (
+            pages_per_shard <= 0
+            or FILE_READERS.get_reader_cls(extension) is not PDFPageLabelReader
+        ):
+            return [None]
+        import fitz  # type: ignore
+
+        with fitz.open(file_data) as pdf_doc:
+            page_count = pdf_doc.page_count
+        if page_count <= pages_per_shard:
+            return [None]
+        logger.debug(
+            "Splitting file_name=%s of count=%s pages into shards of %s pages",
+            file_name,
+            page_count,
+            pages_per_shard,
+        )
+        return [
+            (first_page, min(first_page + pages_per_shard, page_count))
+            for first_page in range(0, page_count, pages_per_shard)
+        ]
+
+    @staticmethod
+    def _load_file_to_documents(
+        file_name: str, file_data: Path, pages: tuple[int, int] | None = None
+    ) -> list[Document]:
         logger.debug("Transforming file_name=%s into documents", file_name)
         extension = Path(file_name).suffix
-        reader_cls = FILE_READER_CLS.get(extension)
-        if reader_cls is None:
+        reader = FILE_READERS.get_reader(extension)
+        if reader is None:
             logger.debug(
                 "No reader found for extension=%s, using default string reader",
                 extension,
@@ -236,9 +333,9 @@ class IngestionHelper:
 
         logger.debug("Specific reader found for extension=%s", extension)
         # print(file_data, type(file_data))
-        docs = reader_cls().load_data(file_data)
-        update_page_numbers(docs, file_data) #ASHUTOSH
-        return docs
+        if pages is not None:
+            return reader.load_data(file_data, pages=pages)
+        return reader.load_data(file_data)
 
     @staticmethod
     def _exclude_metadata(documents: list[Document]) -> None:
@@ -246,6 +343,16 @@ class IngestionHelper:
         for document in documents:
             document.metadata["doc_id"] = document.doc_id
             # We don't want the Embeddings search to receive this metadata
-            document.excluded_embed_metadata_keys = ["doc_id"]
+            document.excluded_embed_metadata_keys = [
+                "doc_id",
+                "page_index",
+                "page_hash",
+            ]
             # We don't want the LLM to receive these metadata in the context
-            document.excluded_llm_metadata_keys = ["file_name", "doc_id", "page_label"]
+            document.excluded_llm_metadata_keys = [
+                "file_name",
+                "doc_id",
+                "page_label",
+                "page_index",
+                "page_hash",
+            ]
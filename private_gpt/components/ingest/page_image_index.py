@@ -0,0 +1,164 @@
+"""ANN index over the image embeddings of the pages of every PDF file.
+
+A single faiss index holds the page image embeddings of all the files, so that
+a chat query does one top-k search (optionally restricted to some files) instead
+of a brute-force search over the embeddings of each file. The index is flat (on
+the cosine similarity): the pages of thousands of manuals are searched exactly
+in milliseconds, without training (and re-training, as manuals are added) an IVF
+index.
+
+The index is built from the `ImageEmbeddingStore` when first used, then kept up
+to date as the files are embedded or deleted.
+"""
+
+import logging
+import threading
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import numpy as np
+
+from private_gpt.components.ingest.page_images import (
+    ImageEmbeddingStore,
+    PageImageEmbeddings,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PageImageHit(NamedTuple):
+    """A page found by a search of the index."""
+
+    pdf_name: str
+    page: int  # 0-based
+    label: str
+    image_path: Path
+    score: float  # Cosine similarity with the query
+
+
+class _IndexedFile(NamedTuple):
+    first_id: int  # The ids of its pages follow, in the order of the rows
+    page_images: PageImageEmbeddings
+
+
+class PageImageIndex:
+    """One faiss index over the page image embeddings of all the files.
+
+    These methods are thread-safe.
+    """
+
+    def __init__(self, store: ImageEmbeddingStore) -> None:
+        self._store = store
+        self._lock = threading.Lock()
+        self._index: Any = None  # faiss index, created when first used
+        self._loaded = False
+        self._files: dict[str, _IndexedFile] = {}
+        self._file_by_id: dict[int, str] = {}
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._file_by_id)
+
+    def add(self, pdf_name: str, page_images: PageImageEmbeddings) -> None:
+        """Index the pages of a file, replacing its pages already indexed."""
+        with self._lock:
+            self._load()
+            self._remove(pdf_name)
+            self._add(pdf_name, page_images)
+
+    def remove(self, pdf_name: str) -> None:
+        with self._lock:
+            self._load()
+            self._remove(pdf_name)
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int,
+        pdf_names: list[str] | None = None,
+    ) -> list[PageImageHit]:
+        """Pages most similar to the query, best first, from the given files only."""
+        import faiss  # type: ignore
+
+        with self._lock:
+            self._load()
+            if self._index is None:
+                return []
+            params = None
+            if pdf_names is not None:
+                files = [self._files[name] for name in pdf_names if name in self._files]
+                if not files:
+                    return []
+                ids = np.concatenate(
+                    [
+                        np.arange(f.first_id, f.first_id + len(f.page_images))
+                        for f in files
+                    ]
+                ).astype(np.int64)
+                # Referenced until the search is done, faiss does not own it
+                selector = faiss.IDSelectorBatch(ids)
+                params = faiss.SearchParameters()
+                params.sel = selector
+            query = np.array(query_embedding, dtype=np.float32).reshape(1, -1)
+            faiss.normalize_L2(query)
+            scores, ids = self._index.search(query, top_k, params=params)
+            hits = []
+            for score, page_id in zip(scores[0], ids[0], strict=True):
+                if page_id < 0:  # Fewer than top_k pages
+                    break
+                pdf_name = self._file_by_id[int(page_id)]
+                indexed_file = self._files[pdf_name]
+                row = int(page_id) - indexed_file.first_id
+                page = indexed_file.page_images.pages[row]
+                hits.append(
+                    PageImageHit(
+                        pdf_name=pdf_name,
+                        page=page["page"],
+                        label=page["label"],
+                        image_path=indexed_file.page_images.image_path(row),
+                        score=float(score),
+                    )
+                )
+            return hits
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        for pdf_name, page_images in self._store.load_all():
+            self._add(pdf_name, page_images)
+        logger.info(
+            "Loaded the page image index with count=%s pages of count=%s files",
+            len(self._file_by_id),
+            len(self._files),
+        )
+
+    def _add(self, pdf_name: str, page_images: PageImageEmbeddings) -> None:
+        import faiss  # type: ignore
+
+        if not len(page_images):
+            return
+        # Copied out of the memory map, normalized for the cosine similarity
+        embeddings = np.array(page_images.embeddings, dtype=np.float32, order="C")
+        faiss.normalize_L2(embeddings)
+        if self._index is None:
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(embeddings.shape[1]))
+        first_id = self._next_id
+        self._next_id += len(page_images)
+        ids = np.arange(first_id, self._next_id, dtype=np.int64)
+        self._index.add_with_ids(embeddings, ids)
+        self._files[pdf_name] = _IndexedFile(first_id, page_images)
+        self._file_by_id.update(dict.fromkeys(ids.tolist(), pdf_name))
+
+    def _remove(self, pdf_name: str) -> None:
+        import faiss  # type: ignore
+
+        indexed_file = self._files.pop(pdf_name, None)
+        if indexed_file is None:
+            return
+        last_id = indexed_file.first_id + len(indexed_file.page_images)
+        self._index.remove_ids(faiss.IDSelectorRange(indexed_file.first_id, last_id))
+        for page_id in range(indexed_file.first_id, last_id):
+            del self._file_by_id[page_id]
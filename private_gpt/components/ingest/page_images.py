@@ -0,0 +1,224 @@
+"""Page images of the PDF files, and their image embeddings.
+
+The image embeddings of each PDF file are stored in a folder of their own:
+
+* `embeddings.npy`: the embeddings, a float32 matrix with one row per page,
+  memory-mapped when loaded;
+* `pages.json`: the PDF file, 0-based page index, printed page label and page
+  image SHA-256 of each row;
+* `pages/<row>.png`: the page images, for display.
+
+Loading the image embeddings of a file neither reads the page images nor copies
+the embeddings. The pages are rendered (see `page_renderer`) and embedded by
+batches, the page images of a batch are written as soon as it is embedded.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from collections.abc import Callable, Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+from private_gpt.components.ingest.page_renderer import RenderedBatch
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+PAGES_FILE = "pages.json"
+IMAGES_FOLDER = "pages"
+
+
+class PageImageEmbeddings:
+    """Image embeddings of the pages of a PDF file, loaded from the store."""
+
+    def __init__(self, folder: Path) -> None:
+        self.folder = folder
+        self.pages: list[dict[str, Any]] = json.loads((folder / PAGES_FILE).read_text())
+        self.embeddings: np.ndarray = (
+            np.load(folder / EMBEDDINGS_FILE, mmap_mode="r")
+            if self.pages
+            else np.empty((0, 0), dtype=np.float32)  # An empty file can't be mapped
+        )
+        self._rows = {page["page"]: row for row, page in enumerate(self.pages)}
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    @property
+    def key(self) -> str:
+        """Key of the file in the store (see `ImageEmbeddingStore.key`)."""
+        return self.folder.name
+
+    def row(self, page_index: int) -> int | None:
+        """Row of the page at the given 0-based index, None if it is not embedded."""
+        return self._rows.get(page_index)
+
+    def image_path(self, row: int) -> Path:
+        return self.folder / IMAGES_FOLDER / f"{row}.png"
+
+    def image(self, row: int) -> Image.Image:
+        return Image.open(self.image_path(row))
+
+    def image_hash(self, row: int) -> str:
+        """SHA-256 of the page image (PNG) of a row."""
+        image_hash = self.pages[row].get("sha256")
+        if image_hash is None:  # Stored before the hashes were recorded
+            image_hash = hashlib.sha256(self.image_path(row).read_bytes()).hexdigest()
+            self.pages[row]["sha256"] = image_hash
+        return str(image_hash)
+
+
+class ImageEmbeddingStore:
+    """Image embeddings of the pages of the PDF files, one folder per file.
+
+    A file embedded again replaces its previous embeddings with two renames: the
+    readers never see a partially written folder, but may find no embeddings for
+    the file between the two renames.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    @staticmethod
+    def key(pdf_name: str) -> str:
+        """Key of a file in the store, the name of its folder."""
+        # File names can hold any character, the folder is named after their hash
+        return hashlib.sha256(pdf_name.encode()).hexdigest()
+
+    def _folder(self, pdf_name: str) -> Path:
+        return self.root / self.key(pdf_name)
+
+    def add(
+        self,
+        pdf_name: str,
+        batches: Iterable[RenderedBatch],
+        encode: Callable[[list[Image.Image]], Any],
+        kept: dict[int, tuple[int, str]] | None = None,
+    ) -> PageImageEmbeddings:
+        """Embed batches of rendered pages, releasing each batch once it is stored.
+
+        Replaces the image embeddings of the file, if any. `kept` maps the 0-based
+        index of embedded pages to keep to their new index and label: their image
+        and embedding are reused, instead of rendering and embedding them again.
+        """
+        folder = self._folder(pdf_name)
+        tmp_folder = self.root / f".{folder.name}.{uuid.uuid4().hex}.tmp"
+        (tmp_folder / IMAGES_FOLDER).mkdir(parents=True)
+        try:
+            pages: list[dict[str, Any]] = []
+            embeddings: list[np.ndarray] = []
+            if kept:
+                self._keep_pages(pdf_name, kept, tmp_folder, pages, embeddings)
+            for batch in batches:
+                embeddings.append(np.asarray(encode(batch.images), dtype=np.float32))
+                for page_index, page_label, encoded_image in zip(
+                    batch.page_indexes,
+                    batch.page_labels,
+                    batch.encoded_images,
+                    strict=True,
+                ):
+                    image_path = tmp_folder / IMAGES_FOLDER / f"{len(pages)}.png"
+                    image_path.write_bytes(encoded_image)
+                    pages.append(
+                        {
+                            "pdf": pdf_name,
+                            "page": page_index,
+                            "label": page_label,
+                            "sha256": hashlib.sha256(encoded_image).hexdigest(),
+                        }
+                    )
+                logger.debug("Embedded count=%s page images", len(pages))
+                del batch  # Not to hold two batches while the next one is rendered
+            if embeddings:
+                np.save(tmp_folder / EMBEDDINGS_FILE, np.concatenate(embeddings))
+            (tmp_folder / PAGES_FILE).write_text(json.dumps(pages))
+            self._replace(folder, tmp_folder)
+        except BaseException:
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            raise
+        logger.info(
+            "Stored count=%s page image embeddings of pdf_name=%s", len(pages), pdf_name
+        )
+        return PageImageEmbeddings(folder)
+
+    def _keep_pages(
+        self,
+        pdf_name: str,
+        kept: dict[int, tuple[int, str]],
+        tmp_folder: Path,
+        pages: list[dict[str, Any]],
+        embeddings: list[np.ndarray],
+    ) -> None:
+        previous = self.load(pdf_name)
+        if previous is None:
+            return
+        rows = []
+        for previous_index, (page_index, page_label) in sorted(kept.items()):
+            row = previous.row(previous_index)
+            if row is None:
+                continue
+            image_path = tmp_folder / IMAGES_FOLDER / f"{len(pages)}.png"
+            try:
+                # The previous folder is deleted once replaced, not the linked image
+                os.link(previous.image_path(row), image_path)
+            except OSError:
+                shutil.copyfile(previous.image_path(row), image_path)
+            pages.append(
+                {
+                    "pdf": pdf_name,
+                    "page": page_index,
+                    "label": page_label,
+                    "sha256": previous.image_hash(row),
+                }
+            )
+            rows.append(row)
+        if rows:
+            embeddings.append(np.asarray(previous.embeddings[rows], dtype=np.float32))
+        logger.debug("Kept count=%s page image embeddings", len(rows))
+
+    def load(self, pdf_name: str) -> PageImageEmbeddings | None:
+        """Image embeddings of a file, None if it was not embedded."""
+        return self.load_by_key(self.key(pdf_name))
+
+    def load_by_key(self, key: str) -> PageImageEmbeddings | None:
+        """Image embeddings of a file, by the key of the file (see `key`)."""
+        # Not to read outside of the store, the key comes from URLs
+        if not key.isalnum():
+            return None
+        folder = self.root / key
+        if not (folder / PAGES_FILE).exists():
+            return None
+        return PageImageEmbeddings(folder)
+
+    def load_all(self) -> Iterator[tuple[str, PageImageEmbeddings]]:
+        """Image embeddings of every file with embedded pages, with its name."""
+        if not self.root.exists():
+            return
+        for folder in self.root.iterdir():
+            # The folders being written or replaced start with a dot
+            if folder.name.startswith(".") or not (folder / PAGES_FILE).exists():
+                continue
+            page_images = PageImageEmbeddings(folder)
+            if page_images.pages:
+                yield page_images.pages[0]["pdf"], page_images
+
+    def delete(self, pdf_name: str) -> None:
+        shutil.rmtree(self._folder(pdf_name), ignore_errors=True)
+
+    def _replace(self, folder: Path, tmp_folder: Path) -> None:
+        # Not atomic: `folder` is missing between the two renames
+        old_folder = None
+        if folder.exists():
+            old_folder = folder.with_name(f".{folder.name}.{uuid.uuid4().hex}.old")
+            folder.rename(old_folder)
+        tmp_folder.rename(folder)
+        if old_folder is not None:
+            # The embeddings mapped by a reader stay readable until it drops them
+            shutil.rmtree(old_folder, ignore_errors=True)
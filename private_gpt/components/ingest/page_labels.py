@@ -0,0 +1,131 @@
+"""Printed page label <-> page index mapping of the ingested files.
+
+The mapping is built once at ingestion time (from the `page_label` and
+`page_index` metadata set by the PDF reader) and stored in a dedicated collection
+of the docstore key-value store, so that it is persisted together with the
+docstore. Lookups never need to open the original file again.
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from typing import Any
+
+from llama_index.core.schema import Document
+from llama_index.core.storage.docstore import BaseDocumentStore
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.kvstore import SimpleKVStore
+from llama_index.core.storage.kvstore.types import BaseKVStore
+
+logger = logging.getLogger(__name__)
+
+PAGE_LABELS_COLLECTION_SUFFIX = "/page_labels"
+
+
+class PageLabels:
+    """Page label <-> page index mapping of one ingested file."""
+
+    def __init__(self, file_name: str, pages: list[dict[str, Any]]) -> None:
+        self.file_name = file_name
+        self.pages = sorted(pages, key=lambda page: page["page_index"])
+        self._index_by_label: dict[str, int] = {}
+        for page in self.pages:
+            # A label printed on several pages maps to the first of them
+            self._index_by_label.setdefault(page["page_label"], page["page_index"])
+        self._label_by_index: dict[int, str] = {
+            page["page_index"]: page["page_label"] for page in self.pages
+        }
+
+    def page_index(self, page_label: str) -> int | None:
+        """0-based index of the page printed with the given label."""
+        return self._index_by_label.get(page_label)
+
+    def page_label(self, page_index: int) -> str | None:
+        """Label printed on the page at the given 0-based index."""
+        return self._label_by_index.get(page_index)
+
+
+class PageLabelIndex:
+    """Page labels of every ingested file, persisted alongside the docstore.
+
+    These methods are thread-safe.
+    """
+
+    def __init__(self, docstore: BaseDocumentStore) -> None:
+        self._kvstore: BaseKVStore
+        if isinstance(docstore, KVDocumentStore):
+            # Share the docstore key-value store so that the labels are persisted
+            # (and wiped) together with the documents
+            self._kvstore = docstore._kvstore
+            self._collection = f"{docstore._namespace}{PAGE_LABELS_COLLECTION_SUFFIX}"
+        else:
+            logger.warning(
+                "Docstore type=%s has no key-value store, page labels will not be "
+                "persisted",
+                type(docstore).__name__,
+            )
+            self._kvstore = SimpleKVStore()
+            self._collection = PAGE_LABELS_COLLECTION_SUFFIX
+        self._lock = threading.Lock()
+        self._cache: dict[str, PageLabels | None] = {}
+
+    def get(self, file_name: str) -> PageLabels | None:
+        with self._lock:
+            return self._get(file_name)
+
+    def add_documents(self, documents: list[Document]) -> None:
+        """Record the page labels of the given (page) documents."""
+        pages_by_file: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        for document in documents:
+            metadata = document.metadata
+            if "page_label" not in metadata or "page_index" not in metadata:
+                continue
+            pages_by_file[metadata["file_name"]].append(
+                {
+                    "page_index": metadata["page_index"],
+                    "page_label": metadata["page_label"],
+                    "doc_id": document.doc_id,
+                }
+            )
+        with self._lock:
+            for file_name, pages in pages_by_file.items():
+                existing = self._get(file_name)
+                new_indexes = {page["page_index"] for page in pages}
+                if existing is not None:
+                    pages += [
+                        page
+                        for page in existing.pages
+                        if page["page_index"] not in new_indexes
+                    ]
+                self._put(file_name, pages)
+
+    def delete_documents(self, file_name: str, doc_ids: set[str]) -> None:
+        """Forget the pages of a file backed by the given documents."""
+        with self._lock:
+            existing = self._get(file_name)
+            if existing is None:
+                return
+            pages = [page for page in existing.pages if page["doc_id"] not in doc_ids]
+            if pages:
+                self._put(file_name, pages)
+            else:
+                self._kvstore.delete(file_name, collection=self._collection)
+                self._cache[file_name] = None
+
+    def delete_file(self, file_name: str) -> None:
+        """Forget all the pages of a file."""
+        with self._lock:
+            self._kvstore.delete(file_name, collection=self._collection)
+            self._cache[file_name] = None
+
+    def _get(self, file_name: str) -> PageLabels | None:
+        if file_name not in self._cache:
+            stored = self._kvstore.get(file_name, collection=self._collection)
+            self._cache[file_name] = (
+                PageLabels(file_name, stored["pages"]) if stored else None
+            )
+        return self._cache[file_name]
+
+    def _put(self, file_name: str, pages: list[dict[str, Any]]) -> None:
+        self._kvstore.put(file_name, {"pages": pages}, collection=self._collection)
+        self._cache[file_name] = PageLabels(file_name, pages)
@@ -0,0 +1,171 @@
+"""Render the pages of the PDF files for their image embeddings, with PyMuPDF.
+
+The pages used to be rendered with pdf2image, spawning a poppler `pdftoppm`
+subprocess per batch of pages, writing PPM files and reading them back. The
+`PageRenderer` renders them in process with PyMuPDF instead, in worker processes
+rendering batches of pages in parallel.
+
+Each page is rendered at two resolutions:
+
+* a low one, for the image embedding model (CLIP shrinks the pages to 224 pixels
+  anyway);
+* a high one, for display, compressed to PNG in the worker process.
+"""
+
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from collections.abc import Iterator
+from multiprocessing.pool import AsyncResult, Pool
+from pathlib import Path
+from typing import NamedTuple
+
+from PIL import Image
+
+from private_gpt.components.ingest.ingest_helper import pdf_page_label
+
+logger = logging.getLogger(__name__)
+
+# A page rendered by a worker: the size and RGB pixels of its low resolution
+# image, its high resolution image as PNG, and its printed label
+RenderedPage = tuple[tuple[int, int], bytes, bytes, str]
+
+
+class RenderedBatch(NamedTuple):
+    """A batch of rendered pages, in page order."""
+
+    images: list[Image.Image]  # Low resolution, to embed
+    encoded_images: list[bytes]  # High resolution as PNG, to display
+    page_indexes: list[int]  # 0-based
+    page_labels: list[str]
+
+
+def _render_pages(
+    pdf_path: str, page_indexes: list[int], embedding_dpi: int, display_dpi: int
+) -> list[RenderedPage]:
+    """Render the pages of a PDF file at the given 0-based indexes."""
+    import fitz  # type: ignore
+
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for index in page_indexes:
+            page = doc[index]
+            small = page.get_pixmap(dpi=embedding_dpi)
+            display = page.get_pixmap(dpi=display_dpi)
+            pages.append(
+                (
+                    (small.width, small.height),
+                    small.samples,
+                    display.tobytes("png"),
+                    pdf_page_label(page, index),
+                )
+            )
+            del display  # Not to hold the raw high resolution images of the batch
+    return pages
+
+
+def _to_batch(page_indexes: list[int], pages: list[RenderedPage]) -> RenderedBatch:
+    return RenderedBatch(
+        images=[Image.frombytes("RGB", page[0], page[1]) for page in pages],
+        encoded_images=[page[2] for page in pages],
+        page_indexes=page_indexes,
+        page_labels=[page[3] for page in pages],
+    )
+
+
+def count_pdf_pages(pdf_path: Path) -> int:
+    import fitz  # type: ignore
+
+    with fitz.open(pdf_path) as doc:
+        return int(doc.page_count)
+
+
+class PageRenderer:
+    """Pool of worker processes rendering the pages of PDF files.
+
+    The workers are spawned (not forked) when the first file is rendered, and each
+    renders a batch of pages at a time. At most one batch per worker (and one
+    more) is rendered ahead of the consumer of the batches.
+    """
+
+    def __init__(
+        self, count_workers: int, embedding_dpi: int, display_dpi: int
+    ) -> None:
+        assert count_workers > 0, "count_workers must be > 0"
+        self.count_workers = count_workers
+        self.embedding_dpi = embedding_dpi
+        self.display_dpi = display_dpi
+        self._pool: Pool | None = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self) -> Pool:
+        with self._pool_lock:
+            if self._pool is None:
+                logger.info(
+                    "Starting count=%s page rendering workers", self.count_workers
+                )
+                self._pool = multiprocessing.get_context("spawn").Pool(
+                    processes=self.count_workers
+                )
+            return self._pool
+
+    def render(
+        self,
+        pdf_path: Path,
+        batch_size: int,
+        first_page: int = 1,
+        page_indexes: list[int] | None = None,
+    ) -> Iterator[RenderedBatch]:
+        """Render the pages of a PDF file (from `first_page`, 1-based) by batches.
+
+        With `page_indexes`, only the pages at these 0-based indexes are rendered.
+        """
+        count_pages = count_pdf_pages(pdf_path)
+        to_render = [
+            page_index
+            for page_index in (
+                range(count_pages) if page_indexes is None else sorted(page_indexes)
+            )
+            if first_page - 1 <= page_index < count_pages
+        ]
+        batches = iter(
+            to_render[i : i + batch_size] for i in range(0, len(to_render), batch_size)
+        )
+        pool = self._get_pool()
+        pending: deque[tuple[list[int], AsyncResult[list[RenderedPage]]]] = deque()
+
+        def submit_next() -> None:
+            batch_indexes = next(batches, None)
+            if batch_indexes is not None:
+                pending.append(
+                    (
+                        batch_indexes,
+                        pool.apply_async(
+                            _render_pages,
+                            (
+                                str(pdf_path),
+                                batch_indexes,
+                                self.embedding_dpi,
+                                self.display_dpi,
+                            ),
+                        ),
+                    )
+                )
+
+        for _ in range(self.count_workers):
+            submit_next()
+        while pending:
+            submit_next()
+            batch_indexes, result = pending.popleft()
+            batch = _to_batch(batch_indexes, result.get())
+            del result  # Holds the pages as sent by the worker
+            yield batch
+            del batch  # Not to hold it while the next batch is rendered
+
+    def close(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
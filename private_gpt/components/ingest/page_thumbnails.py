@@ -0,0 +1,101 @@
+"""Cache of the thumbnails of the page images, shown with the chat answers.
+
+The thumbnails are keyed by the SHA-256 of the page image they are made from (and
+by their width), so that a page is resized and encoded once, whatever the number
+of answers showing it, and identical pages of several files share a thumbnail.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+WEBP_QUALITY = 80
+
+
+class PageThumbnailCache:
+    """Thumbnails of the page images, by content.
+
+    Thumbnails are stored as WebP files (PNG if Pillow has no WebP support) in
+    `cache_dir`. When the cache grows over `max_size_bytes`, the least recently
+    used thumbnails are evicted.
+    These methods are thread-safe.
+    """
+
+    def __init__(self, cache_dir: Path, max_size_bytes: int, width: int) -> None:
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.width = width
+        self.extension = "webp" if features.check("webp") else "png"
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._sizes: dict[str, int] = {
+            path.name: path.stat().st_size
+            for path in self.cache_dir.glob(f"*.{self.extension}")
+        }
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    @property
+    def media_type(self) -> str:
+        return f"image/{self.extension}"
+
+    def get(self, image_path: Path, image_hash: str) -> bytes:
+        """Thumbnail of a page image, created if it is not cached."""
+        name = self._name(image_hash)
+        path = self.cache_dir / name
+        with self._lock:
+            if name in self._sizes:
+                try:
+                    data = path.read_bytes()
+                    # Most recently used thumbnails are evicted last
+                    os.utime(path)
+                    return data
+                except OSError:
+                    logger.warning("Dropping unreadable thumbnail=%s", name)
+                    self._sizes.pop(name, None)
+        data = self._encode(image_path)
+        with self._lock:
+            tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+            tmp_path.write_bytes(data)
+            tmp_path.replace(path)
+            self._sizes[name] = len(data)
+            self._evict()
+        return data
+
+    def _name(self, image_hash: str) -> str:
+        key = hashlib.sha256(f"{image_hash}\n{self.width}".encode()).hexdigest()
+        return f"{key}.{self.extension}"
+
+    def _encode(self, image_path: Path) -> bytes:
+        with Image.open(image_path) as image:
+            image.thumbnail((self.width, image.height))
+            buffer = io.BytesIO()
+            if self.extension == "webp":
+                image.save(buffer, format="WEBP", quality=WEBP_QUALITY)
+            else:
+                image.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def _evict(self) -> None:
+        size_bytes = self.size_bytes
+        if size_bytes <= self.max_size_bytes:
+            return
+        by_last_use = sorted(
+            self._sizes, key=lambda name: (self.cache_dir / name).stat().st_mtime
+        )
+        for name in by_last_use:
+            if size_bytes <= self.max_size_bytes:
+                break
+            size_bytes -= self._sizes.pop(name)
+            logger.debug("Evicting thumbnail=%s", name)
+            (self.cache_dir / name).unlink(missing_ok=True)
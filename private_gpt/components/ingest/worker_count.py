@@ -0,0 +1,232 @@
+"""Size the ingestion workers from the machine, and throttle them on memory.
+
+With `count_workers: auto`, the worker pools are created with one worker per
+core, and a `WorkerThrottle` bounds how many of them are busy at the same time.
+The bound is calibrated by parsing the first files of the first bulk ingestion in
+worker processes, measuring the memory they take, and fitting as many workers as
+the available memory allows. It is then lowered (and raised back) at runtime
+when the memory used by the ingestion gets close to a ceiling.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from pathlib import Path
+
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import TransformComponent
+
+from private_gpt.components.ingest.ingest_helper import IngestionHelper
+
+logger = logging.getLogger(__name__)
+
+CALIBRATION_FILES = 2  # Files parsed to calibrate the number of workers
+# The documents parsed by a worker are also held by this process once sent back
+MEMORY_SAFETY_FACTOR = 2
+DEFAULT_RSS_CEILING_RATIO = 0.8  # Of the memory of the machine
+THROTTLE_DOWN_RATIO = 0.9  # Of the ceiling, remove a worker above it
+THROTTLE_UP_RATIO = 0.7  # Of the ceiling, add a worker back below it
+ADJUST_INTERVAL = 1.0  # Seconds between two changes of the number of workers
+# Embedding worker processes: torch threads of each worker when not configured,
+# and memory of a worker (its copy of a small embedding model and torch)
+DEFAULT_EMBEDDING_TORCH_THREADS = 4
+DEFAULT_EMBEDDING_WORKER_MB = 1024
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def count_cores() -> int:
+    """Number of cores this process can run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def total_memory() -> int | None:
+    """Memory of the machine in bytes, None if it cannot be known."""
+    try:
+        return int(os.sysconf("SC_PHYS_PAGES")) * _PAGE_SIZE
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def available_memory() -> int | None:
+    """Memory that can be used without swapping in bytes, None if unknown."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return int(os.sysconf("SC_AVPHYS_PAGES")) * _PAGE_SIZE
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def count_embedding_workers(torch_threads: int, worker_mb: int) -> int:
+    """Number of embedding worker processes fitting the cores and the memory.
+
+    Each worker runs `torch_threads` threads and loads its own copy of the
+    embedding model, taking `worker_mb` MB (the defaults are used for 0).
+    """
+    threads = torch_threads or DEFAULT_EMBEDDING_TORCH_THREADS
+    count_workers = count_cores() // threads
+    memory = available_memory()
+    if memory is not None:
+        memory_per_worker = (worker_mb or DEFAULT_EMBEDDING_WORKER_MB) * 1024 * 1024
+        count_workers = min(count_workers, memory // memory_per_worker)
+    return max(count_workers, 1)
+
+
+def _rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _measure_rss(
+    file_name: str, file_data: Path, transformations: list[TransformComponent]
+) -> int:
+    """Memory taken by this process to parse a file and split it into nodes."""
+    pid = os.getpid()
+    before = _rss(pid)
+    documents = IngestionHelper.transform_file_into_documents(file_name, file_data)
+    nodes = run_transformations(documents, transformations)  # type: ignore[arg-type]
+    after = _rss(pid)
+    del documents, nodes
+    return max(after - before, 0)
+
+
+def ingestion_rss() -> int | None:
+    """Memory used by this process and its worker processes, None if unknown."""
+    if not os.path.exists("/proc/self/statm"):
+        return None
+    pids = [os.getpid()] + [p.pid for p in multiprocessing.active_children()]
+    return sum(_rss(pid) for pid in pids if pid is not None)
+
+
+class WorkerThrottle:
+    """Bound the number of busy ingestion workers.
+
+    A worker is taken with `acquire` before giving it some work, and given back
+    with `release` once the work is done. These methods are thread-safe.
+    """
+
+    def __init__(self, max_workers: int, rss_ceiling: int | None) -> None:
+        self.max_workers = max_workers
+        self.rss_ceiling = rss_ceiling
+        # Calibrated number of workers, the limit is lowered from it on memory
+        self.calibrated_workers: int | None = None
+        self.limit = max_workers
+        self._busy = 0
+        self._condition = threading.Condition()
+        self._adjusted_at = 0.0
+
+    def calibrate(
+        self,
+        files: list[tuple[str, Path]],
+        transformations: list[TransformComponent],
+    ) -> None:
+        """Fit the number of workers to the memory taken to parse sample files.
+
+        Each file is parsed and split into nodes by the given transformations (the
+        ones before the embedding, without any stateful one) in a new worker
+        process, measuring the growth of its RSS.
+        """
+        if self.calibrated_workers is not None or not files:
+            return
+        peak = 0
+        start = time.perf_counter()
+        sample = files[:CALIBRATION_FILES]
+        # A new process per file, spawned not to reuse the memory freed by this
+        # process (or by the previous file)
+        with multiprocessing.get_context("spawn").Pool(
+            processes=len(sample), maxtasksperchild=1
+        ) as pool:
+            results = [
+                (
+                    file_name,
+                    pool.apply_async(
+                        _measure_rss, (file_name, file_data, transformations)
+                    ),
+                )
+                for file_name, file_data in sample
+            ]
+            for file_name, result in results:
+                try:
+                    peak = max(peak, result.get())
+                except Exception:
+                    logger.warning(
+                        "Cannot calibrate the workers on file_name=%s",
+                        file_name,
+                        exc_info=True,
+                    )
+        memory_per_worker = peak * MEMORY_SAFETY_FACTOR
+        memory = available_memory()
+        count_workers = self.max_workers
+        if memory is not None and memory_per_worker > 0:
+            count_workers = min(count_workers, memory // memory_per_worker)
+        with self._condition:
+            self.calibrated_workers = self.limit = max(int(count_workers), 1)
+            self._condition.notify_all()
+        logger.info(
+            "Calibrated count_workers=%s in %.1fs (cores=%s, available memory=%sMB, "
+            "memory per worker=%sMB)",
+            self.calibrated_workers,
+            time.perf_counter() - start,
+            self.max_workers,
+            None if memory is None else memory // (1024 * 1024),
+            memory_per_worker // (1024 * 1024),
+        )
+
+    def acquire(self) -> None:
+        with self._condition:
+            self._adjust()
+            while self._busy >= self.limit:
+                # Waken up by a release, or to measure the memory again
+                self._condition.wait(ADJUST_INTERVAL)
+                self._adjust()
+            self._busy += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self._busy -= 1
+            self._condition.notify()
+
+    def _adjust(self) -> None:
+        now = time.monotonic()
+        if self.rss_ceiling is None or now - self._adjusted_at < ADJUST_INTERVAL:
+            return
+        self._adjusted_at = now
+        rss = ingestion_rss()
+        if rss is None:
+            return
+        max_limit = self.calibrated_workers or self.max_workers
+        if rss > self.rss_ceiling * THROTTLE_DOWN_RATIO and self.limit > 1:
+            self.limit -= 1
+            logger.warning(
+                "Ingestion memory rss=%sMB close to the ceiling, using count_workers=%s",
+                rss // (1024 * 1024),
+                self.limit,
+            )
+        elif rss < self.rss_ceiling * THROTTLE_UP_RATIO and self.limit < max_limit:
+            self.limit += 1
+            logger.info("Using count_workers=%s again", self.limit)
+            self._condition.notify()
+
+
+def create_worker_throttle(max_rss_mb: int) -> WorkerThrottle:
+    """Throttle of one worker per core, the memory ceiling defaults to 80% of RAM."""
+    rss_ceiling: int | None = max_rss_mb * 1024 * 1024
+    if not rss_ceiling:
+        memory = total_memory()
+        rss_ceiling = (
+            int(memory * DEFAULT_RSS_CEILING_RATIO) if memory is not None else None
+        )
+    return WorkerThrottle(count_cores(), rss_ceiling)
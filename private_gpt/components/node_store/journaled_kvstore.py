@@ -0,0 +1,145 @@
+"""Simple key-value store persisted as a snapshot and an append-only journal.
+
+A `SimpleKVStore` is persisted by serializing all of its data in a JSON file, so
+persisting after each ingested file costs as much as the whole store. This store
+instead appends the keys written or deleted since the last persist to a journal
+(one JSON record per line), replayed on top of the snapshot when loading. The
+journal is compacted into the snapshot once it holds `compact_every` records.
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+import fsspec  # type: ignore
+from llama_index.core.storage.kvstore import SimpleKVStore
+from llama_index.core.storage.kvstore.types import DEFAULT_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = ".journal"
+
+
+class JournaledKVStore(SimpleKVStore):
+    """Simple key-value store, persisted with an append-only journal.
+
+    Persisting to the snapshot path of the store appends the changes to the
+    journal. Persisting to any other path writes a full snapshot there, as done by
+    `SimpleKVStore`.
+    These methods are thread-safe.
+    """
+
+    def __init__(
+        self,
+        persist_path: str | Path,
+        compact_every: int,
+        data: dict[str, Any] | None = None,
+    ) -> None:
+        super().__init__(data)
+        self.persist_path = Path(persist_path)
+        self.journal_path = self.persist_path.with_suffix(JOURNAL_SUFFIX)
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        # Keys changed since the last persist, None for a deleted key
+        self._dirty: dict[tuple[str, str], dict[str, Any] | None] = {}
+        self._journal_records = 0
+        self._replay()
+
+    @classmethod
+    def from_persist_path(  # type: ignore[override]
+        cls,
+        persist_path: str | Path,
+        compact_every: int,
+    ) -> "JournaledKVStore":
+        """Load the snapshot and replay the journal, if any."""
+        persist_path = Path(persist_path)
+        data = None
+        if persist_path.exists():
+            data = SimpleKVStore.from_persist_path(str(persist_path)).to_dict()
+        return cls(persist_path, compact_every, data)
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        with self._lock:
+            super().put(key, val, collection)
+            self._dirty[(collection, key)] = self._data[collection][key]
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            deleted = super().delete(key, collection)
+            if deleted:
+                self._dirty[(collection, key)] = None
+            return deleted
+
+    def persist(
+        self, persist_path: str, fs: fsspec.AbstractFileSystem | None = None
+    ) -> None:
+        """Persist the store."""
+        if (
+            fs is not None
+            or Path(persist_path).resolve() != self.persist_path.resolve()
+        ):
+            super().persist(persist_path, fs=fs)
+            return
+        with self._lock:
+            if self._journal_records + len(self._dirty) >= self.compact_every:
+                self.compact()
+            else:
+                self._append_to_journal()
+
+    def compact(self) -> None:
+        """Write the whole store in the snapshot, and empty the journal."""
+        with self._lock:
+            logger.debug(
+                "Compacting count=%s journal records into %s",
+                self._journal_records + len(self._dirty),
+                self.persist_path,
+            )
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.persist_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self._data))
+            tmp_path.replace(self.persist_path)
+            # A crash before the journal is emptied replays records already in the
+            # snapshot, which is harmless as they hold the final values
+            self.journal_path.unlink(missing_ok=True)
+            self._journal_records = 0
+            self._dirty.clear()
+
+    def _append_to_journal(self) -> None:
+        if not self._dirty:
+            return
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.journal_path.open("a") as f:
+            for (collection, key), val in self._dirty.items():
+                record = {"collection": collection, "key": key, "val": val}
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_records += len(self._dirty)
+        self._dirty.clear()
+
+    def _replay(self) -> None:
+        if not self.journal_path.exists():
+            return
+        with self.journal_path.open() as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Last record not fully written, the persist did not complete.
+                    # Compact, not to append records after the truncated one.
+                    logger.warning("Ignoring truncated record in %s", self.journal_path)
+                    self.compact()
+                    return
+                if record["val"] is None:
+                    super().delete(record["key"], record["collection"])
+                else:
+                    super().put(record["key"], record["val"], record["collection"])
+                self._journal_records += 1
+        logger.info(
+            "Replayed count=%s records from %s",
+            self._journal_records,
+            self.journal_path,
+        )
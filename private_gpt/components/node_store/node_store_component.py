@@ -2,9 +2,11 @@ import logging
 
 from injector import inject, singleton
 from llama_index.core.storage.docstore import BaseDocumentStore, SimpleDocumentStore
+from llama_index.core.storage.docstore.types import DEFAULT_PERSIST_FNAME
 from llama_index.core.storage.index_store import SimpleIndexStore
 from llama_index.core.storage.index_store.types import BaseIndexStore
 
+from private_gpt.components.node_store.journaled_kvstore import JournaledKVStore
 from private_gpt.paths import local_data_path
 from private_gpt.settings.settings import Settings
 
@@ -28,13 +30,26 @@ class NodeStoreComponent:
                     logger.debug("Local index store not found, creating a new one")
                     self.index_store = SimpleIndexStore()
 
-                try:
-                    self.doc_store = SimpleDocumentStore.from_persist_dir(
-                        persist_dir=str(local_data_path)
+                if settings.nodestore.persist_mode == "journal":
+                    # The docstore holds the text of every node, it is the store
+                    # growing with the corpus. The index store is a single (much
+                    # smaller) value, rewritten on every change anyway.
+                    self.doc_store = SimpleDocumentStore(
+                        JournaledKVStore.from_persist_path(
+                            local_data_path / DEFAULT_PERSIST_FNAME,
+                            settings.nodestore.journal_compact_every,
+                        )
                     )
-                except FileNotFoundError:
-                    logger.debug("Local document store not found, creating a new one")
-                    self.doc_store = SimpleDocumentStore()
+                else:
+                    try:
+                        self.doc_store = SimpleDocumentStore.from_persist_dir(
+                            persist_dir=str(local_data_path)
+                        )
+                    except FileNotFoundError:
+                        logger.debug(
+                            "Local document store not found, creating a new one"
+                        )
+                        self.doc_store = SimpleDocumentStore()
 
             case "postgres":
                 try:
@@ -0,0 +1,9 @@
+from typing import Protocol, runtime_checkable
+
+
+@runtime_checkable
+class BatchDeleteVectorStore(Protocol):
+    """Vector store able to delete the nodes of several documents in one call."""
+
+    def delete_many(self, ref_doc_ids: list[str]) -> None:
+        """Delete the nodes of the given documents (ref_doc_id)."""
@@ -101,3 +101,11 @@ class BatchedChromaVectorStore(ChromaVectorStore):  # type: ignore
             all_ids.extend(ids)
 
         return all_ids
+
+    def delete_many(self, ref_doc_ids: list[str]) -> None:
+        """Delete the nodes of the given documents (ref_doc_id) in one call.
+
+        Args:
+            ref_doc_ids (List[str]): The doc_ids of the documents to delete.
+        """
+        self._collection.delete(where={"document_id": {"$in": ref_doc_ids}})
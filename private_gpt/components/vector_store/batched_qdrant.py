@@ -0,0 +1,27 @@
+from llama_index.vector_stores.qdrant import QdrantVectorStore  # type: ignore
+from qdrant_client.http import models as rest  # type: ignore
+
+
+class BatchedQdrantVectorStore(QdrantVectorStore):  # type: ignore
+    """Qdrant vector store, deleting the nodes of several documents at once.
+
+    `QdrantVectorStore.delete` sends one request per document, deleting the pages
+    of a large PDF file one by one.
+    """
+
+    def delete_many(self, ref_doc_ids: list[str]) -> None:
+        """Delete the nodes of the given documents (ref_doc_id) in one request.
+
+        Args:
+            ref_doc_ids (List[str]): The doc_ids of the documents to delete.
+        """
+        self._client.delete(
+            collection_name=self.collection_name,
+            points_selector=rest.Filter(
+                must=[
+                    rest.FieldCondition(
+                        key="doc_id", match=rest.MatchAny(any=ref_doc_ids)
+                    )
+                ]
+            ),
+        )
@@ -95,10 +95,11 @@ class VectorStoreComponent:
 
             case "qdrant":
                 try:
-                    from llama_index.vector_stores.qdrant import (  # type: ignore
-                        QdrantVectorStore,
-                    )
                     from qdrant_client import QdrantClient  # type: ignore
+
+                    from private_gpt.components.vector_store.batched_qdrant import (
+                        BatchedQdrantVectorStore,
+                    )
                 except ImportError as e:
                     raise ImportError(
                         "Qdrant dependencies not found, install with `poetry install --extras vector-stores-qdrant`"
@@ -116,7 +117,7 @@ class VectorStoreComponent:
                     )
                 self.vector_store = typing.cast(
                     VectorStore,
-                    QdrantVectorStore(
+                    BatchedQdrantVectorStore(
                         client=client,
                         collection_name="make_this_parameterizable_per_api_call",
                     ),  # TODO
@@ -4,7 +4,6 @@ import logging
 
 from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from injector import Injector
 from llama_index.core.callbacks import CallbackManager
@@ -17,6 +16,7 @@ from private_gpt.server.completions.completions_router import completions_router
 from private_gpt.server.embeddings.embeddings_router import embeddings_router
 from private_gpt.server.health.health_router import health_router
 from private_gpt.server.ingest.ingest_router import ingest_router
+from private_gpt.server.page_images.page_images_router import page_images_router
 from private_gpt.settings.settings import Settings
 
 logger = logging.getLogger(__name__)
@@ -36,8 +36,7 @@ def create_app(root_injector: Injector) -> FastAPI:
     app.include_router(ingest_router)
     app.include_router(embeddings_router)
     app.include_router(health_router)
-
-    app.mount("/context_images", StaticFiles(directory="/tmp/hackathon/"), name='images')
+    app.include_router(page_images_router)
 
     # Add LlamaIndex simple observability
     global_handler = create_global_handler("simple")
@@ -7,6 +7,7 @@ from llama_index.core.storage import StorageContext
 from pydantic import BaseModel, Field
 
 from private_gpt.components.embedding.embedding_component import EmbeddingComponent
+from private_gpt.components.ingest.chunk_dedup import ChunkDuplicateIndex
 from private_gpt.components.llm.llm_component import LLMComponent
 from private_gpt.components.node_store.node_store_component import NodeStoreComponent
 from private_gpt.components.vector_store.vector_store_component import (
@@ -37,6 +38,13 @@ class Chunk(BaseModel):
             ]
         ],
     )
+    duplicate_documents: list[IngestedDoc] | None = Field(
+        default=None,
+        description=(
+            "Other documents containing this chunk (or a near-identical one), "
+            "merged into it at ingestion (see `embedding.deduplicate_chunks`)"
+        ),
+    )
 
     @classmethod
     def from_node(cls: type["Chunk"], node: NodeWithScore) -> "Chunk":
@@ -71,6 +79,7 @@ class ChunksService:
             docstore=node_store_component.doc_store,
             index_store=node_store_component.index_store,
         )
+        self.chunk_duplicates = ChunkDuplicateIndex(node_store_component.doc_store)
 
     def _get_sibling_nodes_text(
         self, node_with_score: NodeWithScore, related_number: int, forward: bool = True
@@ -120,6 +129,16 @@ class ChunksService:
                 node, prev_next_chunks, False
             )
             chunk.next_texts = self._get_sibling_nodes_text(node, prev_next_chunks)
+            duplicates = self.chunk_duplicates.duplicates(node.node.node_id)
+            if duplicates:
+                chunk.duplicate_documents = [
+                    IngestedDoc(
+                        object="ingest.document",
+                        doc_id=duplicate.ref_doc_id or "-",
+                        doc_metadata=duplicate.metadata,
+                    )
+                    for duplicate in duplicates
+                ]
             retrieved_nodes.append(chunk)
 
         return retrieved_nodes
@@ -0,0 +1,261 @@
+import functools
+import logging
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO
+
+from injector import inject, singleton
+
+from private_gpt.server.ingest.ingest_service import (
+    COPY_CHUNK_SIZE,
+    IngestService,
+    has_page_images,
+)
+from private_gpt.server.ingest.model import IngestedDoc, IngestJob, IngestJobFile
+from private_gpt.settings.settings import Settings
+from private_gpt.utils.eta import ETA
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    """State of an ingestion job, updated by the worker running it."""
+
+    def __init__(
+        self,
+        files: list[tuple[str, Path]],
+        update_file_names: set[str],
+        image_embeddings: bool,
+        tmp_dir: Path | None,
+    ) -> None:
+        self.job_id = str(uuid.uuid4())
+        self.status = "queued"
+        self.files = files
+        self.update_file_names = update_file_names
+        self.image_embeddings = image_embeddings
+        # Directory holding the uploaded files, deleted once the job is done
+        self.tmp_dir = tmp_dir
+        self.file_states = [
+            IngestJobFile(file_name=file_name, stage="queued") for file_name, _ in files
+        ]
+        self.processed_files = 0
+        self.eta = ETA(len(files))
+
+    def to_model(self) -> IngestJob:
+        return IngestJob(
+            object="ingest.job",
+            job_id=self.job_id,
+            status=self.status,  # type: ignore[arg-type]
+            files=[file_state.model_copy() for file_state in self.file_states],
+            processed_files=self.processed_files,
+            eta=self.eta.human_time() if self.status == "running" else None,
+        )
+
+
+@singleton
+class IngestJobService:
+    """Run ingestions in the background, reporting their progress.
+
+    Submitting files returns a job right away. The jobs are run by a bounded pool
+    of worker threads, in submission order, and can be polled until they are done.
+    """
+
+    MAX_FINISHED_JOBS = 1000  # Finished jobs kept to be polled
+
+    @inject
+    def __init__(self, ingest_service: IngestService, settings: Settings) -> None:
+        self._ingest_service = ingest_service
+        self._jobs: OrderedDict[str, _Job] = OrderedDict()
+        self._lock = threading.Lock()
+        self._work_pool = ThreadPoolExecutor(
+            max_workers=settings.embedding.ingest_job_workers,
+            thread_name_prefix="ingest-job",
+        )
+
+    def submit(
+        self,
+        files: list[tuple[str, Path]],
+        update_file_names: set[str] | None = None,
+        image_embeddings: bool = False,
+    ) -> IngestJob:
+        """Submit files to ingest in the background.
+
+        The files given in `update_file_names` are updated (only their changed
+        pages are ingested again) instead of being ingested. The files must exist
+        until the job is done.
+        """
+        job = _Job(files, update_file_names or set(), image_embeddings, None)
+        return self._submit(job)
+
+    def submit_bin_data(self, file_name: str, raw_file_data: BinaryIO) -> IngestJob:
+        """Submit an uploaded file to ingest in the background.
+
+        The file is copied (chunk by chunk) to a temporary directory owned by the
+        job, as the upload is gone once the request is answered.
+        """
+        tmp_dir = Path(tempfile.mkdtemp(prefix="private-gpt-ingest-"))
+        file_path = tmp_dir / Path(file_name).name
+        with file_path.open("wb") as f:
+            shutil.copyfileobj(raw_file_data, f, COPY_CHUNK_SIZE)
+        return self._submit(_Job([(file_name, file_path)], set(), False, tmp_dir))
+
+    def get(self, job_id: str) -> IngestJob | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_model() if job is not None else None
+
+    def _submit(self, job: _Job) -> IngestJob:
+        logger.info(
+            "Submitting ingestion job=%s of count=%s files", job.job_id, len(job.files)
+        )
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._forget_finished_jobs()
+            model = job.to_model()
+        self._work_pool.submit(self._run, job)
+        return model
+
+    def _forget_finished_jobs(self) -> None:
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.status in ("completed", "failed")
+        ]
+        for job_id in finished[: max(len(finished) - self.MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+
+    def _set_stage(self, job: _Job, index: int, stage: str) -> None:
+        with self._lock:
+            job.file_states[index].stage = stage  # type: ignore[assignment]
+
+    def _run(self, job: _Job) -> None:
+        with self._lock:
+            job.status = "running"
+        try:
+            new_files = []
+            for index, (file_name, _) in enumerate(job.files):
+                if file_name not in job.update_file_names:
+                    new_files.append(index)
+                    continue
+                # Updated one by one, only their changed pages are ingested
+                self._run_files(
+                    job,
+                    [index],
+                    functools.partial(
+                        self._ingest_service.bulk_update,
+                        image_embeddings=job.image_embeddings,
+                    ),
+                )
+            if new_files:
+                if job.image_embeddings:
+                    self._create_image_embeddings(job, new_files)
+                # Ingested together, to run the bulk ingestion in parallel
+                self._run_files(
+                    job,
+                    new_files,
+                    functools.partial(
+                        self._ingest_service.bulk_ingest, image_embeddings=False
+                    ),
+                )
+        finally:
+            with self._lock:
+                failed = all(state.stage == "failed" for state in job.file_states)
+                job.status = "failed" if failed and job.files else "completed"
+            if job.tmp_dir is not None:
+                shutil.rmtree(job.tmp_dir, ignore_errors=True)
+            logger.info("Finished ingestion job=%s status=%s", job.job_id, job.status)
+
+    def _create_image_embeddings(self, job: _Job, indexes: list[int]) -> None:
+        for index in indexes:
+            file_name, file_data = job.files[index]
+            if not has_page_images(file_name):
+                continue
+            self._set_stage(job, index, "image_embeddings")
+            try:
+                self._ingest_service.create_image_embeddings(file_name, file_data)
+            except Exception as e:
+                logger.exception(
+                    "Ingestion job=%s failed to embed the images of file_name=%s",
+                    job.job_id,
+                    file_name,
+                )
+                self._fail(job, [index], str(e))
+
+    def _run_files(
+        self,
+        job: _Job,
+        indexes: list[int],
+        ingest: Callable[..., list[IngestedDoc]],
+    ) -> None:
+        """Ingest the files of a job at the given indexes, in a single call.
+
+        The files are reported done one by one, as the ingestion calls back.
+        """
+        indexes = [i for i in indexes if job.file_states[i].stage != "failed"]
+        if not indexes:
+            return
+        files = [job.files[index] for index in indexes]
+        index_by_name = {
+            file_name: index
+            for index, (file_name, _) in zip(indexes, files, strict=True)
+        }
+        for index in indexes:
+            self._set_stage(job, index, "ingesting")
+
+        def file_done(
+            file_name: str, documents: list[IngestedDoc], error: str | None
+        ) -> None:
+            index = index_by_name.get(file_name)
+            if index is None:
+                return
+            with self._lock:
+                file_state = job.file_states[index]
+                if file_state.stage != "ingesting":
+                    return  # Already reported
+                if error is None:
+                    file_state.doc_ids = [document.doc_id for document in documents]
+                    file_state.stage = "completed"
+                else:
+                    file_state.error = error
+                    file_state.stage = "failed"
+                self._processed(job, 1)
+
+        try:
+            documents = ingest(files, on_file_done=file_done)
+        except Exception as e:
+            logger.exception(
+                "Ingestion job=%s failed for file_names=%s",
+                job.job_id,
+                list(index_by_name),
+            )
+            with self._lock:
+                # The files reported done before the failure are kept
+                not_done = [
+                    i for i in indexes if job.file_states[i].stage == "ingesting"
+                ]
+            self._fail(job, not_done, str(e))
+            return
+        # The files not reported yet are done with the call
+        documents_by_file: dict[str, list[IngestedDoc]] = defaultdict(list)
+        for document in documents:
+            if document.doc_metadata is not None:
+                documents_by_file[document.doc_metadata["file_name"]].append(document)
+        for file_name in index_by_name:
+            file_done(file_name, documents_by_file[file_name], None)
+
+    def _fail(self, job: _Job, indexes: list[int], error: str) -> None:
+        with self._lock:
+            for index in indexes:
+                job.file_states[index].error = error
+                job.file_states[index].stage = "failed"
+            self._processed(job, len(indexes))
+
+    def _processed(self, job: _Job, count_files: int) -> None:
+        job.processed_files += count_files
+        job.eta.update(job.processed_files)
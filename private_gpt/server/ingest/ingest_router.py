@@ -3,9 +3,19 @@ from typing import Literal
 from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile
 from pydantic import BaseModel, Field
 
-from private_gpt.server.ingest.ingest_service import IngestService
-from private_gpt.server.ingest.model import IngestedDoc
+from private_gpt.server.ingest.ingest_job_service import IngestJobService
+from private_gpt.server.ingest.ingest_service import (
+    IngestService,
+    resolve_allowed_paths,
+)
+from private_gpt.server.ingest.model import (
+    FailedIngestion,
+    IngestedDoc,
+    IngestedPage,
+    IngestJob,
+)
 from private_gpt.server.utils.auth import authenticated
+from private_gpt.settings.settings import Settings
 
 ingest_router = APIRouter(prefix="/v1", dependencies=[Depends(authenticated)])
 
@@ -22,12 +32,43 @@ class IngestTextBody(BaseModel):
     )
 
 
+class IngestPathsBody(BaseModel):
+    paths: list[str] = Field(
+        examples=[
+            ["/mnt/manuals/file_15-17.pdf", "/mnt/manuals/file_15-17_japanese.pdf"]
+        ]
+    )
+
+
+class DeleteBody(BaseModel):
+    doc_ids: list[str] = Field(
+        examples=[
+            [
+                "c202d5e6-7b69-4869-81cc-dd574ee8ee11",
+                "54c5bc3c-d0b4-4b0c-a3e1-3f9a1f9e6a2f",
+            ]
+        ]
+    )
+
+
 class IngestResponse(BaseModel):
     object: Literal["list"]
     model: Literal["private-gpt"]
     data: list[IngestedDoc]
 
 
+class PagesResponse(BaseModel):
+    object: Literal["list"]
+    model: Literal["private-gpt"]
+    data: list[IngestedPage]
+
+
+class FailedResponse(BaseModel):
+    object: Literal["list"]
+    model: Literal["private-gpt"]
+    data: list[FailedIngestion]
+
+
 @ingest_router.post("/ingest", tags=["Ingestion"], deprecated=True)
 def ingest(request: Request, file: UploadFile) -> IngestResponse:
     """Ingests and processes a file.
@@ -61,6 +102,79 @@ def ingest_file(request: Request, file: UploadFile) -> IngestResponse:
     return IngestResponse(object="list", model="private-gpt", data=ingested_documents)
 
 
+@ingest_router.post("/ingest/stream", tags=["Ingestion"])
+async def ingest_stream(request: Request, file_name: str) -> IngestResponse:
+    """Ingests and processes a file sent as the raw request body.
+
+    Same as `/ingest/file`, for large files: the body (the file content, any
+    `Content-Type`) is written to disk as it is received, it is never held in
+    memory, and the server keeps handling other requests while it is ingested.
+    The name of the file (with its extension) is given in the `file_name` query
+    parameter.
+    """
+    service = request.state.injector.get(IngestService)
+    if len(file_name) == 0:
+        raise HTTPException(400, "Empty file_name field not allowed")
+    ingested_documents = await service.ingest_stream(file_name, request.stream())
+    return IngestResponse(object="list", model="private-gpt", data=ingested_documents)
+
+
+@ingest_router.post("/ingest/paths", tags=["Ingestion"])
+def ingest_paths(request: Request, body: IngestPathsBody) -> IngestResponse:
+    """Ingests files already on the server, read in place from their paths.
+
+    Same as `/ingest/file` for several files (ingested together, as a bulk
+    ingestion), without uploading them: for files on a storage mounted on the
+    server, large batches are ingested without copying every file twice. The
+    name of each file is the last part of its path, it must be unique within the
+    request.
+
+    Only the files within the folders allowed by the `data.ingest_allowed_roots`
+    configuration can be ingested (the API is disabled when it is empty).
+    """
+    service = request.state.injector.get(IngestService)
+    allowed_roots = request.state.injector.get(Settings).data.ingest_allowed_roots
+    try:
+        files = resolve_allowed_paths(body.paths, allowed_roots)
+    except PermissionError as e:
+        raise HTTPException(403, str(e)) from None
+    except FileNotFoundError as e:
+        raise HTTPException(404, str(e)) from None
+    except ValueError as e:
+        raise HTTPException(400, str(e)) from None
+    # Like `/ingest/file`, the page images are not embedded
+    ingested_documents = service.bulk_ingest(files, image_embeddings=False)
+    return IngestResponse(object="list", model="private-gpt", data=ingested_documents)
+
+
+@ingest_router.post("/ingest/jobs", tags=["Ingestion"], status_code=202)
+def submit_ingest_job(request: Request, file: UploadFile) -> IngestJob:
+    """Submits a file to be ingested in the background.
+
+    Same as `/ingest/file`, but the response is sent as soon as the file is
+    received, with the ID of the ingestion job. The progress of the job (the
+    stage of each file, and the estimated time left) is then obtained from
+    `GET /ingest/jobs/{job_id}`, and the Documents IDs once it is completed.
+    """
+    service = request.state.injector.get(IngestJobService)
+    if file.filename is None:
+        raise HTTPException(400, "No file name provided")
+    return service.submit_bin_data(file.filename, file.file)
+
+
+@ingest_router.get("/ingest/jobs/{job_id}", tags=["Ingestion"])
+def get_ingest_job(request: Request, job_id: str) -> IngestJob:
+    """Get the status and progress of an ingestion job.
+
+    Finished jobs are kept for a while, so that their result can be obtained.
+    """
+    service = request.state.injector.get(IngestJobService)
+    job = service.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job {job_id} not found")
+    return job
+
+
 @ingest_router.post("/ingest/text", tags=["Ingestion"])
 def ingest_text(request: Request, body: IngestTextBody) -> IngestResponse:
     """Ingests and processes a text, storing its chunks to be used as context.
@@ -93,6 +207,46 @@ def list_ingested(request: Request) -> IngestResponse:
     return IngestResponse(object="list", model="private-gpt", data=ingested_documents)
 
 
+@ingest_router.get("/ingest/failed", tags=["Ingestion"])
+def list_failed(request: Request) -> FailedResponse:
+    """Lists the files that could not be ingested in bulk ingestions.
+
+    With the `pipeline` ingestion mode, the files are embedded and saved in the
+    background, and a file that fails (after being retried) does not fail the
+    others. It is listed here instead, with the stage that failed and the error,
+    so that it can be investigated and ingested again.
+    """
+    service = request.state.injector.get(IngestService)
+    return FailedResponse(
+        object="list", model="private-gpt", data=service.list_failed()
+    )
+
+
+@ingest_router.delete("/ingest/failed", tags=["Ingestion"])
+def clear_failed(request: Request) -> None:
+    """Clears the list of the files that could not be ingested."""
+    service = request.state.injector.get(IngestService)
+    service.clear_failed()
+
+
+@ingest_router.get("/ingest/{doc_id}/pages", tags=["Ingestion"])
+def list_pages(request: Request, doc_id: str) -> PagesResponse:
+    """Lists the pages of the file the given Document was ingested from.
+
+    Each page comes with its index in the file, the page label printed on it
+    (for example "4-11") and the ID of the Document holding its content. The
+    mapping is computed once at ingestion time.
+
+    The `doc_id` can be obtained from the `GET /ingest/list` endpoint.
+    """
+    service = request.state.injector.get(IngestService)
+    try:
+        pages = service.list_pages(doc_id)
+    except ValueError:
+        raise HTTPException(404, f"Document {doc_id} not found") from None
+    return PagesResponse(object="list", model="private-gpt", data=pages)
+
+
 @ingest_router.delete("/ingest/{doc_id}", tags=["Ingestion"])
 def delete_ingested(request: Request, doc_id: str) -> None:
     """Delete the specified ingested Document.
@@ -102,3 +256,27 @@ def delete_ingested(request: Request, doc_id: str) -> None:
     """
     service = request.state.injector.get(IngestService)
     service.delete(doc_id)
+
+
+@ingest_router.post("/ingest/delete", tags=["Ingestion"])
+def delete_many_ingested(request: Request, body: DeleteBody) -> None:
+    """Delete the specified ingested Documents.
+
+    The Documents are deleted together, which is much faster than deleting them one
+    by one (for example all the pages of a PDF file).
+    The `doc_ids` can be obtained from the `GET /ingest/list` endpoint.
+    """
+    service = request.state.injector.get(IngestService)
+    service.delete_many(body.doc_ids)
+
+
+@ingest_router.delete("/ingest/file/{file_name:path}", tags=["Ingestion"])
+def delete_ingested_file(request: Request, file_name: str) -> None:
+    """Delete all the ingested Documents of the given file.
+
+    A file can be ingested as several Documents, for example one per page of a PDF
+    file. They are all deleted from your storage context.
+    """
+    service = request.state.injector.get(IngestService)
+    if not service.delete_by_file_name(file_name):
+        raise HTTPException(404, f"File {file_name} not found")
@@ -1,36 +1,88 @@
+import asyncio
 import logging
+import shutil
 import tempfile
+from collections.abc import AsyncIterator, Callable
+from datetime import datetime
 from pathlib import Path
 from typing import TYPE_CHECKING, AnyStr, BinaryIO
 
 from injector import inject, singleton
 from llama_index.core.node_parser import SentenceWindowNodeParser
+from llama_index.core.schema import Document, TransformComponent
 from llama_index.core.storage import StorageContext
 
 from private_gpt.components.embedding.embedding_component import EmbeddingComponent
+from private_gpt.components.ingest.boilerplate import BoilerplateRemover
+from private_gpt.components.ingest.chunk_dedup import ChunkDeduplicator
 from private_gpt.components.ingest.ingest_component import get_ingestion_component
+from private_gpt.components.ingest.page_image_index import PageImageIndex
+from private_gpt.components.ingest.page_images import ImageEmbeddingStore
+from private_gpt.components.ingest.page_labels import PageLabels
+from private_gpt.components.ingest.page_renderer import PageRenderer
+from private_gpt.components.ingest.worker_count import count_cores
 from private_gpt.components.llm.llm_component import LLMComponent
 from private_gpt.components.node_store.node_store_component import NodeStoreComponent
 from private_gpt.components.vector_store.vector_store_component import (
     VectorStoreComponent,
 )
-from private_gpt.server.ingest.model import IngestedDoc
+from private_gpt.paths import local_data_path
+from private_gpt.server.ingest.model import (
+    FailedIngestion,
+    IngestedDoc,
+    IngestedPage,
+)
 from private_gpt.settings.settings import settings
 
-from pdf2image import convert_from_path
 from PIL import Image
 
 # from sentence_transformers import SentenceTransformer, util
 import private_gpt.server.ingest.load_img_model as load_img_model
 
-import numpy as np
-import pickle
-
 if TYPE_CHECKING:
     from llama_index.core.storage.docstore.types import RefDocInfo
 
 logger = logging.getLogger(__name__)
 
+COPY_CHUNK_SIZE = 1024 * 1024  # Uploaded files are written to disk by 1MB chunks
+FIRST_IMAGE_PAGE = 7  # 1-based, the page images before it are not embedded
+# Called as each file of a bulk ingestion is done, with its name, its documents,
+# and the error if it failed
+IngestedFileDone = Callable[[str, list[IngestedDoc], str | None], None]
+
+
+def resolve_allowed_paths(
+    paths: list[str], allowed_roots: list[str]
+) -> list[tuple[str, Path]]:
+    """Files to ingest in place, as (file name, resolved path).
+
+    The file name is the last part of the requested path (not of the path a
+    symbolic link resolves to). Raises PermissionError if a path is not within one
+    of the allowed roots (after resolving its symbolic links and `..`),
+    FileNotFoundError if it is not a file, and ValueError if two paths have the
+    same file name (the files are identified by their name).
+    """
+    roots = [Path(root).resolve() for root in allowed_roots]
+    if not roots:
+        raise PermissionError("Ingesting server paths is disabled")
+    files: dict[str, Path] = {}
+    for path in paths:
+        resolved = Path(path).resolve()
+        if not any(resolved.is_relative_to(root) for root in roots):
+            raise PermissionError(f"Path {path} is not in an allowed root")
+        if not resolved.is_file():
+            raise FileNotFoundError(f"File {path} not found")
+        file_name = Path(path).name
+        if file_name in files:
+            raise ValueError(f"Several paths have the file name {file_name}")
+        files[file_name] = resolved
+    return list(files.items())
+
+
+def has_page_images(file_name: str) -> bool:
+    """Whether the pages of the file are rendered to embed their images."""
+    return Path(file_name).suffix.lower() == ".pdf"
+
 
 @singleton
 class IngestService:
@@ -49,16 +101,39 @@ class IngestService:
             index_store=node_store_component.index_store,
         )
         node_parser = SentenceWindowNodeParser.from_defaults()
+        transformations: list[TransformComponent] = [
+            node_parser,
+            embedding_component.embedding_model,
+        ]
+        if settings().embedding.deduplicate_chunks:
+            # After the node parser, not to embed the duplicates
+            transformations.insert(
+                1,
+                ChunkDeduplicator(
+                    node_store_component.doc_store,
+                    threshold=settings().embedding.deduplicate_threshold,
+                ),
+            )
+        if settings().embedding.remove_boilerplate:
+            transformations.insert(0, BoilerplateRemover())
 
         self.ingest_component = get_ingestion_component(
             self.storage_context,
             embed_model=embedding_component.embedding_model,
-            transformations=[node_parser, embedding_component.embedding_model],
+            transformations=transformations,
             settings=settings(),
         )
+        self.page_renderer = PageRenderer(
+            settings().embedding.image_render_workers or count_cores(),
+            embedding_dpi=settings().embedding.image_embedding_dpi,
+            display_dpi=settings().embedding.image_dpi,
+        )
+        self.image_store = ImageEmbeddingStore(local_data_path / "image_embeddings")
+        self.image_index = PageImageIndex(self.image_store)
 
-    def _ingest_data(self, file_name: str, file_data: AnyStr) -> list[IngestedDoc]:
-        logger.debug("Got file data of size=%s to ingest", len(file_data))
+    def _ingest_data(
+        self, file_name: str, file_data: AnyStr | BinaryIO
+    ) -> list[IngestedDoc]:
         # llama-index mainly supports reading from files, so
         # we have to create a tmp file to read for it to work
         # delete=False to avoid a Windows 11 permission error.
@@ -66,9 +141,15 @@ class IngestService:
             try:
                 path_to_tmp = Path(tmp.name)
                 if isinstance(file_data, bytes):
+                    logger.debug("Got file data of size=%s to ingest", len(file_data))
                     path_to_tmp.write_bytes(file_data)
-                else:
+                elif isinstance(file_data, str):
+                    logger.debug("Got file data of size=%s to ingest", len(file_data))
                     path_to_tmp.write_text(str(file_data))
+                else:
+                    # Copied chunk by chunk, not to hold the whole file in memory
+                    shutil.copyfileobj(file_data, tmp, COPY_CHUNK_SIZE)
+                    tmp.flush()
                 return self.ingest_file(file_name, path_to_tmp)
             finally:
                 tmp.close()
@@ -88,44 +169,163 @@ class IngestService:
         self, file_name: str, raw_file_data: BinaryIO
     ) -> list[IngestedDoc]:
         logger.debug("Ingesting binary data with file_name=%s", file_name)
-        file_data = raw_file_data.read()
-        return self._ingest_data(file_name, file_data)
+        # A file already on disk (with a path) is read from where it is
+        path = getattr(raw_file_data, "name", None)
+        if isinstance(path, str) and Path(path).is_file() and raw_file_data.tell() == 0:
+            return self.ingest_file(file_name, Path(path))
+        return self._ingest_data(file_name, raw_file_data)
 
-    def create_image_embeddings(self, pdf_name, pdf_path):
-        # pdf_name,pdf_path=pdf_name_path
-        def pdf_to_images(pdf_path):
-            images = convert_from_path(pdf_path,dpi=300,first_page=7) # https://pdf2image.readthedocs.io/en/latest/reference.html#pdf2image.pdf2image.convert_from_bytes
-            # dpi=200,transparent=False,first_page,last_page 
-            return images
+    async def ingest_stream(
+        self, file_name: str, stream: AsyncIterator[bytes]
+    ) -> list[IngestedDoc]:
+        """Ingest a file received as a stream of chunks.
 
-        images = pdf_to_images(pdf_path)
+        The chunks are written to disk as they arrive, the file is never held in
+        memory. The ingestion itself runs in a worker thread.
+        """
+        logger.debug("Ingesting streamed data with file_name=%s", file_name)
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            try:
+                path_to_tmp = Path(tmp.name)
+                async for chunk in stream:
+                    # Not to block the event loop on a slow disk
+                    await asyncio.to_thread(tmp.write, chunk)
+                await asyncio.to_thread(tmp.flush)
+                return await asyncio.to_thread(self.ingest_file, file_name, path_to_tmp)
+            finally:
+                tmp.close()
+                path_to_tmp.unlink()
+
+    def create_image_embeddings(self, pdf_name, pdf_path, page_indexes=None, kept=None):
+        # The pages are rendered by batches in worker processes: embedded at a low
+        # resolution, and stored as images at the display resolution
         # img_model = SentenceTransformer('clip-ViT-B-32', device='cuda:3')
         img_model = load_img_model.img_model
+        image_settings = settings().embedding
+        page_images = self.image_store.add(
+            pdf_name,
+            self.page_renderer.render(
+                pdf_path,
+                batch_size=image_settings.image_batch_size,
+                first_page=FIRST_IMAGE_PAGE,
+                page_indexes=page_indexes,
+            ),
+            lambda batch: img_model.encode(
+                batch, batch_size=image_settings.image_batch_size
+            ),
+            kept=kept,
+        )
+        self.image_index.add(pdf_name, page_images)
+
+    def update_image_embeddings(
+        self, pdf_name: str, pdf_path: Path, previous_pages: PageLabels | None
+    ) -> None:
+        """Embed the images of the new or changed pages of an updated file.
 
-        img_embeddings = img_model.encode(images)
-        embeddings = np.array(img_embeddings).astype('float32')
-        
-        # np.savez(f'../../../local_data/{pdf_name}.npz', embeddings)
-        data = {
-        'pdf_name': pdf_name,
-        'images': images,
-        'embeddings': embeddings
+        The pages are matched with the ones of the previous revision by document:
+        an unchanged page keeps its document, even if it moved. The images of the
+        other pages are rendered and embedded again.
+        """
+        page_images = self.image_store.load(pdf_name)
+        pages = self.get_page_labels(pdf_name)
+        if page_images is None or previous_pages is None or pages is None:
+            self.create_image_embeddings(pdf_name, pdf_path)
+            return
+        previous_indexes = {
+            page["doc_id"]: page["page_index"] for page in previous_pages.pages
         }
-        with open(f'/home/ub/Downloads/ash_temp/hack/yamaha-doc-bot/local_data/{pdf_name}.pkl', 'wb') as f:
-            pickle.dump(data, f)
+        kept: dict[int, tuple[int, str]] = {}
+        changed = []
+        for page in pages.pages:
+            previous_index = previous_indexes.get(page["doc_id"])
+            if previous_index is None or page_images.row(previous_index) is None:
+                changed.append(page["page_index"])
+            elif page["page_index"] >= FIRST_IMAGE_PAGE - 1:
+                kept[previous_index] = (page["page_index"], page["page_label"])
+        if not changed and kept == {
+            page["page"]: (page["page"], page["label"]) for page in page_images.pages
+        }:
+            logger.info("Page images of pdf_name=%s are unchanged", pdf_name)
+            return
+        logger.info(
+            "Updating the page images of pdf_name=%s: count=%s kept, count=%s to "
+            "embed",
+            pdf_name,
+            len(kept),
+            len(changed),
+        )
+        self.create_image_embeddings(
+            pdf_name, pdf_path, page_indexes=changed, kept=kept
+        )
 
-    def bulk_ingest(self, files: list[tuple[str, Path]]) -> list[IngestedDoc]:
+    def bulk_ingest(
+        self,
+        files: list[tuple[str, Path]],
+        image_embeddings: bool = True,
+        on_file_done: IngestedFileDone | None = None,
+    ) -> list[IngestedDoc]:
+        """Ingest several files, in parallel depending on the ingestion mode.
 
-        for file_name, file_path in files:
-            print(file_path)
-            self.create_image_embeddings(file_name, file_path)
+        With `image_embeddings`, the page images of the PDF files are embedded
+        first (synchronously). `on_file_done` is called as each file is done (in any order, from any
+        thread), with its name, its documents, and the error if it failed.
+        """
+        if image_embeddings:
+            for file_name, file_path in files:
+                if has_page_images(file_name):
+                    self.create_image_embeddings(file_name, file_path)
 
-        logger.info("Created Image embedding")
+            logger.info("Created Image embedding")
         logger.info("Ingesting file_names=%s", [f[0] for f in files])
-        documents = self.ingest_component.bulk_ingest(files)
+
+        def file_done(
+            file_name: str, documents: list[Document], error: str | None
+        ) -> None:
+            if on_file_done is not None:
+                on_file_done(
+                    file_name,
+                    [IngestedDoc.from_document(document) for document in documents],
+                    error,
+                )
+
+        documents = self.ingest_component.bulk_ingest(
+            files, on_file_done=file_done if on_file_done is not None else None
+        )
         logger.info("Finished ingestion file_name=%s", [f[0] for f in files])
         return [IngestedDoc.from_document(document) for document in documents]
 
+    def bulk_update(
+        self,
+        files: list[tuple[str, Path]],
+        image_embeddings: bool = True,
+        on_file_done: IngestedFileDone | None = None,
+    ) -> list[IngestedDoc]:
+        """Re-ingest already ingested files, only embedding their changed pages.
+
+        Returns the documents of the new or changed pages. `on_file_done` is
+        called as each file is updated, like for `bulk_ingest`.
+        """
+        logger.info("Updating file_names=%s", [f[0] for f in files])
+        documents = []
+        for file_name, file_path in files:
+            previous_pages = self.get_page_labels(file_name)
+            file_documents = self.update_file(file_name, file_path)
+            if image_embeddings and has_page_images(file_name):
+                self.update_image_embeddings(file_name, file_path, previous_pages)
+            documents.extend(file_documents)
+            if on_file_done is not None:
+                on_file_done(file_name, file_documents, None)
+        logger.info("Finished update file_names=%s", [f[0] for f in files])
+        return documents
+
+    def update_file(self, file_name: str, file_data: Path) -> list[IngestedDoc]:
+        """Re-ingest an already ingested file, only embedding its changed pages.
+
+        Returns the documents of the new or changed pages.
+        """
+        documents = self.ingest_component.update(file_name, file_data)
+        return [IngestedDoc.from_document(document) for document in documents]
+
     def list_ingested(self) -> list[IngestedDoc]:
         ingested_docs: list[IngestedDoc] = []
         try:
@@ -152,6 +352,49 @@ class IngestService:
         logger.debug("Found count=%s ingested documents", len(ingested_docs))
         return ingested_docs
 
+    def list_failed(self) -> list[FailedIngestion]:
+        """List the files that could not be ingested in a bulk ingestion.
+
+        Only the `pipeline` ingestion mode ingests files in the background, the
+        other modes raise the error to the caller.
+        """
+        return [
+            FailedIngestion(
+                object="ingest.failed_file",
+                file_name=failed_file.file_name,
+                stage=failed_file.stage,  # type: ignore[arg-type]
+                error=failed_file.error,
+                failed_at=datetime.fromtimestamp(failed_file.failed_at),
+            )
+            for failed_file in self.ingest_component.failed_files()
+        ]
+
+    def clear_failed(self) -> None:
+        self.ingest_component.clear_failed_files()
+
+    def get_page_labels(self, file_name: str) -> PageLabels | None:
+        """Get the page label <-> page index mapping of an ingested file.
+
+        Returns None if the file was not ingested, or has no page labels.
+        """
+        return self.ingest_component.page_labels.get(file_name)
+
+    def list_pages(self, doc_id: str) -> list[IngestedPage]:
+        """List the pages of the file the given document was ingested from.
+
+        :raises ValueError: if the document does not exist
+        """
+        ref_doc_info = self.storage_context.docstore.get_ref_doc_info(doc_id)
+        if ref_doc_info is None:
+            raise ValueError(f"Document {doc_id} not found")
+        file_name = ref_doc_info.metadata.get("file_name")
+        if not isinstance(file_name, str):
+            return []
+        page_labels = self.get_page_labels(file_name)
+        if page_labels is None:
+            return []
+        return [IngestedPage.from_page(file_name, page) for page in page_labels.pages]
+
     def delete(self, doc_id: str) -> None:
         """Delete an ingested document.
 
@@ -160,4 +403,51 @@ class IngestService:
         logger.info(
             "Deleting the ingested document=%s in the doc and index store", doc_id
         )
+        file_names = self._file_names([doc_id])
         self.ingest_component.delete(doc_id)
+        self._delete_unused_image_embeddings(file_names)
+
+    def delete_many(self, doc_ids: list[str]) -> None:
+        """Delete several ingested documents, saving the index once."""
+        logger.info("Deleting count=%s ingested documents", len(doc_ids))
+        file_names = self._file_names(doc_ids)
+        self.ingest_component.delete_many(doc_ids)
+        self._delete_unused_image_embeddings(file_names)
+
+    def _file_names(self, doc_ids: list[str]) -> set[str]:
+        """Names of the files the documents were ingested from."""
+        docstore = self.storage_context.docstore
+        file_names = set()
+        for doc_id in doc_ids:
+            ref_doc_info = docstore.get_ref_doc_info(doc_id)
+            if ref_doc_info is not None:
+                file_name = ref_doc_info.metadata.get("file_name")
+                if isinstance(file_name, str):
+                    file_names.add(file_name)
+        return file_names
+
+    def _delete_unused_image_embeddings(self, file_names: set[str]) -> None:
+        """Delete the page image embeddings of the files without any document left."""
+        if not file_names:
+            return
+        ref_docs = self.storage_context.docstore.get_all_ref_doc_info() or {}
+        remaining_file_names = {
+            ref_doc_info.metadata.get("file_name") for ref_doc_info in ref_docs.values()
+        }
+        for file_name in file_names - remaining_file_names:
+            logger.info("Deleting the page images of file_name=%s", file_name)
+            self.delete_image_embeddings(file_name)
+
+    def delete_by_file_name(self, file_name: str) -> list[str]:
+        """Delete all the ingested documents of a file.
+
+        Returns the ids of the deleted documents, empty if the file was not ingested.
+        """
+        logger.info("Deleting the ingested documents of file_name=%s", file_name)
+        self.delete_image_embeddings(file_name)
+        return self.ingest_component.delete_by_file_name(file_name)
+
+    def delete_image_embeddings(self, file_name: str) -> None:
+        """Delete the page image embeddings of a file, if any."""
+        self.image_index.remove(file_name)
+        self.image_store.delete(file_name)
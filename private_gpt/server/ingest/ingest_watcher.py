@@ -1,31 +1,75 @@
+import logging
+import os
+import threading
+import time
 from collections.abc import Callable
 from pathlib import Path
 from typing import Any
 
 from watchdog.events import (
     FileCreatedEvent,
+    FileDeletedEvent,
     FileModifiedEvent,
+    FileMovedEvent,
     FileSystemEvent,
     FileSystemEventHandler,
 )
 from watchdog.observers import Observer
 
+logger = logging.getLogger(__name__)
+
 
 class IngestWatcher:
+    """Watch a folder, reporting the changed and deleted files by batches.
+
+    The events of a file are coalesced until it is left alone for
+    `debounce_seconds`, and its size stays the same (a large file being copied is
+    reported once, when the copy is done). The changes are reported from a worker
+    thread, by batches of at most `max_batch_size` files, not to block the
+    watchdog thread. A renamed file is reported as deleted, then changed under
+    its new name.
+    """
+
     def __init__(
-        self, watch_path: Path, on_file_changed: Callable[[Path], None]
+        self,
+        watch_path: Path,
+        on_files_changed: Callable[[list[Path]], None],
+        on_file_deleted: Callable[[Path], None] | None = None,
+        debounce_seconds: float = 2.0,
+        max_batch_size: int = 100,
+        clock: Callable[[], float] = time.monotonic,
     ) -> None:
         self.watch_path = watch_path
-        self.on_file_changed = on_file_changed
+        self.on_files_changed = on_files_changed
+        self.on_file_deleted = on_file_deleted
+        self.debounce_seconds = debounce_seconds
+        self.max_batch_size = max_batch_size
+        self._clock = clock
+        # Pending path -> (deleted, time of its last event, its size at that time)
+        self._pending: dict[Path, tuple[bool, float, int]] = {}
+        self._pending_changed = threading.Condition()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._report_pending, daemon=True)
+
+        watcher = self
 
         class Handler(FileSystemEventHandler):
             def on_modified(self, event: FileSystemEvent) -> None:
                 if isinstance(event, FileModifiedEvent):
-                    on_file_changed(Path(event.src_path))
+                    watcher._add_pending(_event_path(event.src_path), deleted=False)
 
             def on_created(self, event: FileSystemEvent) -> None:
                 if isinstance(event, FileCreatedEvent):
-                    on_file_changed(Path(event.src_path))
+                    watcher._add_pending(_event_path(event.src_path), deleted=False)
+
+            def on_deleted(self, event: FileSystemEvent) -> None:
+                if isinstance(event, FileDeletedEvent):
+                    watcher._add_pending(_event_path(event.src_path), deleted=True)
+
+            def on_moved(self, event: FileSystemEvent) -> None:
+                if isinstance(event, FileMovedEvent):
+                    watcher._add_pending(_event_path(event.src_path), deleted=True)
+                    watcher._add_pending(_event_path(event.dest_path), deleted=False)
 
         event_handler = Handler()
         observer: Any = Observer()
@@ -33,13 +77,79 @@ class IngestWatcher:
         self._observer.schedule(event_handler, str(watch_path), recursive=True)
 
     def start(self) -> None:
+        self._worker.start()
         self._observer.start()
         while self._observer.is_alive():
             try:
                 self._observer.join(1)
             except KeyboardInterrupt:
                 break
+        self.stop()
 
     def stop(self) -> None:
-        self._observer.stop()
-        self._observer.join()
+        if self._observer.is_alive():
+            self._observer.stop()
+            self._observer.join()
+        self._stopped.set()
+        with self._pending_changed:
+            self._pending_changed.notify()
+        if self._worker.is_alive():
+            self._worker.join()
+
+    def _add_pending(self, path: Path, deleted: bool) -> None:
+        with self._pending_changed:
+            self._pending[path] = (deleted, self._clock(), _file_size(path))
+            self._pending_changed.notify()
+
+    def _take_ready(self) -> tuple[list[Path], list[Path]]:
+        """Take the pending files that are ready, the changed and the deleted ones."""
+        now = self._clock()
+        changed: list[Path] = []
+        deleted: list[Path] = []
+        for path, (is_deleted, last_event, size) in list(self._pending.items()):
+            if now - last_event < self.debounce_seconds:
+                continue
+            if is_deleted:
+                deleted.append(path)
+            elif (current_size := _file_size(path)) != size:
+                # Still being written, wait for another debounce window
+                self._pending[path] = (False, now, current_size)
+                continue
+            elif current_size >= 0:
+                if len(changed) == self.max_batch_size:
+                    continue
+                changed.append(path)
+            del self._pending[path]
+        return changed, deleted
+
+    def _report_pending(self) -> None:
+        while not self._stopped.is_set():
+            with self._pending_changed:
+                if not self._pending:
+                    self._pending_changed.wait()
+                else:
+                    self._pending_changed.wait(self.debounce_seconds / 2)
+                changed, deleted = self._take_ready()
+            try:
+                for path in deleted:
+                    logger.info("Detected deletion of path=%s", path)
+                    if self.on_file_deleted is not None:
+                        self.on_file_deleted(path)
+                if changed:
+                    logger.info("Detected change of count=%s files", len(changed))
+                    self.on_files_changed(changed)
+            except Exception:
+                logger.exception("Failed to process the changes in %s", self.watch_path)
+
+
+def _event_path(path: bytes | str) -> Path:
+    # watchdog reports bytes paths when watching a bytes path
+    return Path(os.fsdecode(path))
+
+
+def _file_size(path: Path) -> int:
+    """Size of the file, -1 if it does not exist (anymore)."""
+    try:
+        return path.stat().st_size
+    except OSError:
+        return -1
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Any, Literal
 
 from llama_index.core.schema import Document
@@ -30,3 +31,53 @@ class IngestedDoc(BaseModel):
             doc_id=document.doc_id,
             doc_metadata=IngestedDoc.curate_metadata(document.metadata),
         )
+
+
+class IngestedPage(BaseModel):
+    object: Literal["ingest.page"]
+    file_name: str = Field(examples=["Sales Report Q3 2023.pdf"])
+    page_index: int = Field(examples=[20])
+    page_label: str = Field(examples=["4-11"])
+    doc_id: str = Field(examples=["c202d5e6-7b69-4869-81cc-dd574ee8ee11"])
+
+    @staticmethod
+    def from_page(file_name: str, page: dict[str, Any]) -> "IngestedPage":
+        return IngestedPage(
+            object="ingest.page",
+            file_name=file_name,
+            page_index=page["page_index"],
+            page_label=page["page_label"],
+            doc_id=page["doc_id"],
+        )
+
+
+class IngestJobFile(BaseModel):
+    file_name: str = Field(examples=["Sales Report Q3 2023.pdf"])
+    stage: Literal["queued", "image_embeddings", "ingesting", "completed", "failed"]
+    doc_ids: list[str] = Field(
+        default_factory=list, examples=[["c202d5e6-7b69-4869-81cc-dd574ee8ee11"]]
+    )
+    error: str | None = None
+
+
+class IngestJob(BaseModel):
+    object: Literal["ingest.job"]
+    job_id: str = Field(examples=["0d5a3b1e-27c9-4c3f-8d0b-4f4f6c1f2a7e"])
+    status: Literal["queued", "running", "completed", "failed"]
+    files: list[IngestJobFile]
+    processed_files: int = Field(examples=[1])
+    eta: str | None = Field(
+        default=None,
+        description="Estimated time left, once enough files were processed.",
+        examples=["2m 10s @ 12/min"],
+    )
+
+
+class FailedIngestion(BaseModel):
+    object: Literal["ingest.failed_file"]
+    file_name: str = Field(examples=["Sales Report Q3 2023.pdf"])
+    stage: Literal["parse", "embed", "save"] = Field(
+        description="Stage of the ingestion that failed."
+    )
+    error: str = Field(examples=["FileDataError('Failed to open file')"])
+    failed_at: datetime
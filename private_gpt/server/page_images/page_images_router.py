@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from private_gpt.server.page_images.page_images_service import PageImagesService
+
+# Not authenticated, loaded by the browser from the links of the chat answers.
+page_images_router = APIRouter()
+
+
+@page_images_router.get(
+    "/context_images/{key}/{name}", tags=["Page images"], include_in_schema=False
+)
+def page_thumbnail(request: Request, key: str, name: str) -> Response:
+    """Thumbnail of a page image, linked from the sources of the chat answers.
+
+    The URL changes with the page image, the response is cached by the browser
+    for good.
+    """
+    service = request.state.injector.get(PageImagesService)
+    thumbnail = service.thumbnail(key, name)
+    if thumbnail is None:
+        raise HTTPException(404, "Page image not found")
+    return Response(
+        content=thumbnail,
+        media_type=service.media_type,
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
@@ -0,0 +1,65 @@
+from injector import inject, singleton
+
+from private_gpt.components.ingest.page_thumbnails import PageThumbnailCache
+from private_gpt.paths import local_data_path
+from private_gpt.server.ingest.ingest_service import IngestService
+from private_gpt.settings.settings import Settings
+
+# Hexadecimal characters of the page image hash in the URLs
+URL_HASH_LENGTH = 16
+
+
+@singleton
+class PageImagesService:
+    """Thumbnails of the page images, shown with the sources of the chat answers.
+
+    A thumbnail URL holds the file, the page and the hash of the page image: it is
+    stable across answers and restarts, and changes if the page image changes (the
+    file ingested again). It can be cached forever.
+    """
+
+    @inject
+    def __init__(self, ingest_service: IngestService, settings: Settings) -> None:
+        self._image_store = ingest_service.image_store
+        self._thumbnails = PageThumbnailCache(
+            local_data_path / "page_thumbnails",
+            max_size_bytes=settings.ui.context_images_cache_mb * 1024 * 1024,
+            width=settings.ui.context_images_width,
+        )
+
+    @property
+    def media_type(self) -> str:
+        return self._thumbnails.media_type
+
+    def thumbnail_url(self, pdf_name: str, page_index: int) -> str | None:
+        """URL (relative to the server root) of the thumbnail of a page.
+
+        Returns None if the page has no page image.
+        """
+        page_images = self._image_store.load(pdf_name)
+        row = page_images.row(page_index) if page_images else None
+        if page_images is None or row is None:
+            return None
+        image_hash = page_images.image_hash(row)[:URL_HASH_LENGTH]
+        return (
+            f"context_images/{page_images.key}/"
+            f"{page_index}-{image_hash}.{self._thumbnails.extension}"
+        )
+
+    def thumbnail(self, key: str, name: str) -> bytes | None:
+        """Thumbnail of a page, by its URL (see `thumbnail_url`).
+
+        Returns None if the page has no page image, or has another one.
+        """
+        page, _, image_hash = name.removesuffix(
+            f".{self._thumbnails.extension}"
+        ).partition("-")
+        page_images = self._image_store.load_by_key(key)
+        row = page_images.row(int(page)) if page_images and page.isdigit() else None
+        if page_images is None or row is None:
+            return None
+        if page_images.image_hash(row)[:URL_HASH_LENGTH] != image_hash:
+            return None
+        return self._thumbnails.get(
+            page_images.image_path(row), page_images.image_hash(row)
+        )
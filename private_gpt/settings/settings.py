@@ -78,6 +78,16 @@ class DataSettings(BaseModel):
         description="Path to local storage."
         "It will be treated as an absolute path if it starts with /"
     )
+    ingest_allowed_roots: list[str] = Field(
+        [],
+        description=(
+            "Folders (e.g. shared storage mounted on the server) whose files can be "
+            "ingested in place with the `/v1/ingest/paths` API, without uploading "
+            "them. The paths are resolved (following symbolic links) before being "
+            "checked.\n"
+            "If empty - the `/v1/ingest/paths` API is disabled."
+        ),
+    )
 
 
 class LLMSettings(BaseModel):
@@ -112,6 +122,23 @@ class VectorstoreSettings(BaseModel):
 
 class NodeStoreSettings(BaseModel):
     database: Literal["simple", "postgres"]
+    persist_mode: Literal["snapshot", "journal"] = Field(
+        "snapshot",
+        description=(
+            "How the `simple` docstore is saved after each ingestion or deletion:\n"
+            "If `snapshot` - the whole docstore is written to a JSON file. It is the historic behaviour, "
+            "its cost grows with the number of ingested documents.\n"
+            "If `journal` - only the changed nodes are appended to a journal, replayed on startup, "
+            "and compacted into the JSON file every `journal_compact_every` records."
+        ),
+    )
+    journal_compact_every: int = Field(
+        50000,
+        description=(
+            "Number of journal records (written or deleted nodes and documents) after "
+            "which the journal is compacted into the docstore JSON file."
+        ),
+    )
 
 
 class LlamaCPPSettings(BaseModel):
@@ -159,7 +186,7 @@ class HuggingFaceSettings(BaseModel):
 
 class EmbeddingSettings(BaseModel):
     mode: Literal["huggingface", "openai", "azopenai", "sagemaker", "ollama", "mock"]
-    ingest_mode: Literal["simple", "batch", "parallel", "pipeline"] = Field(
+    ingest_mode: Literal["simple", "batch", "parallel", "pipeline", "process"] = Field(
         "simple",
         description=(
             "The ingest mode to use for the embedding engine:\n"
@@ -169,20 +196,161 @@ class EmbeddingSettings(BaseModel):
             "In `pipeline` - The Embedding engine is kept as busy as possible\n"
             "If `parallel` - parse the files in parallel using multiple cores, and embedd them in parallel.\n"
             "`parallel` is the fastest mode for local setup, as it parallelize IO RW in the index.\n"
+            "If `process` - like `pipeline`, but the embeddings are computed by worker "
+            "processes, each loading its own embedding model, instead of threads.\n"
             "For modes that leverage parallelization, you can specify the number of "
             "workers to use with `count_workers`.\n"
         ),
     )
-    count_workers: int = Field(
+    count_workers: int | Literal["auto"] = Field(
         2,
         description=(
             "The number of workers to use for file ingestion.\n"
             "In `batch` mode, this is the number of workers used to parse the files.\n"
             "In `parallel` mode, this is the number of workers used to parse the files and embed them.\n"
-            "In `pipeline` mode, this is the number of workers that can perform embeddings.\n"
+            "In `pipeline` and `process` modes, this is the number of workers that can perform embeddings, "
+            "and the number of processes used to parse the files in bulk ingestion.\n"
             "This is only used if `ingest_mode` is not `simple`.\n"
             "Do not go too high with this number, as it might cause memory issues. (especially in `parallel` mode)\n"
-            "Do not set it higher than your number of threads of your CPU."
+            "Do not set it higher than your number of threads of your CPU.\n"
+            "If `auto` - the number of workers is calibrated on the first files of the first "
+            "bulk ingestion, from the number of cores and the memory taken to parse them, "
+            "and lowered at runtime when the memory used gets close to `max_rss_mb`."
+        ),
+    )
+    max_rss_mb: int = Field(
+        0,
+        description=(
+            "With `count_workers: auto`, memory (in MB) that the ingestion (the server "
+            "and its worker processes) should not exceed. Fewer workers are used when "
+            "the memory used gets above 90% of it, until it gets back below 70%.\n"
+            "If `0` - 80% of the memory of the machine."
+        ),
+    )
+    torch_threads: int = Field(
+        0,
+        description=(
+            "In `process` mode, number of torch threads of each embedding worker "
+            "process.\n"
+            "If `0` - the cores are shared between the `count_workers` workers."
+        ),
+    )
+    embedding_worker_mb: int = Field(
+        0,
+        description=(
+            "In `process` mode with `count_workers: auto`, memory (in MB) taken by an "
+            "embedding worker process, with its own copy of the embedding model. "
+            "As many workers as fit in the available memory are started, and no "
+            "more than the cores divided by `torch_threads` (4 if `0`).\n"
+            "If `0` - 1024 MB, enough for a small embedding model."
+        ),
+    )
+    pages_per_shard: int = Field(
+        0,
+        description=(
+            "Split large PDF files into ranges of this many pages, parsed in parallel.\n"
+            "In `batch` and `parallel` modes, the page ranges of a single PDF are "
+            "parsed by the `count_workers` parsing processes, so that the parsing time "
+            "of a large manual scales with the number of workers.\n"
+            "PDF files with fewer pages, and other file types, are parsed as a whole.\n"
+            "If `0` - files are never split. It is the historic behaviour."
+        ),
+    )
+    batch_flush_nodes: int = Field(
+        0,
+        description=(
+            "In `batch` mode, stream the bulk ingestion: the files are embedded and "
+            "saved as they are parsed, by batches of at least this many nodes, instead "
+            "of all at once. The memory used then depends on the batch size, not on "
+            "the number of files. The nodes of a file are always saved together.\n"
+            "If `0` (and `batch_flush_mb` is `0`) - all the files are parsed, then "
+            "embedded and saved at once. It is the historic behaviour."
+        ),
+    )
+    batch_flush_mb: int = Field(
+        0,
+        description=(
+            "In `batch` mode, stream the bulk ingestion (see `batch_flush_nodes`), "
+            "saving a batch once the text and metadata of its nodes reach this size "
+            "(in MB).\n"
+            "If `0` - only `batch_flush_nodes` is used."
+        ),
+    )
+    remove_boilerplate: bool = Field(
+        True,
+        description=(
+            "Remove the running headers, footers and page numbers repeated on the "
+            "pages of a document before splitting it into nodes, so that they are not "
+            "embedded again for every node. The page label is kept in the metadata."
+        ),
+    )
+    deduplicate_chunks: bool = Field(
+        False,
+        description=(
+            "Merge the chunks identical or near-identical to an already ingested "
+            "chunk (e.g. from another edition or model variant of a manual): they are "
+            "not embedded nor stored again, the stored chunk is returned with the "
+            "documents of its duplicates.\n"
+            "Restricting a query to some documents (`context_filter`) only matches "
+            "the stored chunks of these documents.\n"
+            "The ingestion cache (`ingest_cache_size_mb`) is then disabled.\n"
+            "If `false` - every chunk is stored. It is the historic behaviour."
+        ),
+    )
+    deduplicate_threshold: float = Field(
+        0.9,
+        description=(
+            "With `deduplicate_chunks`, similarity (estimated Jaccard similarity of "
+            "their 5-character shingles) from which two chunks are merged. `1.0` "
+            "only merges the chunks made of the same shingles."
+        ),
+    )
+    ingest_cache_size_mb: int = Field(
+        0,
+        description=(
+            "Maximum size (in MB) of the ingestion cache, stored in the local data folder.\n"
+            "The nodes and embeddings of the ingested files are cached by file content "
+            "(and by reader, node parser and embedding model). Ingesting the same bytes "
+            "again, under the same or another file name, reuses them instead of parsing "
+            "and embedding the file again. The least recently used entries are evicted.\n"
+            "If `0` - the cache is disabled. It is the historic behaviour."
+        ),
+    )
+    ingest_job_workers: int = Field(
+        1,
+        description=(
+            "Number of ingestion jobs (submitted to `/v1/ingest/jobs` or from the UI) "
+            "run at the same time, in background threads. The other jobs are queued."
+        ),
+    )
+    image_dpi: int = Field(
+        300,
+        description=(
+            "Resolution (in dots per inch) the pages of the PDF files are rendered at, "
+            "for display. The page images are kept compressed as PNG."
+        ),
+    )
+    image_embedding_dpi: int = Field(
+        72,
+        description=(
+            "Resolution (in dots per inch) the pages of the PDF files are rendered at, "
+            "for their image embeddings. The image embedding model (CLIP) shrinks "
+            "the pages to 224 pixels, a higher resolution only slows the rendering."
+        ),
+    )
+    image_batch_size: int = Field(
+        16,
+        description=(
+            "Number of pages rendered and embedded at once for the image embeddings. "
+            "Each page rendering worker renders one batch of pages at a time, the "
+            "embedded pages are kept compressed."
+        ),
+    )
+    image_render_workers: int = Field(
+        0,
+        description=(
+            "Number of worker processes rendering the pages of the PDF files for "
+            "their image embeddings. If `0` - one worker per core."
         ),
     )
     embed_dim: int = Field(
@@ -294,6 +462,21 @@ class UISettings(BaseModel):
     delete_all_files_button_enabled: bool = Field(
         False, description="If the button to delete all files is enabled or not."
     )
+    context_images_width: int = Field(
+        1024,
+        description=(
+            "Width (in pixels) of the page thumbnails linked from the sources of the "
+            "chat answers, served from `/context_images`."
+        ),
+    )
+    context_images_cache_mb: int = Field(
+        256,
+        description=(
+            "Maximum size (in MB) of the page thumbnails cache, stored in the local "
+            "data folder. The least recently used thumbnails are evicted, and encoded "
+            "again when requested."
+        ),
+    )
 
 
 class RerankSettings(BaseModel):
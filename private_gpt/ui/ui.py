@@ -15,22 +15,21 @@ from injector import inject, singleton
 from llama_index.core.llms import ChatMessage, ChatResponse, MessageRole
 from pydantic import BaseModel
 
+from private_gpt.components.ingest.page_image_index import PageImageIndex
 from private_gpt.constants import PROJECT_ROOT_PATH
 from private_gpt.di import global_injector
 from private_gpt.open_ai.extensions.context_filter import ContextFilter
 from private_gpt.server.chat.chat_service import ChatService, CompletionGen
 from private_gpt.server.chunks.chunks_service import Chunk, ChunksService
+from private_gpt.server.ingest.ingest_job_service import IngestJobService
 from private_gpt.server.ingest.ingest_service import IngestService
+from private_gpt.server.page_images.page_images_service import PageImagesService
 from private_gpt.settings.settings import settings
 from private_gpt.ui.images import logo_svg
 
-import pickle
-import faiss
 import numpy as np
 from PIL import Image
-from sentence_transformers import util
 import private_gpt.ui.load_text_model as load_text_model
-import uuid
 
 from dotenv import load_dotenv
 # REPLICATE_API_TOKEN = ...  in private_gpt/ui/.env 
@@ -62,50 +61,29 @@ def eng2jap(text: str) -> str:
     translated = GoogleTranslator(source="auto", target="ja").translate(text=text)
     return translated
 
-def gen_from_vision(pdf_name,message,img_name: str | None = None, save_image_only: bool = True):
+def gen_from_vision(pdf_names,message,save_image_only: bool = True, *, image_index: PageImageIndex):
     # return "In the end, say thank you!"
-    def load_database_pickle(pickle_filename):
-        with open(pickle_filename, 'rb') as f:
-            data = pickle.load(f)
-        # print(data['summary'])
-        return data['pdf_name'], data['images'], data['embeddings']
 
-    pdf_name, images, embeddings = load_database_pickle(f'/home/ub/Downloads/ash_temp/hack/yamaha-doc-bot/local_data/{pdf_name}.pkl')
-    
-    save_path=f'/tmp/hackathon/{img_name}'
-    def save_image(query):
+    def find_image(query):
         # text_model = SentenceTransformer('sentence-transformers/clip-ViT-B-32-multilingual-v1', device='cuda:3')
         text_model=load_text_model.text_model
 
         query_emb = text_model.encode(query)
 
-        # Instantiate a FAISS index
-        # index = faiss.IndexFlatL2(embeddings.shape[1])
-
-        # Add the embeddings to the index
-        # index.add(embeddings)
-
-        # Query
-        # query_embedding = query_emb
-
-        # Perform a k-nearest neighbor search
+        # Perform a k-nearest neighbor search in the FAISS index
         k = 5  # Number of nearest neighbors to retrieve
-        # distances, indices = index.search(np.array([query_embedding]), k)
-        # print(indices, distances)
-        # Then, we use the util.semantic_search function, which computes the cosine-similarity
-        # between the query embedding and all image embeddings.
+        # One search over the pages of all the source files, on the cosine-similarity
+        # between the query embedding and the image embeddings.
         # It then returns the top_k highest ranked images, which we output
-        hits = util.semantic_search(query_emb, embeddings, top_k=k)[0]
+        hits = image_index.search(query_emb, top_k=k, pdf_names=pdf_names)
         print(hits)
         ##################
-        # page_idx=int(indices[0][0])  # least distance (top 1)
-
-        # context_img=images[page_idx]
-        # if len(hits):
-        context_img=images[hits[0]['corpus_id']]
-        context_img.save(save_path)  # Saves the Context image(having least distance in index.search)
-        
-    save_image(message)
+        # The Context image(having least distance in index.search), as stored
+        return hits[0].image_path if hits else None
+
+    image_path = find_image(message)
+    if image_path is None:
+        return ''
     if(save_image_only):
         return ''
 
@@ -116,19 +94,19 @@ def gen_from_vision(pdf_name,message,img_name: str | None = None, save_image_onl
         temperature=0.1,
     )
 
-    def vision_gen_response(query,img_name: str | None = None):
+    def vision_gen_response(query):
         ##################
         # prompt = f"describe every component of the image in detail. Also answer this question in detail: Q:{query}"
         prompt = f"Answer this question in detail: Q:{query}"
 
         llava_response = multi_modal_llm.complete(
             prompt=prompt,
-            image_documents=[ImageDocument(image_path=save_path)]  #img_paths[indices[0][0]])],
+            image_documents=[ImageDocument(image_path=str(image_path))]  #img_paths[indices[0][0]])],
         )
         # return img_paths[indices[0][0]], img_embeddings[indices[0][0]], indices[0][0], llava_response.text
         return llava_response.text
     
-    return vision_gen_response(message,img_name)
+    return vision_gen_response(message)
 
 class Source(BaseModel):
     file: str
@@ -167,15 +145,19 @@ class PrivateGptUi:
         ingest_service: IngestService,
         chat_service: ChatService,
         chunks_service: ChunksService,
+        ingest_job_service: IngestJobService,
+        page_images_service: PageImagesService,
     ) -> None:
         self._ingest_service = ingest_service
+        self._page_images_service = page_images_service
+        self._ingest_job_service = ingest_job_service
         self._chat_service = chat_service
         self._chunks_service = chunks_service
 
         # Cache the UI blocks
         self._ui_block = None
 
-        self._selected_filename = None
+        self._selected_filename: str | None = None
 
         # Initialize system prompt based on default mode
         self.mode = MODES[0]
@@ -195,38 +177,6 @@ class PrivateGptUi:
 
             if completion_gen.sources:
 
-                import pdfplumber,pickle
-                def list_pages(file_path: str) -> list:
-                    pages_num=[]
-                    with pdfplumber.open(file_path) as pdf:
-                        for i in range(len(pdf.pages)):
-                            page_num=pdf.pages[i].extract_text().split('\n')[-1]
-                            if(sum([not v.isnumeric() for v in page_num.split('-')])):
-                                page_num=str(i+1)
-
-                            # print(page_num)
-                            pages_num.append(page_num)
-                    # print(pages_num)
-                    return pages_num
-                
-
-                def display_images(pdf_name,page_idx,img_name):
-    
-                    # return "In the end, say thank you!"
-                    def load_database_pickle(pickle_filename):
-                        with open(pickle_filename, 'rb') as f:
-                            data = pickle.load(f)
-                        # print(data['summary'])
-                        return data['pdf_name'], data['images'], data['embeddings']
-
-                    # pdf_name, images, embeddings = load_database_pickle(f'/home/vinayak/Desktop/IIT/8/dl/project/yamaha-doc-bot/local_data/{pdf_name}.pkl')
-                    pdf_name, images, embeddings = load_database_pickle(f'/home/ub/Downloads/ash_temp/hack/yamaha-doc-bot/local_data/{pdf_name}.pkl')
-
-                    save_path=f'/tmp/hackathon/{img_name}'
-                    images[page_idx-1].save(save_path)
-
-                    return
-                
                 full_response += SOURCES_SEPARATOR
                 cur_sources = Source.curate_sources(completion_gen.sources)
                 sources_text = "\n\n\n"
@@ -237,22 +187,22 @@ class PrivateGptUi:
                     if f"{source.file}-{source.page}" not in used_files:
                         
 
-                        first_page=7
-                        npzfile=list_pages(str(f'/home/ub/Downloads/ash_temp/hack/yamaha-doc-bot/local_data/pdfs/{source.file}'))
-                        print(npzfile)
-                        map_pages=dict()
-                        for i in range(len(npzfile)):
-                            map_pages[npzfile[i]]=i+1-first_page+1
-                        print(map_pages)
-                        # print(f"map_pages['4-5']={map_pages['4-5']}")
-
-                        page_idx=map_pages[source.page]
-                        # page_idx=map_pages[source.page]
+                        # Page labels are mapped to page indexes at ingestion time
+                        page_labels = self._ingest_service.get_page_labels(source.file)
+                        page_index = (
+                            page_labels.page_index(source.page) if page_labels else None
+                        )
 
-                        id=str(uuid.uuid4())
-                        fname=source.file
-                        display_images(fname,page_idx,f'{id}.png')
-                        img_txt=f"{index}. {source.file} (<a href='context_images/{id}.png'> page {source.page} </a>) \n\n"
+                        # Stable URL of the page thumbnail, encoded once when first shown
+                        img_url = (
+                            self._page_images_service.thumbnail_url(source.file, page_index)
+                            if page_index is not None
+                            else None
+                        )
+                        if img_url is not None:
+                            img_txt=f"{index}. {source.file} (<a href='{img_url}'> page {source.page} </a>) \n\n"
+                        else:
+                            img_txt=f"{index}. {source.file} (page {source.page}) \n\n"
 
                         sources_text = (
                             sources_text
@@ -332,16 +282,11 @@ class PrivateGptUi:
                 
                 ############## Generate additional response from gen_from_vision() #############
                 additional_response=[]
-                img_name=str(uuid.uuid4())+'.png'
-                print('\nBefore image',img_name,'-'*20,'\n')
                 cur_sources = Source.curate_sources(query_stream.sources)
-                used_files = set()
-                for index, source in enumerate(cur_sources, start=1):
-                    if f"{source.file}" not in used_files:
-
-                        additional_response=gen_from_vision(source.file,message,img_name,save_image_only=False)
-
-                        used_files.add(f"{source.file}")  # Unique files only
+                # Unique files only, searched at once
+                used_files = list(dict.fromkeys(source.file for source in cur_sources))
+                if used_files:
+                    additional_response=gen_from_vision(used_files,message,save_image_only=False,image_index=self._ingest_service.image_index)
                 
                 # print(additional_response)
 
@@ -369,22 +314,12 @@ class PrivateGptUi:
                 )
                 final_resp = ""
                 
-                img_name=str(uuid.uuid4())+'.png'
-                print('\nAfter image',img_name,'-'*20,'\n')
                 for stream in yield_deltas(next_response,None):
                     final_resp = stream
                 
-                # final_resp += f'\n<img src="context_images/{img_name}">' if img_name else ''
+                # The page images of the sources are linked from the answer, as
+                # thumbnails (see yield_deltas)
 
-                cur_sources = Source.curate_sources(next_response.sources)
-                used_files = set()
-                for index, source in enumerate(cur_sources, start=1):
-                    if f"{source.file}" not in used_files:
-
-                        additional_response=gen_from_vision(source.file,final_resp,img_name,save_image_only=True)
-
-                        used_files.add(f"{source.file}")  # Unique files only
-                
                 # print(type(final_resp))
                 
                 # if(flag):
@@ -462,34 +397,72 @@ class PrivateGptUi:
             files.add(file_name)
         return [[row] for row in files]
 
-    def _upload_file(self, files: list[str]) -> None:
+    def _upload_file(
+        self, files: list[str], job_progress: dict[str, int]
+    ) -> dict[str, int]:
         logger.debug("Loading count=%s files", len(files))
         paths = [Path(file) for file in files]
 
-        # remove all existing Documents with name identical to a new file upload:
-        file_names = [path.name for path in paths]
-        doc_ids_to_delete = []
-        for ingested_document in self._ingest_service.list_ingested():
-            if (
-                ingested_document.doc_metadata
-                and ingested_document.doc_metadata["file_name"] in file_names
-            ):
-                doc_ids_to_delete.append(ingested_document.doc_id)
-        if len(doc_ids_to_delete) > 0:
+        # Files with a name identical to an already ingested file are updated:
+        # only their new or changed pages are ingested again
+        ingested_file_names = {
+            ingested_document.doc_metadata["file_name"]
+            for ingested_document in self._ingest_service.list_ingested()
+            if ingested_document.doc_metadata
+        }
+        files_to_ingest = [(str(path.name), path) for path in paths]
+        files_to_update = {
+            file_name
+            for file_name, _ in files_to_ingest
+            if file_name in ingested_file_names
+        }
+        if len(files_to_update) > 0:
             logger.info(
-                "Uploading file(s) which were already ingested: %s document(s) will be replaced.",
-                len(doc_ids_to_delete),
+                "Uploading file(s) which were already ingested: %s file(s) will be updated.",
+                len(files_to_update),
             )
-            for doc_id in doc_ids_to_delete:
-                self._ingest_service.delete(doc_id)
 
-        self._ingest_service.bulk_ingest([(str(path.name), path) for path in paths])
+        job = self._ingest_job_service.submit(
+            files_to_ingest, update_file_names=files_to_update, image_embeddings=True
+        )
+        logger.info("Submitted ingestion job=%s", job.job_id)
+        # Ingested in the background, polled by `_poll_ingest_jobs`
+        return {**job_progress, job.job_id: 0}
+
+    def _poll_ingest_jobs(
+        self, job_progress: dict[str, int]
+    ) -> tuple[dict[str, int], Any]:
+        """Refresh the ingested files list as the files of the uploads are done.
+
+        `job_progress` holds the count of files processed by each upload job still
+        running, the finished jobs are dropped from it.
+        """
+        running = {}
+        refresh = False
+        for job_id, processed_files in job_progress.items():
+            job = self._ingest_job_service.get(job_id)
+            if job is None:
+                continue
+            refresh = refresh or job.processed_files > processed_files
+            if job.status in ("queued", "running"):
+                running[job_id] = job.processed_files
+        return running, (
+            gr.List(self._list_ingested_files()) if refresh else gr.update()
+        )
 
     def _delete_all_files(self) -> Any:
         ingested_files = self._ingest_service.list_ingested()
         logger.debug("Deleting count=%s files", len(ingested_files))
-        for ingested_document in ingested_files:
-            self._ingest_service.delete(ingested_document.doc_id)
+        self._ingest_service.delete_many(
+            [ingested_document.doc_id for ingested_document in ingested_files]
+        )
+        for file_name in {
+            ingested_document.doc_metadata["file_name"]
+            for ingested_document in ingested_files
+            if ingested_document.doc_metadata
+            and "file_name" in ingested_document.doc_metadata
+        }:
+            self._ingest_service.delete_image_embeddings(file_name)
         return [
             gr.List(self._list_ingested_files()),
             gr.components.Button(interactive=False),
@@ -499,14 +472,9 @@ class PrivateGptUi:
 
     def _delete_selected_file(self) -> Any:
         logger.debug("Deleting selected %s", self._selected_filename)
-        # Note: keep looping for pdf's (each page became a Document)
-        for ingested_document in self._ingest_service.list_ingested():
-            if (
-                ingested_document.doc_metadata
-                and ingested_document.doc_metadata["file_name"]
-                == self._selected_filename
-            ):
-                self._ingest_service.delete(ingested_document.doc_id)
+        # Each page of a pdf became a Document, they are deleted together
+        if self._selected_filename is not None:
+            self._ingest_service.delete_by_file_name(self._selected_filename)
         return [
             gr.List(self._list_ingested_files()),
             gr.components.Button(interactive=False),
@@ -590,10 +558,18 @@ class PrivateGptUi:
                         interactive=False,
                         render=False,  # Rendered under the button
                     )
+                    # Files processed by the upload jobs of the session, by job
+                    job_progress = gr.State({})
                     upload_button.upload(
                         self._upload_file,
-                        inputs=upload_button,
-                        outputs=ingested_dataset,
+                        inputs=[upload_button, job_progress],
+                        outputs=job_progress,
+                    )
+                    blocks.load(
+                        self._poll_ingest_jobs,
+                        inputs=job_progress,
+                        outputs=[job_progress, ingested_dataset],
+                        every=2,
                     )
                     ingested_dataset.change(
                         self._list_ingested_files,
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Measure what the boilerplate removal saves before embedding.
+
+The bundled manuals are parsed and split with the ingestion node parser, with and
+without `BoilerplateRemover`. The number of nodes and of embedded characters are
+reported, and the embedding time when a HuggingFace model is given.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.node_parser import SentenceWindowNodeParser
+from llama_index.core.schema import BaseNode, MetadataMode, TransformComponent
+
+from private_gpt.components.ingest.boilerplate import BoilerplateRemover
+from private_gpt.components.ingest.ingest_helper import IngestionHelper
+
+
+def _embed_time(nodes: list[BaseNode], model_name: str | None) -> float | None:
+    if model_name is None:
+        return None
+    try:
+        from llama_index.embeddings.huggingface import (  # type: ignore
+            HuggingFaceEmbedding,
+        )
+    except ImportError as e:
+        raise ImportError(
+            "Local dependencies not found, install with `poetry install --extras embeddings-huggingface`"
+        ) from e
+
+    embed_model = HuggingFaceEmbedding(model_name=model_name)
+    start = time.perf_counter()
+    embed_model(nodes)
+    return time.perf_counter() - start
+
+
+parser = argparse.ArgumentParser(prog="benchmark_boilerplate.py")
+parser.add_argument(
+    "files",
+    nargs="*",
+    help="Files to ingest, defaults to the bundled manuals",
+    default=sorted(Path("pdfs_data").glob("*.pdf")),
+)
+parser.add_argument(
+    "--embedding-model",
+    help="HuggingFace embedding model used to time the embeddings, "
+    "e.g. BAAI/bge-small-en-v1.5",
+    default=None,
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    node_parser = SentenceWindowNodeParser.from_defaults()
+    pipelines: dict[str, list[TransformComponent]] = {
+        "as is": [node_parser],
+        "boilerplate removed": [BoilerplateRemover(), node_parser],
+    }
+    documents = [
+        document
+        for file_path in map(Path, args.files)
+        for document in IngestionHelper.transform_file_into_documents(
+            file_path.name, file_path
+        )
+    ]
+    print(f"{len(args.files)} files, {len(documents)} pages")
+    print(
+        "{:<20} | {:>6} | {:>16} | {:>10}".format(
+            "", "Nodes", "Embedded chars", "Embedding"
+        )
+    )
+    print("-" * 62)
+    for name, transformations in pipelines.items():
+        nodes = run_transformations(documents, transformations)  # type: ignore[arg-type]
+        chars = sum(len(node.get_content(MetadataMode.EMBED)) for node in nodes)
+        embed_time = _embed_time(nodes, args.embedding_model)
+        embedding = f"{embed_time:.2f}s" if embed_time is not None else "-"
+        print(f"{name:<20} | {len(nodes):>6} | {chars:>16,} | {embedding:>10}")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Compare the page renderers of the image embeddings.
+
+`pdf2image` is the historic path: poppler `pdftoppm` subprocesses rendering the
+pages at the display resolution, used for the embeddings too, compressed to PNG
+in the current process.
+`pymupdf` is `PageRenderer`, rendering the pages at two resolutions in worker
+processes.
+The images are not embedded, only rendered.
+"""
+
+import argparse
+import io
+import time
+from pathlib import Path
+
+from private_gpt.components.ingest.page_renderer import PageRenderer, count_pdf_pages
+
+
+def _pdf2image_render(file_path: Path, dpi: int, batch_size: int) -> None:
+    from pdf2image import convert_from_path  # type: ignore
+
+    count_pages = count_pdf_pages(file_path)
+    for start in range(1, count_pages + 1, batch_size):
+        for image in convert_from_path(
+            file_path,
+            dpi=dpi,
+            first_page=start,
+            last_page=min(start + batch_size - 1, count_pages),
+        ):
+            image.save(io.BytesIO(), format="PNG", compress_level=1)
+
+
+def _pymupdf_render(renderer: PageRenderer, file_path: Path, batch_size: int) -> None:
+    for _ in renderer.render(file_path, batch_size=batch_size):
+        pass
+
+
+parser = argparse.ArgumentParser(prog="benchmark_page_renderer.py")
+parser.add_argument(
+    "files",
+    nargs="*",
+    help="PDF files to render, defaults to the bundled manuals",
+    default=sorted(Path("pdfs_data").glob("*.pdf")),
+)
+parser.add_argument("--dpi", type=int, default=300, help="Display resolution")
+parser.add_argument("--embedding-dpi", type=int, default=72)
+parser.add_argument("--batch-size", type=int, default=16)
+parser.add_argument("--workers", type=int, default=4, help="PyMuPDF workers")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    renderer = PageRenderer(args.workers, args.embedding_dpi, args.dpi)
+    print(
+        "{:<30} | {:>5} | {:>10} | {:>10} | {:>7}".format(
+            "File", "Pages", "pdf2image", "pymupdf", "speedup"
+        )
+    )
+    print("-" * 74)
+    try:
+        # Not timed: spawns the workers
+        _pymupdf_render(renderer, Path(args.files[0]), args.batch_size)
+        for file_path in map(Path, args.files):
+            start = time.perf_counter()
+            _pymupdf_render(renderer, file_path, args.batch_size)
+            pymupdf = time.perf_counter() - start
+            try:
+                start = time.perf_counter()
+                _pdf2image_render(file_path, args.dpi, args.batch_size)
+                elapsed = time.perf_counter() - start
+                legacy, speedup = f"{elapsed:>9.2f}s", f"{elapsed / pymupdf:>6.1f}x"
+            except ImportError:
+                legacy, speedup = f"{'n/a':>10}", f"{'n/a':>7}"
+            print(
+                f"{file_path.name[:30]:<30} | {count_pdf_pages(file_path):>5} | "
+                f"{legacy} | {pymupdf:>9.2f}s | {speedup}"
+            )
+    finally:
+        renderer.close()
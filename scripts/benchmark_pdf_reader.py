@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Compare the PDF readers used at ingestion time.
+
+`legacy` is the historic path: llama-index `PDFReader` followed by a second
+pdfplumber parse of the file to read the printed page labels.
+`single-pass` is `PDFPageLabelReader`, reading both in one PyMuPDF parse.
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from llama_index.core.schema import Document
+from llama_index.readers.file.docs import PDFReader  # type: ignore
+
+from private_gpt.components.ingest.ingest_helper import (
+    PDFPageLabelReader,
+    printed_page_label,
+)
+
+
+def _legacy_load(file_path: Path) -> list[Document]:
+    import pdfplumber  # type: ignore
+
+    docs = PDFReader().load_data(file_path)
+    with pdfplumber.open(file_path) as pdf:
+        for i, page in enumerate(pdf.pages):
+            docs[i].metadata["page_label"] = printed_page_label(
+                page.extract_text() or "", i
+            )
+    return docs
+
+
+def _single_pass_load(file_path: Path) -> list[Document]:
+    return PDFPageLabelReader().load_data(file_path)
+
+
+def _time(
+    load: Callable[[Path], list[Document]], file_path: Path, rounds: int
+) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        load(file_path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+parser = argparse.ArgumentParser(prog="benchmark_pdf_reader.py")
+parser.add_argument(
+    "files",
+    nargs="*",
+    help="PDF files to parse, defaults to the bundled manuals",
+    default=sorted(Path("pdfs_data").glob("*.pdf")),
+)
+parser.add_argument("--rounds", type=int, default=3, help="Best of N rounds")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    print(
+        "{:<30} | {:>5} | {:>10} | {:>11} | {:>7}".format(
+            "File", "Pages", "legacy", "single-pass", "speedup"
+        )
+    )
+    print("-" * 76)
+    for file_path in map(Path, args.files):
+        legacy_docs = _legacy_load(file_path)
+        single_pass_docs = _single_pass_load(file_path)
+        mismatches = sum(
+            a.metadata["page_label"] != b.metadata["page_label"]
+            for a, b in zip(legacy_docs, single_pass_docs, strict=True)
+        )
+        legacy = _time(_legacy_load, file_path, args.rounds)
+        single_pass = _time(_single_pass_load, file_path, args.rounds)
+        print(
+            f"{file_path.name[:30]:<30} | {len(single_pass_docs):>5} | "
+            f"{legacy:>9.2f}s | {single_pass:>10.2f}s | {legacy / single_pass:>6.1f}x"
+        )
+        if mismatches:
+            print(f"  ! {mismatches} page label(s) differ between the two readers")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Measure the startup import cost saved by the lazy file reader registry.
+
+Each measurement runs in a fresh interpreter, as the server and every worker
+process forked by the `batch` / `parallel` ingest modes do.
+"""
+
+import argparse
+import subprocess
+import sys
+
+# Modules that used to be imported by `ingest_helper` at import time
+EAGER_READER_MODULES = [
+    "llama_index.readers.file.docs",
+    "llama_index.readers.file.epub",
+    "llama_index.readers.file.image",
+    "llama_index.readers.file.ipynb",
+    "llama_index.readers.file.markdown",
+    "llama_index.readers.file.mbox",
+    "llama_index.readers.file.slides",
+    "llama_index.readers.file.tabular",
+    "llama_index.readers.file.video_audio",
+    "fitz",
+    "pdfplumber",
+]
+
+_TIMED_IMPORT = """
+import importlib, time
+{setup}
+start = time.perf_counter()
+for module in {modules!r}:
+    importlib.import_module(module)
+print(time.perf_counter() - start)
+"""
+
+
+def _import_time(modules: list[str], setup: str = "", rounds: int = 5) -> float:
+    code = _TIMED_IMPORT.format(setup=setup, modules=modules)
+    return min(
+        float(
+            subprocess.run(
+                [sys.executable, "-c", code],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.split()[-1]
+        )
+        for _ in range(rounds)
+    )
+
+
+parser = argparse.ArgumentParser(prog="benchmark_reader_imports.py")
+parser.add_argument("--rounds", type=int, default=5, help="Best of N rounds")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    helper = "private_gpt.components.ingest.ingest_helper"
+    lazy = _import_time([helper], rounds=args.rounds)
+    # Cost of the readers that are no longer imported up front
+    saved = _import_time(
+        EAGER_READER_MODULES, setup=f"import {helper}", rounds=args.rounds
+    )
+    print(f"import {helper}: {lazy * 1000:.0f}ms")
+    print(f"eager reader imports saved: {saved * 1000:.0f}ms")
+    print(f"  (the old import cost was ~{(lazy + saved) * 1000:.0f}ms)")
@@ -1,24 +1,101 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
+import json
 import logging
+import os
+from datetime import datetime
 from pathlib import Path
 
 from private_gpt.di import global_injector
+from private_gpt.paths import local_data_path
 from private_gpt.server.ingest.ingest_service import IngestService
 from private_gpt.server.ingest.ingest_watcher import IngestWatcher
 
 logger = logging.getLogger(__name__)
 
+MANIFEST_PATH = local_data_path / "ingest_manifest.jsonl"
+
+
+def _file_hash(file_path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with file_path.open("rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class IngestManifest:
+    """Files already ingested from the folder, to resume an interrupted ingestion.
+
+    One JSON record (path, size, mtime and content hash) per line, appended once
+    the batch of a file is committed to the index.
+    """
+
+    def __init__(self, manifest_path: Path) -> None:
+        self.manifest_path = manifest_path
+        self._records: dict[str, dict] = {}
+        if manifest_path.exists():
+            with manifest_path.open() as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Last record not fully written, when interrupted
+                        continue
+                    self._records[record["path"]] = record
+
+    def clear(self) -> None:
+        self._records.clear()
+        self.manifest_path.unlink(missing_ok=True)
+
+    def is_completed(self, file_path: Path) -> bool:
+        record = self._records.get(str(file_path.resolve()))
+        if record is None:
+            return False
+        stat = file_path.stat()
+        if record["size"] != stat.st_size:
+            return False
+        if record["mtime_ns"] == stat.st_mtime_ns:
+            return True
+        # Touched (or copied again) files are skipped if their content is the same
+        return bool(record["sha256"] == _file_hash(file_path))
+
+    def add_completed(self, file_paths: list[Path]) -> None:
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.manifest_path.open("a") as f:
+            for file_path in file_paths:
+                stat = file_path.stat()
+                record = {
+                    "path": str(file_path.resolve()),
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "sha256": _file_hash(file_path),
+                }
+                self._records[record["path"]] = record
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
 
 class LocalIngestWorker:
-    def __init__(self, ingest_service: IngestService) -> None:
+    def __init__(
+        self,
+        ingest_service: IngestService,
+        manifest: IngestManifest | None = None,
+        batch_size: int = 0,
+    ) -> None:
         self.ingest_service = ingest_service
+        self.manifest = manifest
+        self.batch_size = batch_size
 
         self.total_documents = 0
         self.current_document_count = 0
 
         self._files_under_root_folder: list[Path] = []
+        # Names of the ingested files, loaded once per folder ingestion
+        self._ingested_file_names: set[str] | None = None
 
     def _find_all_files_in_folder(self, root_path: Path, ignored: list[str]) -> None:
         """Search all files under the root folder recursively.
@@ -32,30 +109,109 @@ class LocalIngestWorker:
             elif file_path.is_dir() and file_path.name not in ignored:
                 self._find_all_files_in_folder(file_path, ignored)
 
-    def ingest_folder(self, folder_path: Path, ignored: list[str]) -> None:
+    def ingest_folder(
+        self, folder_path: Path, ignored: list[str], resume: bool = False
+    ) -> None:
         # Count total documents before ingestion
         self._find_all_files_in_folder(folder_path, ignored)
-        self._ingest_all(self._files_under_root_folder)
+        files_to_ingest = self._files_under_root_folder
+        if self.manifest is not None:
+            if resume:
+                files_to_ingest = [
+                    f for f in files_to_ingest if not self.manifest.is_completed(f)
+                ]
+                logger.info(
+                    "Resuming ingestion: skipping count=%s already ingested files",
+                    self.total_documents - len(files_to_ingest),
+                )
+            else:
+                self.manifest.clear()
+        if self.batch_size <= 0:
+            self._ingest_all(files_to_ingest)
+            return
+        # Committed batch by batch, an interrupted ingestion can be resumed
+        for i in range(0, len(files_to_ingest), self.batch_size):
+            batch = files_to_ingest[i : i + self.batch_size]
+            self._ingest_all(batch)
+            self.current_document_count += len(batch)
+            logger.info(
+                "Ingested count=%s/%s files",
+                self.current_document_count,
+                len(files_to_ingest),
+            )
 
     def _ingest_all(self, files_to_ingest: list[Path]) -> None:
         logger.info("Ingesting files=%s", [f.name for f in files_to_ingest])
-        self.ingest_service.bulk_ingest([(str(p.name), p) for p in files_to_ingest])
+        ingested_file_names = self._list_ingested_file_names()
+        completed = []
+        new_files = []
+        for file_path in files_to_ingest:
+            # Files already ingested (e.g. changed since an interrupted run) are
+            # updated, not to be ingested twice
+            if file_path.name not in ingested_file_names:
+                new_files.append(file_path)
+            elif self._do_update_one(file_path):
+                completed.append(file_path)
+        if new_files:
+            failed_before = self._failed_files()
+            self.ingest_service.bulk_ingest([(str(p.name), p) for p in new_files])
+            # Files that failed in the background (pipeline mode) are not completed
+            failed = {
+                file_name for file_name, _ in self._failed_files() - failed_before
+            }
+            ingested_file_names.update(f.name for f in new_files)
+            completed.extend(f for f in new_files if f.name not in failed)
+        if self.manifest is not None:
+            self.manifest.add_completed(completed)
 
-    def ingest_on_watch(self, changed_path: Path) -> None:
-        logger.info("Detected change in at path=%s, ingesting", changed_path)
-        self._do_ingest_one(changed_path)
+    def _list_ingested_file_names(self) -> set[str]:
+        if self._ingested_file_names is None:
+            self._ingested_file_names = {
+                ingested_document.doc_metadata["file_name"]
+                for ingested_document in self.ingest_service.list_ingested()
+                if ingested_document.doc_metadata
+            }
+        return self._ingested_file_names
 
-    def _do_ingest_one(self, changed_path: Path) -> None:
+    def _failed_files(self) -> set[tuple[str, datetime]]:
+        return {
+            (failed.file_name, failed.failed_at)
+            for failed in self.ingest_service.list_failed()
+        }
+
+    def ingest_on_watch(self, changed_paths: list[Path]) -> None:
+        logger.info("Detected change in at paths=%s, ingesting", changed_paths)
+        # The index may have changed since the last event
+        self._ingested_file_names = None
         try:
-            if changed_path.exists():
-                logger.info(f"Started ingesting file={changed_path}")
-                self.ingest_service.ingest_file(changed_path.name, changed_path)
-                logger.info(f"Completed ingesting file={changed_path}")
+            # Files already ingested are updated, only their changed pages are
+            # ingested
+            self._ingest_all(changed_paths)
         except Exception:
             logger.exception(
-                f"Failed to ingest document: {changed_path}, find the exception attached"
+                f"Failed to ingest documents: {changed_paths}, find the exception attached"
             )
 
+    def delete_on_watch(self, deleted_path: Path) -> None:
+        doc_ids = self.ingest_service.delete_by_file_name(deleted_path.name)
+        if doc_ids:
+            logger.info(
+                f"Deleted count={len(doc_ids)} documents of file={deleted_path}"
+            )
+
+    def _do_update_one(self, changed_path: Path) -> bool:
+        try:
+            logger.info(f"Started updating file={changed_path}")
+            # Refreshes the page images of the changed pages too
+            self.ingest_service.bulk_update([(changed_path.name, changed_path)])
+            logger.info(f"Completed updating file={changed_path}")
+            return True
+        except Exception:
+            logger.exception(
+                f"Failed to update document: {changed_path}, find the exception attached"
+            )
+            return False
+
 
 parser = argparse.ArgumentParser(prog="ingest_folder.py")
 parser.add_argument("folder", help="Folder to ingest")
@@ -71,6 +227,18 @@ parser.add_argument(
     help="List of files/directories to ignore",
     default=[],
 )
+parser.add_argument(
+    "--resume",
+    help="Skip the files ingested by a previous (interrupted) run",
+    action=argparse.BooleanOptionalAction,
+    default=False,
+)
+parser.add_argument(
+    "--batch-size",
+    help="Number of files ingested, and committed, at a time. If 0 - all at once.",
+    type=int,
+    default=100,
+)
 parser.add_argument(
     "--log-file",
     help="Optional path to a log file. If provided, logs will be written to this file.",
@@ -98,8 +266,10 @@ if __name__ == "__main__":
         raise ValueError(f"Path {args.folder} does not exist")
 
     ingest_service = global_injector.get(IngestService)
-    worker = LocalIngestWorker(ingest_service)
-    worker.ingest_folder(root_path, args.ignored)
+    worker = LocalIngestWorker(
+        ingest_service, IngestManifest(MANIFEST_PATH), args.batch_size
+    )
+    worker.ingest_folder(root_path, args.ignored, resume=args.resume)
 
     if args.ignored:
         logger.info(f"Skipping following files and directories: {args.ignored}")
@@ -111,5 +281,10 @@ if __name__ == "__main__":
             for dir in root_path.iterdir()
             if dir.is_dir() and dir.name not in args.ignored
         ]
-        watcher = IngestWatcher(args.folder, worker.ingest_on_watch)
+        watcher = IngestWatcher(
+            args.folder,
+            worker.ingest_on_watch,
+            on_file_deleted=worker.delete_on_watch,
+            max_batch_size=args.batch_size if args.batch_size > 0 else 100,
+        )
         watcher.start()
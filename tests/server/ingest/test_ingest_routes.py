@@ -1,10 +1,15 @@
 import tempfile
+import time
 from pathlib import Path
+from unittest.mock import patch
 
 from fastapi.testclient import TestClient
 
 from private_gpt.server.ingest.ingest_router import IngestResponse
+from private_gpt.server.ingest.ingest_service import IngestService
+from private_gpt.server.ingest.model import IngestJob
 from tests.fixtures.ingest_helper import IngestHelper
+from tests.fixtures.mock_injector import MockInjector
 
 
 def test_ingest_accepts_txt_files(ingest_helper: IngestHelper) -> None:
@@ -44,3 +49,171 @@ def test_ingest_plain_text(test_client: TestClient) -> None:
     assert response.status_code == 200
     ingest_result = IngestResponse.model_validate(response.json())
     assert len(ingest_result.data) == 1
+
+
+def test_ingest_list_pages_of_pdf_file(
+    test_client: TestClient, ingest_helper: IngestHelper
+) -> None:
+    path = Path(__file__).parents[0] / "test.pdf"
+    ingest_result = ingest_helper.ingest_file(path)
+    doc_id = ingest_result.data[0].doc_id
+    response = test_client.get(f"/v1/ingest/{doc_id}/pages")
+    assert response.status_code == 200
+    pages = response.json()["data"]
+    assert [(page["page_index"], page["page_label"]) for page in pages] == [(0, "1")]
+    assert pages[0]["doc_id"] == doc_id
+
+
+def test_ingest_list_pages_of_unknown_document(test_client: TestClient) -> None:
+    response = test_client.get("/v1/ingest/unknown-doc-id/pages")
+    assert response.status_code == 404
+
+
+def test_ingest_delete_many_documents(test_client: TestClient) -> None:
+    doc_ids = [
+        test_client.post(
+            "/v1/ingest/text", json={"file_name": f"delete_many_{i}", "text": "text"}
+        ).json()["data"][0]["doc_id"]
+        for i in range(3)
+    ]
+    response = test_client.post("/v1/ingest/delete", json={"doc_ids": doc_ids[:2]})
+    assert response.status_code == 200
+    ingested = {
+        doc["doc_id"] for doc in test_client.get("/v1/ingest/list").json()["data"]
+    }
+    assert ingested.isdisjoint(doc_ids[:2])
+    assert doc_ids[2] in ingested
+
+
+def test_ingest_delete_the_page_images_of_the_files_left_without_documents(
+    test_client: TestClient, injector: MockInjector
+) -> None:
+    doc_ids = [
+        test_client.post(
+            "/v1/ingest/text", json={"file_name": "manual.txt", "text": text}
+        ).json()["data"][0]["doc_id"]
+        for text in ["Check the oil level.", "Replace the spark plug."]
+    ]
+    service = injector.get(IngestService)
+    with patch.object(service, "delete_image_embeddings") as delete_image_embeddings:
+        assert test_client.delete(f"/v1/ingest/{doc_ids[0]}").status_code == 200
+        delete_image_embeddings.assert_not_called()
+        response = test_client.post("/v1/ingest/delete", json={"doc_ids": doc_ids[1:]})
+        assert response.status_code == 200
+        delete_image_embeddings.assert_called_once_with("manual.txt")
+
+
+def test_ingest_delete_file(
+    test_client: TestClient, ingest_helper: IngestHelper
+) -> None:
+    path = Path(__file__).parents[0] / "test.pdf"
+    ingest_result = ingest_helper.ingest_file(path)
+    response = test_client.delete("/v1/ingest/file/test.pdf")
+    assert response.status_code == 200
+    ingested = test_client.get("/v1/ingest/list").json()["data"]
+    assert all(doc["doc_metadata"]["file_name"] != "test.pdf" for doc in ingested)
+    response = test_client.get(f"/v1/ingest/{ingest_result.data[0].doc_id}/pages")
+    assert response.status_code == 404
+    assert test_client.delete("/v1/ingest/file/test.pdf").status_code == 404
+
+
+def test_ingest_stream_accepts_pdf_files(test_client: TestClient) -> None:
+    path = Path(__file__).parents[0] / "test.pdf"
+    response = test_client.post(
+        "/v1/ingest/stream",
+        params={"file_name": "streamed.pdf"},
+        content=path.read_bytes(),
+    )
+    assert response.status_code == 200
+    ingest_result = IngestResponse.model_validate(response.json())
+    assert len(ingest_result.data) == 1
+    assert ingest_result.data[0].doc_metadata["file_name"] == "streamed.pdf"
+
+
+def test_ingest_job_reports_its_progress(test_client: TestClient) -> None:
+    path = Path(__file__).parents[0] / "test.pdf"
+    with path.open("rb") as f:
+        response = test_client.post(
+            "/v1/ingest/jobs", files={"file": ("job.pdf", f, "application/pdf")}
+        )
+    assert response.status_code == 202
+    job = IngestJob.model_validate(response.json())
+    assert [file.file_name for file in job.files] == ["job.pdf"]
+
+    deadline = time.time() + 30
+    while job.status in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.1)
+        response = test_client.get(f"/v1/ingest/jobs/{job.job_id}")
+        assert response.status_code == 200
+        job = IngestJob.model_validate(response.json())
+    assert job.status == "completed"
+    assert job.processed_files == 1
+    assert job.files[0].stage == "completed"
+    ingested = {
+        doc["doc_id"] for doc in test_client.get("/v1/ingest/list").json()["data"]
+    }
+    assert set(job.files[0].doc_ids) <= ingested
+
+
+def test_ingest_job_not_found(test_client: TestClient) -> None:
+    assert test_client.get("/v1/ingest/jobs/unknown").status_code == 404
+
+
+def test_ingest_list_failed_files(test_client: TestClient) -> None:
+    response = test_client.get("/v1/ingest/failed")
+    assert response.status_code == 200
+    assert response.json()["data"] == []
+    assert test_client.delete("/v1/ingest/failed").status_code == 200
+
+
+def test_ingest_paths_within_the_allowed_roots(
+    tmp_path: Path, test_client: TestClient, injector: MockInjector
+) -> None:
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    (shared / "manual.txt").write_text("Check the oil level.")
+    (tmp_path / "secret.txt").write_text("Not shared")
+    (shared / "link.txt").symlink_to(tmp_path / "secret.txt")
+    (shared / "latest.txt").symlink_to(shared / "manual.txt")
+    (shared / "old").mkdir()
+    (shared / "old" / "manual.txt").write_text("Check the oil.")
+    injector.bind_settings({"data": {"ingest_allowed_roots": [str(shared)]}})
+    service = injector.bind_mock(IngestService)
+    service.bulk_ingest.return_value = []
+
+    response = test_client.post(
+        "/v1/ingest/paths",
+        json={"paths": [str(shared / "manual.txt"), str(shared / "latest.txt")]},
+    )
+    assert response.status_code == 200
+    # Named after the requested path, not the target of the link
+    service.bulk_ingest.assert_called_once_with(
+        [
+            ("manual.txt", (shared / "manual.txt").resolve()),
+            ("latest.txt", (shared / "manual.txt").resolve()),
+        ],
+        image_embeddings=False,
+    )
+
+    for path, status_code in [
+        (tmp_path / "secret.txt", 403),
+        (shared / ".." / "secret.txt", 403),
+        (shared / "link.txt", 403),
+        (shared / "missing.txt", 404),
+    ]:
+        response = test_client.post("/v1/ingest/paths", json={"paths": [str(path)]})
+        assert response.status_code == status_code
+    response = test_client.post(
+        "/v1/ingest/paths",
+        json={
+            "paths": [str(shared / "manual.txt"), str(shared / "old" / "manual.txt")]
+        },
+    )
+    assert response.status_code == 400
+    assert service.bulk_ingest.call_count == 1
+
+
+def test_ingest_paths_disabled_without_allowed_roots(test_client: TestClient) -> None:
+    path = Path(__file__).parents[0] / "test.txt"
+    response = test_client.post("/v1/ingest/paths", json={"paths": [str(path)]})
+    assert response.status_code == 403
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from private_gpt.server.ingest.ingest_watcher import IngestWatcher
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _watcher(tmp_path: Path, clock: FakeClock, **kwargs: int) -> IngestWatcher:
+    # The watcher is not started, the events are added by the tests
+    return IngestWatcher(
+        tmp_path, lambda _: None, debounce_seconds=2, clock=clock, **kwargs
+    )
+
+
+def test_events_of_a_file_are_coalesced_until_it_is_left_alone(
+    tmp_path: Path,
+) -> None:
+    clock = FakeClock()
+    watcher = _watcher(tmp_path, clock)
+    manual = tmp_path / "manual.txt"
+    manual.write_text("Check the oil level.")
+
+    watcher._add_pending(manual, deleted=False)
+    clock.now = 1
+    watcher._add_pending(manual, deleted=False)
+    clock.now = 2.5
+    assert watcher._take_ready() == ([], [])
+    clock.now = 3
+    assert watcher._take_ready() == ([manual], [])
+    assert watcher._take_ready() == ([], [])
+
+
+def test_file_being_written_is_reported_once_its_size_is_stable(
+    tmp_path: Path,
+) -> None:
+    clock = FakeClock()
+    watcher = _watcher(tmp_path, clock)
+    manual = tmp_path / "manual.txt"
+    manual.write_text("Check the oil level.")
+
+    watcher._add_pending(manual, deleted=False)
+    with manual.open("a") as f:
+        f.write("Check the tyre pressure.")
+    clock.now = 2
+    # Grown since its last event, waits for another debounce window
+    assert watcher._take_ready() == ([], [])
+    clock.now = 3
+    assert watcher._take_ready() == ([], [])
+    clock.now = 4
+    assert watcher._take_ready() == ([manual], [])
+
+
+def test_renamed_and_deleted_files_are_reported(tmp_path: Path) -> None:
+    clock = FakeClock()
+    watcher = _watcher(tmp_path, clock)
+    manual = tmp_path / "manual.txt"
+    renamed = tmp_path / "renamed.txt"
+    renamed.write_text("Check the oil level.")
+
+    # As reported by the handler for a rename
+    watcher._add_pending(manual, deleted=True)
+    watcher._add_pending(renamed, deleted=False)
+    clock.now = 2
+    assert watcher._take_ready() == ([renamed], [manual])
+
+    # Created then deleted before the end of the debounce window
+    draft = tmp_path / "draft.txt"
+    draft.write_text("Draft")
+    watcher._add_pending(draft, deleted=False)
+    draft.unlink()
+    watcher._add_pending(draft, deleted=True)
+    clock.now = 4
+    assert watcher._take_ready() == ([], [draft])
+
+
+def test_changed_files_are_reported_by_batches(tmp_path: Path) -> None:
+    clock = FakeClock()
+    watcher = _watcher(tmp_path, clock, max_batch_size=2)
+    manuals = [tmp_path / f"manual-{i}.txt" for i in range(3)]
+    for manual in manuals:
+        manual.write_text("Check the oil level.")
+        watcher._add_pending(manual, deleted=False)
+
+    clock.now = 2
+    first, _ = watcher._take_ready()
+    second, _ = watcher._take_ready()
+    assert len(first) == 2
+    assert sorted(first + second) == manuals
+
+
+def _wait_for(condition: Callable[[], object], timeout: float = 10) -> None:
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+
+
+def test_ingest_watcher_reports_a_new_file(tmp_path: Path) -> None:
+    changed: list[list[Path]] = []
+    watcher = IngestWatcher(tmp_path, changed.append, debounce_seconds=0.2)
+    thread = threading.Thread(target=watcher.start, daemon=True)
+    thread.start()
+    try:
+        time.sleep(0.2)
+        manual = tmp_path / "manual.txt"
+        manual.write_text("Check the oil level.")
+        _wait_for(lambda: changed)
+        assert changed[0] == [manual]
+    finally:
+        watcher.stop()
+        thread.join()
@@ -0,0 +1,23 @@
+from fastapi.testclient import TestClient
+
+from private_gpt.server.page_images.page_images_service import PageImagesService
+from tests.fixtures.mock_injector import MockInjector
+
+
+def test_page_thumbnails_are_served_with_cache_headers(
+    test_client: TestClient, injector: MockInjector
+) -> None:
+    service = injector.bind_mock(PageImagesService)
+    service.media_type = "image/webp"
+    service.thumbnail.return_value = b"webp"
+
+    response = test_client.get("/context_images/abc/6-0123456789abcdef.webp")
+    assert response.status_code == 200
+    assert response.content == b"webp"
+    assert response.headers["content-type"] == "image/webp"
+    assert "immutable" in response.headers["cache-control"]
+    service.thumbnail.assert_called_once_with("abc", "6-0123456789abcdef.webp")
+
+    service.thumbnail.return_value = None
+    response = test_client.get("/context_images/abc/7-0123456789abcdef.webp")
+    assert response.status_code == 404
@@ -0,0 +1,53 @@
+from pathlib import Path
+from typing import Any
+
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.node_parser import SentenceWindowNodeParser
+from llama_index.core.storage import StorageContext
+
+from private_gpt.components.ingest.ingest_component import BatchIngestComponent
+
+
+def test_batch_bulk_ingest_streams_the_files_by_batches(tmp_path: Path) -> None:
+    embed_model = MockEmbedding(embed_dim=4)
+    component = BatchIngestComponent(
+        StorageContext.from_defaults(),
+        embed_model,
+        [SentenceWindowNodeParser.from_defaults(), embed_model],
+        count_workers=2,
+        flush_node_count=2,
+    )
+    saved_batches = []
+    save_nodes = component._save_nodes
+
+    def _save_nodes(documents: list, nodes: list, *args: Any) -> list:
+        saved_batches.append(len(nodes))
+        return save_nodes(documents, nodes, *args)
+
+    component._save_nodes = _save_nodes  # type: ignore[method-assign]
+    files = []
+    for i in range(5):
+        path = tmp_path / f"file_{i}.txt"
+        path.write_text(f"Check the oil level of engine {i}.")
+        files.append((path.name, path))
+
+    done: list[tuple[int, str]] = []
+    documents = component.bulk_ingest(
+        files,
+        on_file_done=lambda file_name, _, error: done.append(
+            (len(saved_batches), file_name)
+        ),
+    )
+
+    assert sorted(document.metadata["file_name"] for document in documents) == [
+        f"file_{i}.txt" for i in range(5)
+    ]
+    # Batches of 2 nodes (one node per file), the last one is not full
+    assert saved_batches == [2, 2, 1]
+    # Each file is reported done once its batch is saved
+    assert sorted(batch for batch, _ in done) == [1, 1, 2, 2, 3]
+    assert sorted(file_name for _, file_name in done) == [
+        f"file_{i}.txt" for i in range(5)
+    ]
+    ref_docs = component.storage_context.docstore.get_all_ref_doc_info() or {}
+    assert {document.doc_id for document in documents} <= ref_docs.keys()
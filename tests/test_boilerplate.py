@@ -0,0 +1,37 @@
+from llama_index.core.schema import Document
+
+from private_gpt.components.ingest.boilerplate import BoilerplateRemover
+
+
+def _page(page_index: int, text: str, file_name: str = "manual.pdf") -> Document:
+    return Document(
+        text=text, metadata={"file_name": file_name, "page_index": page_index}
+    )
+
+
+def test_boilerplate_remover_removes_running_headers_and_page_numbers():
+    texts = [
+        f"{control}\nThe {control.lower()} is\nlocated on the {side}.\nTIP\nSee 7-10."
+        for control, side in [
+            ("Clutch lever", "left handlebar"),
+            ("Brake lever", "right handlebar"),
+            ("Shift pedal", "left side"),
+            ("Brake pedal", "right side"),
+        ]
+    ]
+    pages = [
+        _page(i, f"{text}\nInstrument functions\n4-{i}\n4")
+        for i, text in enumerate(texts)
+    ]
+    stripped = BoilerplateRemover()(pages)
+    assert [page.text for page in stripped] == texts
+    # The ingested documents are left untouched
+    assert pages[0].text.endswith("4-0\n4")
+    assert [page.doc_id for page in stripped] == [page.doc_id for page in pages]
+
+
+def test_boilerplate_remover_ignores_short_files_and_other_files():
+    pages = [_page(i, f"Header\nContent {i}") for i in range(2)]
+    pages.append(_page(0, "Header\nOther content", file_name="other.pdf"))
+    stripped = BoilerplateRemover()(pages)
+    assert [page.text for page in stripped] == [page.text for page in pages]
@@ -0,0 +1,127 @@
+from pathlib import Path
+from typing import Any
+
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.node_parser import SentenceWindowNodeParser
+from llama_index.core.storage import StorageContext
+
+from private_gpt.components.ingest.chunk_dedup import (
+    ChunkDeduplicator,
+    minhash,
+    similarity,
+)
+from private_gpt.components.ingest.ingest_component import (
+    BatchIngestComponent,
+    ParallelizedIngestComponent,
+    PipelineIngestComponent,
+    SimpleIngestComponent,
+)
+
+MANUAL = (
+    "Check the oil level of the engine before every ride, with the vehicle "
+    "upright on a level surface. "
+)
+
+
+def test_minhash_similarity() -> None:
+    signature = minhash(MANUAL)
+    assert similarity(signature, minhash(MANUAL.upper())) == 1.0
+    near = minhash(MANUAL.replace("every ride", "every trip"))
+    assert 0.7 < similarity(signature, near) < 1.0
+    assert similarity(signature, minhash("Replace the spark plug.")) < 0.2
+
+
+def test_duplicate_chunks_are_merged_and_restored(tmp_path: Path) -> None:
+    storage_context = StorageContext.from_defaults()
+    embed_model = MockEmbedding(embed_dim=4)
+    deduplicator = ChunkDeduplicator(storage_context.docstore, threshold=0.7)
+    component = SimpleIngestComponent(
+        storage_context,
+        embed_model,
+        [SentenceWindowNodeParser.from_defaults(), deduplicator, embed_model],
+    )
+    text = MANUAL + "Replace the spark plug every 6000 km, when the engine is cold."
+    (tmp_path / "model_a.txt").write_text("Model A. " + text)
+    # Near-identical, and one chunk too short to be merged
+    variant = text.replace("every ride", "every trip")
+    (tmp_path / "model_b.txt").write_text("Model B. " + variant)
+
+    component.ingest("model_a.txt", tmp_path / "model_a.txt")
+    count_nodes = len(storage_context.docstore.docs)
+    [document_b] = component.ingest("model_b.txt", tmp_path / "model_b.txt")
+
+    # The chunks of model_b are merged into the ones of model_a, but the short one
+    assert len(storage_context.docstore.docs) == count_nodes + 1
+    duplicates = [
+        duplicate
+        for node_id in storage_context.docstore.docs
+        for duplicate in deduplicator.duplicate_index.duplicates(node_id)
+    ]
+    assert duplicates
+    assert {duplicate.ref_doc_id for duplicate in duplicates} == {document_b.doc_id}
+
+    component.delete_by_file_name("model_a.txt")
+
+    # The chunks of model_b are stored again
+    ref_doc_info = storage_context.docstore.get_ref_doc_info(document_b.doc_id)
+    assert ref_doc_info is not None
+    assert len(ref_doc_info.node_ids) == count_nodes
+    assert all(
+        storage_context.vector_store.get(node_id) is not None
+        for node_id in ref_doc_info.node_ids
+    )
+
+
+@pytest.mark.parametrize(
+    ("component_class", "options"),
+    [
+        (PipelineIngestComponent, {}),
+        (ParallelizedIngestComponent, {}),
+        (BatchIngestComponent, {}),
+        # Both files saved in the same batch
+        (BatchIngestComponent, {"flush_node_count": 100}),
+    ],
+)
+def test_identical_files_of_a_bulk_ingest_are_merged(
+    tmp_path: Path, component_class: type, options: dict[str, Any]
+) -> None:
+    storage_context = StorageContext.from_defaults()
+    embed_model = MockEmbedding(embed_dim=4)
+    deduplicator = ChunkDeduplicator(storage_context.docstore)
+    component = component_class(
+        storage_context,
+        embed_model,
+        [SentenceWindowNodeParser.from_defaults(), deduplicator, embed_model],
+        count_workers=2,
+        **options,
+    )
+    text = MANUAL + "Replace the spark plug every 6000 km, when the engine is cold."
+    files = []
+    for file_name in ["model_a.txt", "model_b.txt"]:
+        (tmp_path / file_name).write_text(text)
+        files.append((file_name, tmp_path / file_name))
+
+    # The files may be deduplicated before any of them is stored
+    documents = component.bulk_ingest(files)
+
+    docstore = storage_context.docstore
+    assert len(documents) == 2
+    # The first node of the second file is kept, for the file to remain listed
+    assert len(docstore.docs) == 3
+    duplicate_index = deduplicator.duplicate_index
+    [duplicate] = [
+        duplicate
+        for node_id in docstore.docs
+        for duplicate in duplicate_index.duplicates(node_id)
+    ]
+
+    component.delete(duplicate.ref_doc_id)
+
+    # Found from the deleted document, the duplicate is forgotten
+    assert not duplicate_index._kvstore.get_all(
+        collection=duplicate_index._duplicates_collection
+    )
+    assert not duplicate_index._kvstore.get_all(
+        collection=duplicate_index._refs_collection
+    )
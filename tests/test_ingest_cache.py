@@ -0,0 +1,88 @@
+import os
+from pathlib import Path
+
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.node_parser import SentenceWindowNodeParser
+from llama_index.core.schema import Document, NodeRelationship
+
+from private_gpt.components.ingest.ingest_cache import IngestionCache, attach_to_file
+
+
+def _cache(cache_dir: Path, max_size_bytes: int = 1024 * 1024) -> IngestionCache:
+    transformations = [
+        SentenceWindowNodeParser.from_defaults(),
+        MockEmbedding(embed_dim=4),
+    ]
+    return IngestionCache(cache_dir, max_size_bytes, transformations)
+
+
+def _nodes(documents: list[Document]) -> list:
+    nodes = SentenceWindowNodeParser.from_defaults()(documents)
+    for node in nodes:
+        node.embedding = [0.5] * 4
+    return nodes
+
+
+def test_ingestion_cache_key_depends_on_bytes_and_reader(tmp_path: Path) -> None:
+    cache = _cache(tmp_path / "cache")
+    (tmp_path / "a.txt").write_text("Engine oil")
+    (tmp_path / "b.txt").write_text("Engine oil")
+    (tmp_path / "c.txt").write_text("Coolant")
+    key = cache.key("a.txt", tmp_path / "a.txt")
+    assert cache.key("b.txt", tmp_path / "b.txt") == key
+    assert cache.key("c.txt", tmp_path / "c.txt") != key
+    assert cache.key("a.md", tmp_path / "a.txt") != key
+
+
+def test_ingestion_cache_counts_hits_and_misses(tmp_path: Path) -> None:
+    cache = _cache(tmp_path)
+    documents = [Document(text="Check the oil level. Add oil.", metadata={})]
+    nodes = _nodes(documents)
+    assert cache.get("key") is None
+    cache.put("key", documents, nodes)
+    cached_documents, cached_nodes = cache.get("key")  # type: ignore[misc]
+    assert [d.doc_id for d in cached_documents] == [d.doc_id for d in documents]
+    assert [n.embedding for n in cached_nodes] == [n.embedding for n in nodes]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    # The entries are found again after a restart
+    assert _cache(tmp_path).get("key") is not None
+
+
+def test_ingestion_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    documents = [Document(text="Check the oil level.", metadata={})]
+    cache = _cache(tmp_path)
+    cache.put("first", documents, [])
+    cache.put("second", documents, [])
+    entry_size = cache.size_bytes // 2
+    os.utime(tmp_path / "second.json", (0, 0))
+
+    cache.max_size_bytes = entry_size * 2
+    cache.put("third", documents, [])
+    assert cache.stats()["entries"] == 2
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+
+
+def test_attach_to_file_renames_and_relinks_the_nodes() -> None:
+    document = Document(
+        text="Check the oil level. Add oil. Close the cap.",
+        metadata={"file_name": "old.txt"},
+    )
+    document.metadata["doc_id"] = document.doc_id
+    nodes = _nodes([document])
+
+    [new_document], new_nodes = attach_to_file([document], nodes, "new.txt")
+    assert new_document.doc_id != document.doc_id
+    assert new_document.metadata["file_name"] == "new.txt"
+    assert new_document.metadata["doc_id"] == new_document.doc_id
+    assert {node.node_id for node in new_nodes}.isdisjoint(n.node_id for n in nodes)
+    assert all(node.ref_doc_id == new_document.doc_id for node in new_nodes)
+    assert all(node.metadata["file_name"] == "new.txt" for node in new_nodes)
+    assert new_nodes[1].relationships[NodeRelationship.PREVIOUS].node_id == (
+        new_nodes[0].node_id
+    )
+    assert new_nodes[0].embedding == nodes[0].embedding
+    # The cached nodes are left untouched
+    assert document.metadata["file_name"] == "old.txt"
+    assert nodes[0].metadata["file_name"] == "old.txt"
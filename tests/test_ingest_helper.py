@@ -0,0 +1,30 @@
+from pathlib import Path
+
+import pytest
+
+from private_gpt.components.ingest.ingest_helper import (
+    PDFPageLabelReader,
+    printed_page_label,
+)
+
+
+@pytest.mark.parametrize(
+    ("page_text", "page_index", "expected_label"),
+    [
+        ("Clutch lever\nThe clutch lever is located...\n4-11\n", 20, "4-11"),
+        ("Table of contents\n  12  \n", 3, "12"),
+        ("Warning\nNever ride under the influence\n", 6, "7"),
+        ("", 0, "1"),
+    ],
+)
+def test_printed_page_label(page_text, page_index, expected_label):
+    assert printed_page_label(page_text, page_index) == expected_label
+
+
+def test_pdf_page_label_reader_returns_one_document_per_page():
+    path = Path(__file__).parent / "server" / "ingest" / "test.pdf"
+    docs = PDFPageLabelReader().load_data(path)
+    assert len(docs) == 1
+    assert docs[0].metadata["page_index"] == 0
+    assert docs[0].metadata["page_label"] == "1"
+    assert docs[0].metadata["file_name"] == "test.pdf"
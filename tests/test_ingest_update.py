@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import fitz  # type: ignore
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.node_parser import SentenceWindowNodeParser
+from llama_index.core.schema import MetadataMode
+from llama_index.core.storage import StorageContext
+
+from private_gpt.components.ingest.boilerplate import BoilerplateRemover
+from private_gpt.components.ingest.ingest_component import SimpleIngestComponent
+
+CONTROLS = ["Clutch lever", "Brake lever", "Shift pedal", "Brake pedal", "Horn"]
+
+
+def write_manual(path: Path, controls: list[str]) -> None:
+    with fitz.open() as doc:
+        for page_index, control in enumerate(controls):
+            page = doc.new_page()
+            page.insert_text((72, 72), "Instrument functions")
+            page.insert_text((72, 144), f"The {control.lower()} is on the left.")
+            page.insert_text((300, 770), f"4-{page_index + 1}")
+        doc.save(path)
+
+
+def test_update_moves_the_unchanged_pages_without_embedding_them(
+    tmp_path: Path,
+) -> None:
+    storage_context = StorageContext.from_defaults()
+    embed_model = MockEmbedding(embed_dim=4)
+    component = SimpleIngestComponent(
+        storage_context,
+        embed_model,
+        [BoilerplateRemover(), SentenceWindowNodeParser.from_defaults(), embed_model],
+    )
+    write_manual(tmp_path / "manual.pdf", CONTROLS)
+    documents = component.ingest("manual.pdf", tmp_path / "manual.pdf")
+    doc_ids = [document.doc_id for document in documents]
+
+    # A page is inserted after the first one, the next pages move by one
+    write_manual(tmp_path / "manual.pdf", CONTROLS[:1] + ["Choke"] + CONTROLS[1:])
+    [inserted] = component.update("manual.pdf", tmp_path / "manual.pdf")
+
+    assert inserted.metadata["page_index"] == 1
+    docstore = storage_context.docstore
+    ref_docs = docstore.get_all_ref_doc_info() or {}
+    assert set(ref_docs) == {*doc_ids, inserted.doc_id}
+    for page_index, doc_id in enumerate(doc_ids[1:], start=2):
+        ref_doc_info = ref_docs[doc_id]
+        assert ref_doc_info.metadata["page_index"] == page_index
+        assert ref_doc_info.metadata["page_label"] == f"4-{page_index + 1}"
+        for node in docstore.get_nodes(ref_doc_info.node_ids):
+            assert node.metadata["page_index"] == page_index
+    page_labels = component.page_labels.get("manual.pdf")
+    assert page_labels is not None
+    assert page_labels.page_index("4-2") == 1
+    assert [page["doc_id"] for page in page_labels.pages] == [
+        doc_ids[0],
+        inserted.doc_id,
+        *doc_ids[1:],
+    ]
+    # The running header is found over all the pages, not only the inserted one
+    [node] = docstore.get_nodes(ref_docs[inserted.doc_id].node_ids)
+    text = node.get_content(MetadataMode.NONE)
+    assert "choke" in text
+    assert "Instrument functions" not in text
+    assert "boilerplate_removed" not in node.metadata
@@ -0,0 +1,49 @@
+from pathlib import Path
+
+from private_gpt.components.node_store.journaled_kvstore import JournaledKVStore
+
+
+def test_journaled_kvstore_replays_the_journal(tmp_path: Path) -> None:
+    persist_path = tmp_path / "docstore.json"
+    store = JournaledKVStore.from_persist_path(persist_path, compact_every=100)
+    store.put("a", {"text": "Engine oil"})
+    store.put("b", {"text": "Coolant"}, collection="docs")
+    store.persist(str(persist_path))
+    store.put("a", {"text": "Brake fluid"})
+    store.delete("b", collection="docs")
+    store.persist(str(persist_path))
+
+    # Only the journal was written
+    assert not persist_path.exists()
+    assert len(store.journal_path.read_text().splitlines()) == 4
+    loaded = JournaledKVStore.from_persist_path(persist_path, compact_every=100)
+    assert loaded.to_dict() == store.to_dict()
+
+
+def test_journaled_kvstore_compacts_into_the_snapshot(tmp_path: Path) -> None:
+    persist_path = tmp_path / "docstore.json"
+    store = JournaledKVStore.from_persist_path(persist_path, compact_every=3)
+    for key in ["a", "b", "c"]:
+        store.put(key, {"text": key})
+        store.persist(str(persist_path))
+
+    assert persist_path.exists()
+    assert not store.journal_path.exists()
+    loaded = JournaledKVStore.from_persist_path(persist_path, compact_every=3)
+    assert loaded.get_all() == {key: {"text": key} for key in ["a", "b", "c"]}
+
+
+def test_journaled_kvstore_ignores_a_truncated_record(tmp_path: Path) -> None:
+    persist_path = tmp_path / "docstore.json"
+    store = JournaledKVStore.from_persist_path(persist_path, compact_every=100)
+    store.put("a", {"text": "Engine oil"})
+    store.persist(str(persist_path))
+    with store.journal_path.open("a") as f:
+        f.write('{"collection": "data", "key": "b", "va')
+
+    loaded = JournaledKVStore.from_persist_path(persist_path, compact_every=100)
+    assert loaded.get_all() == {"a": {"text": "Engine oil"}}
+    loaded.put("c", {"text": "Coolant"})
+    loaded.persist(str(persist_path))
+    reloaded = JournaledKVStore.from_persist_path(persist_path, compact_every=100)
+    assert reloaded.get_all() == loaded.get_all()
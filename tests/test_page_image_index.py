@@ -0,0 +1,78 @@
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from private_gpt.components.ingest.page_image_index import PageImageIndex
+from private_gpt.components.ingest.page_images import ImageEmbeddingStore
+from private_gpt.components.ingest.page_renderer import RenderedBatch
+
+pytest.importorskip("faiss")
+
+
+def render(vectors: list[list[float]]) -> Iterator[RenderedBatch]:
+    yield RenderedBatch(
+        images=[Image.new("RGB", (6, 8)) for _ in vectors],
+        encoded_images=[b"png"] * len(vectors),
+        page_indexes=[page + 6 for page in range(len(vectors))],
+        page_labels=[f"1-{page + 1}" for page in range(len(vectors))],
+    )
+
+
+def add(
+    store: ImageEmbeddingStore,
+    index: PageImageIndex,
+    pdf_name: str,
+    vectors: list[list[float]],
+) -> None:
+    # The pages are embedded as the given vectors
+    page_images = store.add(pdf_name, render(vectors), lambda _: vectors)
+    index.add(pdf_name, page_images)
+
+
+def search(
+    index: PageImageIndex, query: list[float], pdf_names: list[str] | None = None
+) -> list[tuple[str, str]]:
+    hits = index.search(np.array(query), top_k=2, pdf_names=pdf_names)
+    return [(hit.pdf_name, hit.label) for hit in hits]
+
+
+def test_pages_of_all_the_files_are_searched_at_once(tmp_path: Path) -> None:
+    store = ImageEmbeddingStore(tmp_path)
+    index = PageImageIndex(store)
+    add(store, index, "a.pdf", [[1, 0, 0], [0, 1, 0]])
+    add(store, index, "b.pdf", [[0, 0, 1], [1, 1, 0]])
+
+    assert search(index, [1, 0.9, 0]) == [("b.pdf", "1-2"), ("a.pdf", "1-1")]
+    assert search(index, [1, 0.9, 0], pdf_names=["a.pdf"]) == [
+        ("a.pdf", "1-1"),
+        ("a.pdf", "1-2"),
+    ]
+    assert search(index, [0, 0, 1], pdf_names=["missing.pdf"]) == []
+    hit = index.search(np.array([0, 0, 2]), top_k=1)[0]
+    assert hit.page == 6
+    assert hit.score == pytest.approx(1.0)
+    assert hit.image_path.read_bytes() == b"png"
+
+
+def test_index_follows_the_embedded_and_deleted_files(tmp_path: Path) -> None:
+    store = ImageEmbeddingStore(tmp_path)
+    index = PageImageIndex(store)
+    add(store, index, "a.pdf", [[1, 0, 0], [0, 1, 0]])
+    add(store, index, "b.pdf", [[0, 0, 1]])
+
+    # Embedded again, the pages of the file are replaced
+    add(store, index, "a.pdf", [[0, 1, 1]])
+    assert len(index) == 2
+    assert search(index, [0, 1, 1]) == [("a.pdf", "1-1"), ("b.pdf", "1-1")]
+
+    index.remove("b.pdf")
+    store.delete("b.pdf")
+    assert search(index, [0, 0, 1]) == [("a.pdf", "1-1")]
+
+    # A new index is loaded from the store
+    index = PageImageIndex(store)
+    assert len(index) == 1
+    assert search(index, [0, 0, 1]) == [("a.pdf", "1-1")]
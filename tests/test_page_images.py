@@ -0,0 +1,132 @@
+import gc
+import hashlib
+import io
+import weakref
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from private_gpt.components.ingest.page_images import ImageEmbeddingStore
+from private_gpt.components.ingest.page_renderer import RenderedBatch
+
+
+def encode_png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def encode(batch: list[Image.Image]) -> list[list[float]]:
+    return [[image.getpixel((0, 0))[0], 1.0] for image in batch]
+
+
+def test_page_images_are_embedded_and_released_by_batch(tmp_path: Path) -> None:
+    rendered: list[weakref.ref[Image.Image]] = []
+
+    def render_batch(pages: range) -> RenderedBatch:
+        gc.collect()
+        # The previous batch is released before the next one is rendered
+        assert all(image() is None for image in rendered)
+        batch = [Image.new("RGB", (6, 8), (page * 40, 0, 0)) for page in pages]
+        rendered.extend(weakref.ref(image) for image in batch)
+        return RenderedBatch(
+            images=batch,
+            encoded_images=[
+                encode_png(Image.new("RGB", (60, 80), (page * 40, 0, 0)))
+                for page in pages
+            ],
+            page_indexes=[page + 6 for page in pages],
+            page_labels=[f"1-{page + 1}" for page in pages],
+        )
+
+    def render() -> Iterator[RenderedBatch]:
+        for start in range(0, 5, 2):
+            yield render_batch(range(start, min(start + 2, 5)))
+
+    store = ImageEmbeddingStore(tmp_path)
+    store.add("manual.pdf", render(), encode)
+
+    page_images = store.load("manual.pdf")
+    assert page_images is not None
+    assert isinstance(page_images.embeddings, np.memmap)
+    assert page_images.embeddings.dtype == np.float32
+    assert page_images.embeddings.tolist() == [[page * 40, 1.0] for page in range(5)]
+    assert len(page_images) == 5
+    assert page_images.pages[3]["pdf"] == "manual.pdf"
+    assert page_images.pages[3]["page"] == 9
+    assert page_images.pages[3]["label"] == "1-4"
+    assert (
+        page_images.image_hash(3)
+        == hashlib.sha256(page_images.image_path(3).read_bytes()).hexdigest()
+    )
+    assert store.load_by_key(ImageEmbeddingStore.key("manual.pdf")) is not None
+    assert store.load_by_key("../manual.pdf") is None
+    assert page_images.row(9) == 3
+    assert page_images.row(0) is None
+    assert page_images.image(3).size == (60, 80)
+    assert page_images.image(3).getpixel((0, 0)) == (120, 0, 0)
+
+
+def test_page_images_are_replaced(tmp_path: Path) -> None:
+    def render(color: int, count_pages: int) -> Iterator[RenderedBatch]:
+        images = [Image.new("RGB", (6, 8), (color, 0, 0))] * count_pages
+        yield RenderedBatch(
+            images=images,
+            encoded_images=[encode_png(image) for image in images],
+            page_indexes=list(range(count_pages)),
+            page_labels=[str(page + 1) for page in range(count_pages)],
+        )
+
+    store = ImageEmbeddingStore(tmp_path)
+    assert store.load("manual.pdf") is None
+    store.add("manual.pdf", render(10, 3), encode)
+    store.add("other/manual.pdf", iter([]), encode)
+    store.add("manual.pdf", render(20, 2), encode)
+
+    page_images = store.load("manual.pdf")
+    assert page_images is not None
+    assert page_images.embeddings.tolist() == [[20, 1.0]] * 2
+    assert page_images.image(1).getpixel((0, 0)) == (20, 0, 0)
+    empty = store.load("other/manual.pdf")
+    assert empty is not None
+    assert len(empty) == 0
+    # Only the folders of the two files are left
+    assert len(list(tmp_path.iterdir())) == 2
+
+    store.delete("manual.pdf")
+    assert store.load("manual.pdf") is None
+
+
+def test_kept_page_images_are_not_embedded_again(tmp_path: Path) -> None:
+    def render(colors: dict[int, int]) -> Iterator[RenderedBatch]:
+        images = [Image.new("RGB", (6, 8), (color, 0, 0)) for color in colors.values()]
+        yield RenderedBatch(
+            images=images,
+            encoded_images=[encode_png(image) for image in images],
+            page_indexes=list(colors),
+            page_labels=[str(page + 1) for page in colors],
+        )
+
+    store = ImageEmbeddingStore(tmp_path)
+    store.add("manual.pdf", render({0: 10, 1: 20, 2: 30}), encode)
+    encoded: list[Image.Image] = []
+
+    def encode_new(batch: list[Image.Image]) -> list[list[float]]:
+        encoded.extend(batch)
+        return encode(batch)
+
+    # A page is inserted after the first one, the last one is removed
+    page_images = store.add(
+        "manual.pdf", render({1: 40}), encode_new, kept={0: (0, "1"), 1: (2, "3")}
+    )
+
+    assert len(encoded) == 1
+    assert sorted(
+        (page["page"], page["label"], page_images.image(row).getpixel((0, 0))[0])
+        for row, page in enumerate(page_images.pages)
+    ) == [(0, "1", 10), (1, "2", 40), (2, "3", 20)]
+    row = page_images.row(2)
+    assert row is not None
+    assert page_images.embeddings[row].tolist() == [20, 1.0]
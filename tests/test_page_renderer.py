@@ -0,0 +1,43 @@
+import io
+from pathlib import Path
+
+import fitz  # type: ignore
+from PIL import Image
+
+from private_gpt.components.ingest.page_renderer import PageRenderer
+
+
+def test_pages_are_rendered_at_two_resolutions(tmp_path: Path) -> None:
+    pdf_path = tmp_path / "manual.pdf"
+    with fitz.open() as doc:
+        for page_index in range(5):
+            # US Letter pages, filled with a color of their own
+            page = doc.new_page(width=612, height=792)
+            page.draw_rect(page.rect, fill=(page_index / 5, 0, 0), color=None)
+            page.insert_text((300, 770), f"1-{page_index + 1}")
+        doc.save(pdf_path)
+
+    renderer = PageRenderer(2, embedding_dpi=36, display_dpi=144)
+    try:
+        batches = list(renderer.render(pdf_path, batch_size=2, first_page=2))
+        changed = list(renderer.render(pdf_path, batch_size=2, page_indexes=[4, 0, 2]))
+    finally:
+        renderer.close()
+
+    assert [batch.page_indexes for batch in batches] == [[1, 2], [3, 4]]
+    assert [batch.page_labels for batch in batches] == [["1-2", "1-3"], ["1-4", "1-5"]]
+    images = [image for batch in batches for image in batch.images]
+    displayed = [
+        Image.open(io.BytesIO(png)) for batch in batches for png in batch.encoded_images
+    ]
+    assert [image.size for image in images] == [(306, 396)] * 4
+    assert [image.size for image in displayed] == [(1224, 1584)] * 4
+    assert [image.getpixel((0, 0))[0] for image in images] == [51, 102, 153, 204]
+    assert [image.convert("RGB").getpixel((0, 0))[0] for image in displayed] == [
+        51,
+        102,
+        153,
+        204,
+    ]
+    assert [batch.page_indexes for batch in changed] == [[0, 2], [4]]
+    assert [batch.page_labels for batch in changed] == [["1-1", "1-3"], ["1-5"]]
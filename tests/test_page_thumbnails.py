@@ -0,0 +1,50 @@
+import io
+import os
+from pathlib import Path
+
+from PIL import Image
+
+from private_gpt.components.ingest.page_thumbnails import PageThumbnailCache
+
+
+def page_image(path: Path, color: int) -> Path:
+    # Noise, not to be compressed to a few bytes
+    image = Image.frombytes("L", (400, 500), os.urandom(400 * 500))
+    image.paste(color, (0, 0, 10, 10))
+    image.save(path, format="PNG")
+    return path
+
+
+def test_thumbnails_are_encoded_once(tmp_path: Path) -> None:
+    cache = PageThumbnailCache(tmp_path / "cache", max_size_bytes=10**6, width=100)
+    image_path = page_image(tmp_path / "page.png", 200)
+
+    thumbnail = cache.get(image_path, "hash")
+    image = Image.open(io.BytesIO(thumbnail))
+    assert image.format == cache.extension.upper()
+    assert image.size == (100, 125)
+
+    # Cached: the page image is not read again
+    image_path.unlink()
+    assert cache.get(image_path, "hash") == thumbnail
+    # And kept across restarts
+    cache = PageThumbnailCache(tmp_path / "cache", max_size_bytes=10**6, width=100)
+    assert cache.get(image_path, "hash") == thumbnail
+
+
+def test_least_recently_used_thumbnails_are_evicted(tmp_path: Path) -> None:
+    image_path = page_image(tmp_path / "page.png", 200)
+    size = len(PageThumbnailCache(tmp_path / "size", 10**6, 100).get(image_path, "a"))
+    cache = PageThumbnailCache(tmp_path / "cache", int(size * 2.5), width=100)
+
+    cache.get(image_path, "a")
+    cache.get(image_path, "b")
+    os.utime(cache.cache_dir / cache._name("a"), (0, 0))
+    os.utime(cache.cache_dir / cache._name("b"), (1, 1))
+    cache.get(image_path, "a")  # Used again
+    cache.get(image_path, "c")
+
+    assert cache.size_bytes <= size * 2.5
+    assert sorted(path.name for path in cache.cache_dir.iterdir()) == sorted(
+        [cache._name("a"), cache._name("c")]
+    )
@@ -0,0 +1,126 @@
+import functools
+from pathlib import Path
+from typing import Any
+
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.node_parser import SentenceWindowNodeParser
+from llama_index.core.storage import StorageContext
+
+from private_gpt.components.ingest.embedding_pool import EmbeddingWorkerPool
+from private_gpt.components.ingest.ingest_component import PipelineIngestComponent
+
+
+def test_pipeline_bulk_ingest_parses_files_in_worker_processes(
+    tmp_path: Path,
+) -> None:
+    embed_model = MockEmbedding(embed_dim=4)
+    component = PipelineIngestComponent(
+        StorageContext.from_defaults(),
+        embed_model,
+        [SentenceWindowNodeParser.from_defaults(), embed_model],
+        count_workers=2,
+    )
+    files = []
+    for i in range(5):
+        path = tmp_path / f"file_{i}.txt"
+        path.write_text(f"Check the oil level of engine {i}.")
+        files.append((path.name, path))
+    # Cannot be parsed, skipped without failing the other files
+    (tmp_path / "broken.pdf").write_text("Not a PDF")
+    files.append(("broken.pdf", tmp_path / "broken.pdf"))
+
+    documents = component.bulk_ingest(files)
+
+    assert sorted(document.metadata["file_name"] for document in documents) == [
+        f"file_{i}.txt" for i in range(5)
+    ]
+    ref_docs = component.storage_context.docstore.get_all_ref_doc_info() or {}
+    assert {document.doc_id for document in documents} <= ref_docs.keys()
+    assert component.stage_utilisation.keys() == {"parse", "embed", "write"}
+
+
+def test_pipeline_bulk_ingest_isolates_failed_files(tmp_path: Path) -> None:
+    embed_model = MockEmbedding(embed_dim=4)
+    component = PipelineIngestComponent(
+        StorageContext.from_defaults(),
+        embed_model,
+        [SentenceWindowNodeParser.from_defaults(), embed_model],
+        count_workers=2,
+    )
+    component.RETRY_DELAY = 0
+    insert_nodes = component._index.insert_nodes
+    attempts = []
+
+    def _insert_nodes(nodes: list, **kwargs: Any) -> None:
+        file_name = nodes[0].metadata["file_name"]
+        attempts.append(file_name)
+        # Always failing file, and a file failing once
+        if file_name == "bad.txt" or attempts.count("flaky.txt") == 1:
+            raise ValueError(f"Cannot insert {file_name}")
+        insert_nodes(nodes, **kwargs)
+
+    component._index.insert_nodes = _insert_nodes  # type: ignore[method-assign]
+    files = []
+    for file_name in ["good.txt", "bad.txt", "flaky.txt"]:
+        (tmp_path / file_name).write_text(f"Check the oil level of {file_name}.")
+        files.append((file_name, tmp_path / file_name))
+    (tmp_path / "broken.pdf").write_text("Not a PDF")
+    files.append(("broken.pdf", tmp_path / "broken.pdf"))
+    done: dict[str, bool] = {}
+
+    documents = component.bulk_ingest(
+        files,
+        on_file_done=lambda file_name, _, error: done.update({file_name: not error}),
+    )
+
+    assert sorted(document.metadata["file_name"] for document in documents) == [
+        "flaky.txt",
+        "good.txt",
+    ]
+    assert done == {
+        "good.txt": True,
+        "flaky.txt": True,
+        "bad.txt": False,
+        "broken.pdf": False,
+    }
+    assert attempts.count("bad.txt") == component.MAX_FILE_RETRIES + 1
+    failed_files = {
+        failed_file.file_name: failed_file.stage
+        for failed_file in component.failed_files()
+    }
+    assert failed_files == {"bad.txt": "save", "broken.pdf": "parse"}
+    ref_docs = component.storage_context.docstore.get_all_ref_doc_info() or {}
+    assert {
+        ref_doc_info.metadata["file_name"] for ref_doc_info in ref_docs.values()
+    } == {"flaky.txt", "good.txt"}
+
+
+def test_pipeline_bulk_ingest_embeds_in_worker_processes(tmp_path: Path) -> None:
+    embed_model = MockEmbedding(embed_dim=4)
+    embedding_pool = EmbeddingWorkerPool(
+        functools.partial(MockEmbedding, embed_dim=4), count_workers=2
+    )
+    component = PipelineIngestComponent(
+        StorageContext.from_defaults(),
+        embed_model,
+        [SentenceWindowNodeParser.from_defaults(), embed_model],
+        count_workers=2,
+        embedding_pool=embedding_pool,
+    )
+    files = []
+    for i in range(3):
+        path = tmp_path / f"file_{i}.txt"
+        path.write_text(f"Check the oil level of engine {i}. " * 100)
+        files.append((path.name, path))
+
+    try:
+        documents = component.bulk_ingest(files)
+    finally:
+        embedding_pool.close()
+
+    assert len(documents) == 3
+    node_ids = component.storage_context.docstore.docs.keys()
+    # Embedded by several tasks
+    assert len(node_ids) > embedding_pool.TEXTS_PER_TASK
+    vector_store = component.storage_context.vector_store
+    assert all(vector_store.get(node_id) == [0.5] * 4 for node_id in node_ids)
@@ -0,0 +1,68 @@
+import threading
+from pathlib import Path
+
+import pytest
+from llama_index.core.node_parser import SentenceWindowNodeParser
+
+from private_gpt.components.ingest import worker_count
+from private_gpt.components.ingest.worker_count import WorkerThrottle
+
+
+def test_worker_throttle_calibrates_on_sample_files(tmp_path: Path) -> None:
+    path = tmp_path / "manual.txt"
+    path.write_text("Check the oil level of the engine. " * 1000)
+    throttle = WorkerThrottle(max_workers=4, rss_ceiling=None)
+    throttle.calibrate(
+        [("manual.txt", path)], [SentenceWindowNodeParser.from_defaults()]
+    )
+    # A small file fits the memory of any machine
+    assert throttle.calibrated_workers == throttle.limit == 4
+
+
+def test_worker_throttle_uses_fewer_workers_close_to_the_ceiling(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    rss = [950]
+    monkeypatch.setattr(worker_count, "ingestion_rss", lambda: rss[0])
+    monkeypatch.setattr(worker_count, "ADJUST_INTERVAL", 0)
+    throttle = WorkerThrottle(max_workers=2, rss_ceiling=1000)
+
+    throttle.acquire()
+    assert throttle.limit == 1
+    acquired = threading.Event()
+
+    def _acquire() -> None:
+        throttle.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=_acquire, daemon=True)
+    thread.start()
+    # Blocked until the memory gets back below the ceiling
+    assert not acquired.wait(0.2)
+    rss[0] = 500
+    assert acquired.wait(5)
+    assert throttle.limit == 2
+    thread.join()
+
+
+def test_worker_throttle_fits_the_workers_to_the_available_memory(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = tmp_path / "manual.txt"
+    path.write_text("Check the oil level of the engine. " * 100_000)
+    monkeypatch.setattr(worker_count, "available_memory", lambda: 1)
+    throttle = WorkerThrottle(max_workers=4, rss_ceiling=None)
+    throttle.calibrate([("manual.txt", path)], [])
+    assert throttle.calibrated_workers == throttle.limit == 1
+
+
+def test_embedding_workers_fit_the_cores_and_the_memory(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(worker_count, "count_cores", lambda: 16)
+    monkeypatch.setattr(worker_count, "available_memory", lambda: 3 * 1024**3)
+    # 4 threads per worker by default, a model of 1 GB by default
+    assert worker_count.count_embedding_workers(0, 0) == 3
+    assert worker_count.count_embedding_workers(8, 0) == 2
+    assert worker_count.count_embedding_workers(0, 512) == 4
+    assert worker_count.count_embedding_workers(0, 4096) == 1